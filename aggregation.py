@@ -0,0 +1,277 @@
+"""
+aggregation.py
+
+@author: James Fowkes
+
+Prefix-sum index for fast time-bucketed statistics of a dataset
+"""
+
+import numpy as np
+
+from collections import namedtuple
+
+# pylint's underlying astroid library cannot find numpy functions
+# So disable the warning for the WHOLE MODULE
+# http://stackoverflow.com/questions/20553551/how-do-i-get-pylint-to-recognize-numpy-members
+#pylint: disable=no-member
+
+NS_PER_SECOND = 1000000000
+NS_PER_DAY = 24 * 60 * 60 * NS_PER_SECOND
+
+# Statistics for each averaging period. timestamps are at the middle of each period.
+AggregateResult = namedtuple("AggregateResult", ["timestamps", "mean", "minimum", "maximum", "std", "count"])
+
+def to_ns(value):
+    """ Converts a timestamp (datetime, datetime64, pandas Timestamp or ISO string) to int64 nanoseconds """
+    return np.datetime64(value, 'ns').astype(np.int64)
+
+def time_slice(timestamps, start=None, end=None):
+    """
+    Returns a slice selecting the timestamps between start and end (inclusive) using binary search.
+    Slicing an array with the result returns a view, so no data is copied.
+    Args:
+    timestamps : Sorted timestamps (datetime64 or int64 nanoseconds)
+    start : Earliest timestamp to include (None for no limit)
+    end : Latest timestamp to include (None for no limit)
+    """
+    times = np.asarray(timestamps)
+    if times.dtype.kind == 'M':
+        times = times.astype('datetime64[ns]', copy=False).view(np.int64)
+
+    lower = 0 if start is None else int(np.searchsorted(times, to_ns(start), side='left'))
+    upper = len(times) if end is None else int(np.searchsorted(times, to_ns(end), side='right'))
+
+    return slice(lower, max(lower, upper))
+
+def merged_positions(times, keys):
+    """
+    Returns the number of times before each key (as numpy.searchsorted with side='left' does) in linear time,
+    by merging the two sorted arrays. The keys come first, so a stable sort puts each key before equal times.
+    A stable sort of two sorted runs is a single merge, rather than a binary search for each key.
+    Args:
+    times : Sorted int64 array
+    keys : Sorted int64 array of the values to find
+    """
+    order = np.argsort(np.concatenate((keys, times)), kind='stable')
+    return np.flatnonzero(order < len(keys)) - np.arange(len(keys))
+
+def median_interval_seconds(timestamps):
+    """ Returns the median time between consecutive timestamps in seconds (0 if there are fewer than two) """
+    times = np.asarray(timestamps, dtype='datetime64[ns]').view(np.int64)
+    if len(times) < 2:
+        return 0.0
+    return float(np.median(np.diff(times))) / NS_PER_SECOND
+
+def find_gaps(timestamps, threshold_seconds):
+    """
+    Returns the positions of gaps in sorted timestamps as an int array.
+    A position i means the time from sample i to sample i+1 is longer than the threshold.
+    Args:
+    timestamps : Sorted timestamps (datetime64 or int64 nanoseconds)
+    threshold_seconds : Intervals longer than this are gaps
+    """
+    times = np.asarray(timestamps)
+    if times.dtype.kind == 'M':
+        times = times.astype('datetime64[ns]', copy=False).view(np.int64)
+
+    return np.flatnonzero(np.diff(times) > threshold_seconds * NS_PER_SECOND)
+
+def gaps_in_slice(gaps, rows):
+    """
+    Returns gap positions relative to the start of a slice of the data,
+    keeping only gaps where both neighbouring samples are in the slice
+    Args:
+    gaps : Gap positions from find_gaps
+    rows : Slice (with explicit start and stop) of the data
+    """
+    lower = np.searchsorted(gaps, rows.start, side='left')
+    upper = np.searchsorted(gaps, rows.stop - 1, side='left')
+    return gaps[lower:upper] - rows.start
+
+def nearest_matches(times_a, times_b, tolerance_seconds):
+    """
+    Pairs each timestamp in times_a with the nearest timestamp in times_b (an as-of/nearest join).
+    Returns (positions_a, positions_b) int arrays of the matched pairs. Timestamps in times_a with
+    no timestamp in times_b within the tolerance are left out. Where two timestamps in times_b
+    are equally near, the earlier one is used.
+    Args:
+    times_a : Sorted timestamps (datetime64) to find matches for
+    times_b : Sorted timestamps (datetime64) to match against
+    tolerance_seconds : Largest time difference of a matched pair
+    """
+    times_a = np.asarray(times_a, dtype='datetime64[ns]').view(np.int64)
+    times_b = np.asarray(times_b, dtype='datetime64[ns]').view(np.int64)
+
+    if len(times_a) == 0 or len(times_b) == 0:
+        return (np.zeros(0, dtype=np.intp), np.zeros(0, dtype=np.intp))
+
+    after = np.minimum(np.searchsorted(times_b, times_a, side='left'), len(times_b) - 1)
+    before = np.maximum(after - 1, 0)
+
+    before_distance = np.abs(times_a - times_b[before])
+    after_distance = np.abs(times_b[after] - times_a)
+    nearest = np.where(before_distance <= after_distance, before, after)
+    distance = np.minimum(before_distance, after_distance)
+
+    matched = distance <= tolerance_seconds * NS_PER_SECOND
+    return (np.flatnonzero(matched), nearest[matched])
+
+def _empty_result():
+    """ Returns an AggregateResult with no periods """
+    return AggregateResult(
+        np.zeros(0, dtype='datetime64[ns]'), np.zeros(0), np.zeros(0), np.zeros(0), np.zeros(0),
+        np.zeros(0, dtype=np.int64))
+
+class AggregationIndex:
+
+    """
+    Stores cumulative sums, sums of squares and counts of a dataset over its (sorted) time index.
+
+    The sum of any run of samples is then the difference of two cumulative sums, so the
+    statistics for a time bucket only need two binary searches to find the bucket edges.
+    Averaging therefore costs time proportional to the number of output buckets rather than
+    the number of raw samples.
+
+    Minimum and maximum cannot be taken from prefix sums, so they are found with a single
+    reduction over the samples in the (non-empty) buckets.
+
+    The same cumulative arrays give centred rolling (moving window) statistics: each window
+    is also a difference of two cumulative sums, found by merging the window edges with the samples.
+
+    NaN values are not counted (as with pandas resampling).
+    """
+
+    def __init__(self, timestamps, values):
+        """
+        Args:
+        timestamps : Sorted timestamps of the data (anything convertible to datetime64)
+        values : Numeric data values, one per timestamp
+        """
+
+        self.times = np.asarray(timestamps, dtype='datetime64[ns]').view(np.int64)
+
+        values = np.asarray(values, dtype=np.float64)
+        valid = ~np.isnan(values)
+        self.values = values
+
+        # Sums of squares are prone to cancellation when the values have a large offset
+        # (e.g. battery voltages around 12V), so accumulate relative to the mean.
+        self.offset = float(np.mean(values[valid])) if valid.any() else 0.0
+        shifted = np.where(valid, values - self.offset, 0.0)
+
+        # Each cumulative array has a leading zero, so entry i is the total of the first i samples
+        self.cum_count = np.concatenate(([0], np.cumsum(valid, dtype=np.int64)))
+        self.cum_sum = np.concatenate(([0.0], np.cumsum(shifted)))
+        self.cum_sum_sq = np.concatenate(([0.0], np.cumsum(shifted * shifted)))
+
+    def bucket_edges(self, width_seconds, rows=slice(None)):
+        """
+        Returns the edges (as int64 nanoseconds) of buckets of the requested width covering the data.
+        As with pandas resampling, buckets are aligned to midnight of the first day of data.
+        Args:
+        width_seconds : The width of each bucket
+        rows : Slice of the data to cover (default all)
+        """
+        times = self.times[rows]
+        width = int(round(width_seconds * NS_PER_SECOND))
+        if width <= 0 or len(times) == 0:
+            return np.zeros(0, dtype=np.int64)
+
+        first = times[0]
+        day_start = first - (first % NS_PER_DAY)
+        start = day_start + ((first - day_start) // width) * width
+
+        bucket_count = (times[-1] - start) // width + 1
+        return start + np.arange(bucket_count + 1, dtype=np.int64) * width
+
+    def aggregate(self, width_seconds, start=None, end=None):
+        """
+        Returns an AggregateResult of mean, minimum, maximum, std and count for buckets of the requested width.
+        Timestamps are datetime64 values at the middle of each bucket.
+        Empty buckets have NaN statistics. std uses one degree of freedom (as pandas does).
+        Args:
+        width_seconds : The width of each bucket
+        start : Earliest timestamp to include (None for no limit)
+        end : Latest timestamp to include (None for no limit)
+        """
+        rows = time_slice(self.times, start, end)
+        edges = self.bucket_edges(width_seconds, rows)
+        if len(edges) < 2:
+            return _empty_result()
+
+        # Buckets at the ends of the range must not include samples from outside it
+        positions = np.clip(np.searchsorted(self.times, edges, side='left'), rows.start, rows.stop)
+
+        count = np.diff(self.cum_count[positions])
+        sums = np.diff(self.cum_sum[positions])
+        sums_sq = np.diff(self.cum_sum_sq[positions])
+
+        with np.errstate(divide='ignore', invalid='ignore'):
+            mean = np.where(count > 0, sums / count, np.nan) + self.offset
+            variance = (sums_sq - sums * sums / count) / (count - 1)
+            std = np.where(count > 1, np.sqrt(np.maximum(variance, 0.0)), np.nan)
+
+        (minimum, maximum) = self._extremes(positions)
+
+        centres = (edges[:-1] + np.diff(edges) // 2).view('datetime64[ns]')
+
+        return AggregateResult(centres, mean, minimum, maximum, std, count)
+
+    def rolling(self, window_seconds, start=None, end=None):
+        """
+        Returns an AggregateResult of mean, std and count over a time window centred on each sample.
+        The window runs from half the window length before a sample to half after it, so irregularly
+        sampled data is handled correctly. The cost is linear in the number of samples in the range (and
+        within half a window of it), whatever the window length and however much data there is outside the range.
+        Rolling minimum and maximum are not available (returned as None).
+        Args:
+        window_seconds : The length of the moving window
+        start : Earliest sample to include (None for no limit)
+        end : Latest sample to include (None for no limit)
+        """
+        half_width = int(round(window_seconds * NS_PER_SECOND / 2))
+        times = self.times[time_slice(self.times, start, end)]
+
+        # Only samples within half a window of the range can be in a window. Those before it are before every
+        # window edge, so are counted by lower rather than merged.
+        (lower, upper) = (0, 0)
+        if len(times) > 0:
+            lower = int(np.searchsorted(self.times, times[0] - half_width, side='left'))
+            upper = int(np.searchsorted(self.times, times[-1] + half_width, side='left'))
+        nearby = self.times[lower:upper]
+
+        # The window edges are sorted like the samples, so they are found by merging rather than searching
+        starts = lower + merged_positions(nearby, times - half_width)
+        ends = lower + merged_positions(nearby, times + half_width)
+
+        count = self.cum_count[ends] - self.cum_count[starts]
+        sums = self.cum_sum[ends] - self.cum_sum[starts]
+        sums_sq = self.cum_sum_sq[ends] - self.cum_sum_sq[starts]
+
+        with np.errstate(divide='ignore', invalid='ignore'):
+            mean = np.where(count > 0, sums / count, np.nan) + self.offset
+            variance = (sums_sq - sums * sums / count) / (count - 1)
+            std = np.where(count > 1, np.sqrt(np.maximum(variance, 0.0)), np.nan)
+
+        return AggregateResult(times.view('datetime64[ns]'), mean, None, None, std, count)
+
+    def _extremes(self, positions):
+        """
+        Returns (minimum, maximum) arrays for the buckets between positions.
+        reduceat runs each reduction from one start position to the next, so only the starts
+        of buckets that contain samples are used (empty buckets would otherwise return a sample).
+        fmin/fmax ignore NaN, so buckets that only contain NaN stay NaN.
+        """
+        bucket_count = len(positions) - 1
+        minimum = np.full(bucket_count, np.nan)
+        maximum = np.full(bucket_count, np.nan)
+
+        occupied = np.diff(positions) > 0
+        if occupied.any():
+            starts = positions[:-1][occupied]
+            # Samples after the last edge do not exist, so the final reduction ends at the last bucket
+            values = self.values[:positions[-1]]
+            minimum[occupied] = np.fmin.reduceat(values, starts)
+            maximum[occupied] = np.fmax.reduceat(values, starts)
+
+        return (minimum, maximum)
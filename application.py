@@ -6,20 +6,55 @@ application.py
 Entry file for the CSV viewer application
 """
 
+from instrumentation import STARTUP
+
+import os
+import sys
+import json
 import argparse
 import logging
 import configparser
 import codecs
+import importlib
+import threading
+import multiprocessing
 
-from datamanager import DataManager
-from gui import GUI, ask_directory, run_gui, show_info_dialog
-from plotter import Plotter, WindPlotter, Histogram
+from gui import GUI, ask_directory, ask_string, ask_save_filename, ask_yes_no, run_gui, show_info_dialog
+from plotter import Plotter, WindPlotter, Histogram, windrose_table, histogram_table
+from jobs import JobExecutor
+from session import Session
+from field_summary import summarise_fields, format_summary, DEFAULT_PERCENTILES
+from messages import ProgressMessage, PartialResultMessage, ErrorMessage, CompleteMessage, LoadStatisticsMessage
 
 import queue
-import threading
+
+from datetime import datetime
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
 
 from app_info import VERSION, TITLE
 
+def get_data_manager_class():
+    """ Returns the DataManager class.
+    datamanager (and pandas, which it uses) is slow to import, so it is imported when a folder is first
+    opened, if preload_modules has not already imported it """
+    from datamanager import DataManager
+    return DataManager
+
+def preload_modules():
+    """ Imports modules that are slow to import but not needed to show the main window,
+    so that they are ready by the time the user opens a folder. Runs on a background thread.
+    The matplotlib Tk backend is left to the Tk thread (it is imported when data is first plotted),
+    and windrose is imported when a windrose is first plotted. """
+
+    get_data_manager_class()
+    STARTUP.mark("pandas and data manager imported (background)")
+
+    importlib.import_module("matplotlib.figure")
+    STARTUP.mark("matplotlib imported (background)")
+
+    STARTUP.log_report()
+
 def get_arg_parser():
     """ Return a command line argument parser for this module """
     arg_parser = argparse.ArgumentParser(
@@ -29,13 +64,186 @@ def get_arg_parser():
         '--start_folder', dest='start_folder', default=None,
         help="The folder to look for CSVs in")
 
+    # Summary statistics from the command line, without the GUI
+    arg_parser.add_argument(
+        '--stats', dest='stats', nargs='+', default=None, metavar='FOLDER',
+        help="Print summary statistics of the data in each folder instead of starting the GUI")
+    arg_parser.add_argument(
+        '--fields', dest='fields', default=None,
+        help="Comma separated field names to summarise with --stats (default all)")
+    arg_parser.add_argument(
+        '--start', dest='start', default=None, help="Earliest time to summarise with --stats (e.g. 2015-06-01)")
+    arg_parser.add_argument(
+        '--end', dest='end', default=None, help="Latest time to summarise with --stats (e.g. 2015-06-30 23:59)")
+    arg_parser.add_argument(
+        '--percentiles', dest='percentiles', default=None,
+        help="Comma separated percentiles to include with --stats (default %s)" % (
+            ",".join("%g" % percentile for percentile in DEFAULT_PERCENTILES)))
+    arg_parser.add_argument(
+        '--json', dest='json', action='store_true', help="Print --stats results as JSON instead of tables")
+    arg_parser.add_argument(
+        '--workers', dest='workers', type=int, default=None,
+        help="Number of folders summarised at once with --stats (default one per CPU)")
+
     return arg_parser
 
+# How often (in milliseconds) messages from the data manager are handled while loading
+QUEUE_PUMP_INTERVAL_MS = 100
+
+# Default time between checks for new data when following (can be changed in config.ini)
+DEFAULT_FOLLOW_INTERVAL_SECONDS = 10
+
+# File types offered when exporting data
+EXPORT_FILETYPES = [
+    ("Parquet", "*.parquet"), ("Feather", "*.feather"), ("HDF5", "*.h5"), ("NumPy archive", "*.npz")]
+
+# Multipliers to convert averaging time units to seconds
+TIME_MULTIPLIERS = {"Seconds":1, "Minutes":60, "Hours":60*60, "Days":24*60*60, "Weeks":7*24*60*60}
+
+# Accepted formats for the time range entries (most specific first)
+TIME_FORMATS = ("%Y-%m-%d %H:%M:%S", "%Y-%m-%d %H:%M", "%Y-%m-%d")
+
+def parse_time(text):
+    """ Returns a datetime from a time range entry, or None if the entry is blank.
+    Raises ValueError if the text is not in one of TIME_FORMATS
+    Args:
+    text: The text to parse
+    """
+    text = text.strip()
+    if text == "":
+        return None
+
+    for time_format in TIME_FORMATS:
+        try:
+            return datetime.strptime(text, time_format)
+        except ValueError:
+            pass
+
+    raise ValueError("Could not parse time '%s'" % text)
+
+def format_time(timestamp):
+    """ Returns text for a time range entry from a numpy datetime64 timestamp """
+    return timestamp.astype('datetime64[s]').item().strftime(TIME_FORMATS[0])
+
 def get_module_logger():
 
     """ Returns logger for this module """
     return logging.getLogger(__name__)
 
+def summarise_folder(folder, config, time_range, fields, percentiles):
+    #pylint: disable=too-many-arguments
+    """
+    Loads a folder (on this thread) and returns the summary statistics of its numeric datasets
+    (see field_summary.summarise_fields). Raises the exception that stopped the load if it fails.
+    Args:
+    folder : The folder to load
+    config : configparser object (the archive is used if it is enabled)
+    time_range : (start, end) to load
+    fields : Field names to load (None for all)
+    percentiles : Percentiles to include
+    """
+    data_manager_class = get_data_manager_class()
+    if not data_manager_class.directory_has_data_files(folder, config):
+        raise IOError("No CSV files found in '%s'" % folder)
+
+    msg_queue = queue.Queue()
+    data_manager = data_manager_class(msg_queue, folder, config, time_range, fields)
+    data_manager.run()
+
+    for msg in list(msg_queue.queue):
+        if isinstance(msg, ErrorMessage):
+            raise msg.exception
+
+    return summarise_fields(data_manager, percentiles)
+
+def _json_value(value):
+    """ Returns a statistic as a JSON value (null for NaN, which JSON does not have) """
+    return None if value != value else value #pylint: disable=comparison-with-itself
+
+def run_stats(args, config, arg_parser):
+    """
+    Prints summary statistics of the folders given with --stats, as tables or JSON.
+    Each folder is loaded by its own process (up to --workers at once). No Tk window is created.
+    Returns the exit status: 0, or 1 if any folder could not be loaded.
+    Args:
+    args : Parsed command line arguments
+    config : configparser object
+    arg_parser : The command line argument parser (for reporting invalid arguments)
+    """
+    try:
+        time_range = (parse_time(args.start or ""), parse_time(args.end or ""))
+        percentiles = DEFAULT_PERCENTILES
+        if args.percentiles is not None:
+            percentiles = tuple(float(percentile) for percentile in args.percentiles.split(","))
+    except ValueError as exc:
+        arg_parser.error(str(exc))
+
+    if any(percentile < 0 or percentile > 100 for percentile in percentiles):
+        arg_parser.error("Percentiles must be between 0 and 100")
+
+    fields = None
+    if args.fields is not None:
+        fields = [field.strip() for field in args.fields.split(",") if field.strip()]
+
+    # Nothing is shown until the load completes, so there is no point building partial results
+    config.set('DATA', 'PartialUpdateSeconds', '0')
+
+    folders = args.stats
+    workers = args.workers or min(len(folders), os.cpu_count() or 1)
+
+    results = OrderedDict()
+    if workers > 1:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            loads = [
+                (folder, pool.submit(summarise_folder, folder, config, time_range, fields, percentiles))
+                for folder in folders]
+            for (folder, load) in loads:
+                try:
+                    results[folder] = load.result()
+                except Exception as exc: #pylint: disable=broad-except
+                    results[folder] = exc
+    else:
+        for folder in folders:
+            try:
+                results[folder] = summarise_folder(folder, config, time_range, fields, percentiles)
+            except Exception as exc: #pylint: disable=broad-except
+                results[folder] = exc
+
+    failed = [folder for (folder, result) in results.items() if isinstance(result, Exception)]
+    for folder in failed:
+        get_module_logger().error("Could not load '%s' (%s)", folder, results[folder])
+
+    if args.json:
+        print(json.dumps(OrderedDict(
+            (folder, {"error": str(result)} if folder in failed else OrderedDict(
+                (name, OrderedDict((statistic, _json_value(value)) for (statistic, value) in summary.items()))
+                for (name, summary) in result.items()))
+            for (folder, result) in results.items()), indent=2))
+    else:
+        print("\n\n".join(
+            "%s\n  Could not load (%s)" % (folder, result) if folder in failed else format_summary(folder, result)
+            for (folder, result) in results.items()))
+
+    return 1 if len(failed) > 0 else 0
+
+class FolderLoad: #pylint: disable=too-few-public-methods
+
+    """ A folder being loaded (by its own DataManager thread) as a site of a session """
+
+    def __init__(self, site, loader, msg_queue, session):
+        """
+        Args:
+        site : Name of the site the folder will be shown as
+        loader : The DataManager loading the folder
+        msg_queue : Queue of messages from the loader
+        session : The session the site will be added to once it has data to show
+        """
+        self.site = site
+        self.loader = loader
+        self.msg_queue = msg_queue
+        self.session = session
+        self.percent = 0
+
 #pylint: disable=too-many-instance-attributes
 # Accept this warning, as application is not likely to grow
 # beyond current # of attributes on the short term. Refactoring
@@ -62,12 +270,33 @@ class Application:
         self.windplotter = WindPlotter(config)
         self.histogram = Histogram(config)
 
-        self.msg_queue = None
-        self.loading_timer = None
-        self.data_manager = None
+        self.queue_pump_id = None
+
+        # session has the displayed data (from one or more sites). loads are the folders still loading.
+        # A new session only replaces the displayed one once it has data to show,
+        # so cancelling a load leaves the previous data on screen.
+        self.session = None
+        self.loads = []
+
+        # (session, displayed fields, time range, time range text) shown before a session that is still loading
+        # replaced it with partial data. Restored if that loading is cancelled.
+        self.previous_view = None
+
+        # Timing report of the loads of the displayed (or loading) session's folders, by folder
+        self.load_statistics = OrderedDict()
+
+        # Scheduled check for new data (None if not following), and whether a check is running
+        self.follow_id = None
+        self.checking_for_new_data = False
+
+        # (start, end) of the data to display. None means no limit.
+        self.time_range = (None, None)
 
         self.gui = GUI(self)
 
+        # Averaging, histograms and windroses are computed on worker threads
+        self.jobs = JobExecutor(self.gui, config)
+
     def action_about_dialog(self): # pylint: disable=no-self-use
         """
         Show information about this program
@@ -118,12 +347,47 @@ class Application:
         self.plotter.set_visibility(subplot_index, display_name != "None")
         self.gui.set_displayed_field(display_name, subplot_index)
 
-        self.gui.set_dataset_choices(self.data_manager.get_numeric_display_names())
+        self.gui.set_dataset_choices(self.session.get_numeric_display_names())
 
         if display_name != "None":
-            self.plotter.set_dataset(
-                self.data_manager.get_timestamps(display_name), self.data_manager.get_dataset(display_name),
-                display_name, subplot_index)
+            self.set_raw_dataset(display_name, subplot_index)
+
+        self.gui.draw(self.plotter)
+
+    def action_apply_time_range(self):
+        """ Handles request to only show data within the entered time range """
+
+        (start_text, end_text) = self.gui.get_time_range_text()
+        try:
+            time_range = (parse_time(start_text), parse_time(end_text))
+        except ValueError:
+            show_info_dialog("Times should be entered as YYYY-MM-DD HH:MM:SS (or YYYY-MM-DD HH:MM, or YYYY-MM-DD)")
+            return
+
+        get_module_logger().info("Showing data from %s to %s", *time_range)
+
+        self.time_range = time_range
+        self.refresh_subplots()
+
+    def action_reset_time_range(self):
+        """ Handles request to show the full time range of the data """
+
+        self.time_range = (None, None)
+        self.show_full_time_range()
+        self.refresh_subplots()
+
+    def show_full_time_range(self):
+        """ Fills in the time range entries with the first and last timestamps of the data """
+        (first, last) = self.session.get_time_span()
+        if first is not None:
+            self.gui.set_time_range_text(format_time(first), format_time(last))
+
+    def refresh_subplots(self):
+        """ Re-fetches raw data for the displayed subplots (e.g. when the time range changes) and redraws """
+
+        for (subplot_index, display_name) in enumerate(self.gui.get_displayed_fields()):
+            if display_name is not None and display_name != "None":
+                self.set_raw_dataset(display_name, subplot_index)
 
         self.gui.draw(self.plotter)
 
@@ -148,17 +412,91 @@ class Application:
 
         get_module_logger().info("Averaging %s over %d %s", display_name, time_period, time_units.lower())
 
-        time_multipliers = {"Seconds":1, "Minutes":60, "Hours":60*60, "Days":24*60*60, "Weeks":7*24*60*60}
+        time_period_seconds = time_period * TIME_MULTIPLIERS[time_units]
 
-        time_period_seconds = time_period * time_multipliers[time_units]
+        index = self.gui.get_index_of_displayed_plot(display_name)
+
+        # Everything the computation needs is read now, as the worker thread must not use the GUI
+        session = self.session
+        time_range = self.time_range
+        moving = self.gui.get_averaging_mode() == "Moving"
+        show_envelope = self.gui.get_averaging_show_envelope()
+
+        def compute_member(member_name):
+            """ Returns (timestamps, mean, envelope, gaps) of the averaged data of one site """
+            if moving:
+                # Centred moving average, one point per sample
+                statistics = session.get_dataset_rolling(member_name, time_period_seconds, *time_range)
+            else:
+                # Mean, min and max of fixed periods all come from one pass over the data
+                statistics = session.get_dataset_statistics(member_name, time_period_seconds, *time_range)
+
+            envelope = None
+            if show_envelope:
+                if statistics.minimum is not None:
+                    envelope = (statistics.minimum, statistics.maximum)
+                else:
+                    # No min/max for moving averages, so show the spread instead
+                    envelope = (statistics.mean - statistics.std, statistics.mean + statistics.std)
+
+            # Empty periods are NaN so already break the line, but moving averages have a point per sample
+            gaps = session.get_gaps(member_name, *time_range) if moving else None
+
+            return (statistics.timestamps, statistics.mean, envelope, gaps)
+
+        def compute():
+            """ Returns [(site, (timestamps, mean, envelope, gaps))] of the averaged data of each site shown """
+            return [(site, compute_member(member_name)) for (site, member_name) in session.members(display_name)]
+
+        def show(results):
+            """ Plots the averaged data """
+            if len(session) == 1:
+                (_, (timestamps, mean, envelope, gaps)) = results[0]
+                self.plotter.set_dataset(timestamps, mean, display_name, index, envelope, gaps)
+            else:
+                self.plotter.set_overlay(
+                    [(site,) + averaged for (site, averaged) in results], session.channel_name(display_name), index)
+            self.gui.draw(self.plotter)
 
-        (data, timestamps) = self.data_manager.get_dataset_average(display_name, time_period_seconds)
+        self.jobs.submit(("Subplot", index), "Main", compute, show, self.show_job_error)
 
-        index = self.gui.get_index_of_displayed_plot(display_name)
+    def action_export(self):
 
-        self.plotter.set_dataset(timestamps, data, display_name, index)
+        """ Handles request to export the loaded data (in the displayed time range) to a file.
+        If an averaging period is entered, the user can choose to export the averaged data instead. """
 
-        self.gui.draw(self.plotter)
+        if self.session is None:
+            return
+
+        path = ask_save_filename("Export data", EXPORT_FILETYPES)
+        if path == '':
+            return # Cancelled
+
+        average_time_seconds = None
+        try:
+            time_period = self.gui.get_averaging_time_period()
+            if time_period > 0 and ask_yes_no("Export averages over %s %s?" % (
+                    time_period, self.gui.get_averaging_time_units().lower())):
+                average_time_seconds = time_period * TIME_MULTIPLIERS[self.gui.get_averaging_time_units()]
+        except ValueError:
+            pass # No averaging period entered, so export raw data
+
+        (session, time_range) = (self.session, self.time_range)
+
+        def export():
+            """ Writes the file """
+            session.export(path, average_time_seconds=average_time_seconds, start=time_range[0], end=time_range[1])
+
+        def exported(_):
+            """ Reports that the export has finished """
+            show_info_dialog("Data exported to '%s'" % path)
+
+        self.jobs.submit('Export', 'Main', export, exported, self.show_job_error)
+
+    def show_job_error(self, exc): #pylint: disable=no-self-use
+        """ Reports a failed background computation """
+        get_module_logger().error("Computation failed (%s)", exc)
+        show_info_dialog("Could not process data (%s)" % exc)
 
     def reset_average_data(self):
 
@@ -169,50 +507,338 @@ class Application:
 
         get_module_logger().info("Resetting dataset %s on subplot %d", display_name, subplot_index)
 
-        self.plotter.set_dataset(
-            self.data_manager.get_timestamps(display_name), self.data_manager.get_dataset(display_name),
-            display_name, subplot_index)
+        self.set_raw_dataset(display_name, subplot_index)
 
         self.gui.draw(self.plotter)
 
+    def set_raw_dataset(self, display_name, subplot_index):
+        """ Sets a subplot to show the (unaveraged) data for a dataset in the current time range
+        Args:
+        display_name : The display name of the dataset
+        subplot_index : The index of the subplot (0 to 2)
+        """
+        # Any averaging still being computed for this subplot is now out of date
+        self.jobs.discard(("Subplot", subplot_index))
+
+        if len(self.session) == 1:
+            self.plotter.set_dataset(
+                self.session.get_timestamps(display_name, *self.time_range),
+                self.session.get_dataset(display_name, *self.time_range),
+                display_name, subplot_index,
+                gaps=self.session.get_gaps(display_name, *self.time_range))
+            return
+
+        # With several sites, each line is labelled with its site (several for channels overlaid from all sites).
+        # The data are views of each site's arrays, so nothing is copied to put them on the same axes.
+        self.plotter.set_overlay([
+            (site,
+             self.session.get_timestamps(member_name, *self.time_range),
+             self.session.get_dataset(member_name, *self.time_range),
+             None,
+             self.session.get_gaps(member_name, *self.time_range))
+            for (site, member_name) in self.session.members(display_name)],
+            self.session.channel_name(display_name), subplot_index)
+
     def action_new_data(self):
 
         """ Handles request to show open a new set of CSV files """
 
         new_directory = ask_directory("Choose directory to process")
 
-        if new_directory != '' and DataManager.directory_has_data_files(new_directory):
-            get_module_logger().info("Parsing directory %s", new_directory)
-            self.gui.reset_and_show_progress_bar(new_directory)
+        if new_directory != '' and get_data_manager_class().directory_has_data_files(new_directory, self.config):
+            self.start_loading(new_directory)
+
+    def action_add_site(self):
+
+        """ Handles request to load another folder (site) alongside the displayed data, for comparison """
+
+        new_directory = ask_directory("Choose site directory to add")
+
+        if new_directory != '' and get_data_manager_class().directory_has_data_files(new_directory, self.config):
+            self.start_loading(new_directory, add_site=True)
 
-            self.msg_queue = queue.Queue()
-            self.data_manager = DataManager(self.msg_queue, new_directory)
-            self.data_manager.start()
+    def action_new_data_range(self):
 
-            self.loading_timer = threading.Timer(0.1, self.check_data_manager_status)
-            self.loading_timer.start()
+        """ Handles request to open only the CSV files in a folder that cover a date range """
 
-    def check_data_manager_status(self):
+        new_directory = ask_directory("Choose directory to process")
+
+        if new_directory == '' or not get_data_manager_class().directory_has_data_files(new_directory, self.config):
+            return
+
+        start_text = ask_string("Open Date Range", "Load data from (YYYY-MM-DD, blank for no limit):")
+        if start_text is None:
+            return # Cancelled
 
-        """ When the data manager is loading new data, updates the progress bar """
+        end_text = ask_string("Open Date Range", "Load data to (YYYY-MM-DD, blank for no limit):")
+        if end_text is None:
+            return # Cancelled
 
-        dataloader_finished = False
         try:
-            msg = self.msg_queue.get(0)
-            if msg == 100:
-                dataloader_finished = True
-                self.gui.hide_progress_bar()
+            time_range = (parse_time(start_text), parse_time(end_text))
+        except ValueError:
+            show_info_dialog("Times should be entered as YYYY-MM-DD HH:MM:SS (or YYYY-MM-DD HH:MM, or YYYY-MM-DD)")
+            return
+
+        self.start_loading(new_directory, time_range)
+
+    def start_loading(self, directory, time_range=(None, None), add_site=False):
+
+        """ Starts a data manager loading a folder of CSV files.
+        Several folders can load at once (each on its own thread) when sites are added.
+        Args:
+        directory : The folder to load
+        time_range : Optional (start, end) of data to load
+        add_site : If True, the folder is added as another site of the displayed session (or of the
+            session still loading), otherwise it replaces the displayed data
+        """
+
+        loading_sessions = [load.session for load in self.loads if load.session is not self.session]
+
+        if add_site and len(loading_sessions) > 0:
+            session = loading_sessions[0]
+        elif add_site and self.session is not None:
+            session = self.session
+        else:
+            # Opening a folder supersedes any load still in progress
+            self.cancel_loading()
+            session = Session(self.config)
+            self.load_statistics = OrderedDict()
+
+        site = session.unique_site_name(directory, [load.site for load in self.loads if load.session is session])
+
+        get_module_logger().info("Parsing directory %s (site '%s')", directory, site)
+
+        # Each load gets its own queue, so messages from a cancelled load can never be mistaken for another one's
+        msg_queue = queue.Queue()
+        loader = get_data_manager_class()(msg_queue, directory, self.config, time_range)
+        self.loads.append(FolderLoad(site, loader, msg_queue, session))
+        loader.start()
+
+        self.gui.reset_and_show_progress_bar(
+            "', '".join(load.loader.folder for load in self.loads), self.cancel_loading)
+
+        if self.queue_pump_id is None:
+            self.queue_pump_id = self.gui.schedule(QUEUE_PUMP_INTERVAL_MS, self.pump_data_manager_queue)
+
+    def cancel_loading(self):
+
+        """ Cancels the loads in progress (if any). The previously loaded data stays displayed.
+        If data from a cancelled load was already shown, the view from before the load is restored
+        (or, if there is none, the user is told that only part of the data is shown). """
+
+        if len(self.loads) == 0:
+            return
+
+        partial_loads = [
+            load for load in self.loads if load.session is self.session and self.session.is_loaded(load.loader)]
+
+        for load in self.loads:
+            get_module_logger().info("Cancelling load from %s", load.loader.folder)
+            load.loader.cancel()
+
+        self.loads = []
+
+        if self.queue_pump_id is not None:
+            self.gui.cancel_scheduled(self.queue_pump_id)
+            self.queue_pump_id = None
+
+        self.gui.hide_progress_bar()
+
+        if len(partial_loads) > 0:
+            self.handle_cancelled_partial_loads(partial_loads)
+        self.previous_view = None
+
+    def handle_cancelled_partial_loads(self, partial_loads):
+
+        """ Stops data from cancelled loads being mistaken for complete data
+        Args:
+        partial_loads : The cancelled FolderLoads whose data was already shown
+        """
+
+        if self.previous_view is None:
+            show_info_dialog("Loading was cancelled, so only part of the data from '%s' is shown" %
+                             "', '".join(load.loader.folder for load in partial_loads))
+            return
+
+        (self.session, displayed_fields, self.time_range, time_range_text) = self.previous_view
+
+        self.plotter.clear_data()
+        self.plotter.suspend_draw(True)
+
+        for (subplot_index, display_name) in enumerate(displayed_fields):
+            self.action_subplot_change(subplot_index, "None" if display_name is None else display_name)
+
+        self.gui.set_time_range_text(*time_range_text)
+        self.plotter.suspend_draw(False)
+        self.gui.draw(self.plotter)
+
+    def pump_data_manager_queue(self):
+
+        """ Handles all messages waiting from the data managers.
+        This runs on the Tk thread (scheduled with GUI.schedule), so it is safe to update the GUI here.
+        Keeps rescheduling itself until all loads complete or fail. """
+
+        self.queue_pump_id = None
+
+        for load in list(self.loads):
+            # A load can be cancelled (e.g. by another folder being opened) while a dialog is shown
+            if load in self.loads:
+                self.pump_load_queue(load)
+
+        if len(self.loads) == 0:
+            self.previous_view = None
+            self.gui.hide_progress_bar()
+            return
+
+        self.gui.set_progress_percent(sum(load.percent for load in self.loads) / len(self.loads))
+
+        if self.queue_pump_id is None:
+            self.queue_pump_id = self.gui.schedule(QUEUE_PUMP_INTERVAL_MS, self.pump_data_manager_queue)
+
+    def pump_load_queue(self, load):
+
+        """ Handles all messages waiting from the data manager of one load
+        Args:
+        load : The FolderLoad
+        """
+
+        while True:
+            try:
+                msg = load.msg_queue.get_nowait()
+            except queue.Empty:
+                return
+
+            if isinstance(msg, ProgressMessage):
+                # Only the latest progress needs showing
+                load.percent = msg.percent
+            elif isinstance(msg, PartialResultMessage):
+                load.percent = msg.percent
+                self.handle_partial_result(load)
+            elif isinstance(msg, LoadStatisticsMessage):
+                self.load_statistics[msg.folder] = msg.report
+            elif isinstance(msg, ErrorMessage):
+                self.loads.remove(load)
+                show_info_dialog("Could not load data from '%s' (%s)" % (load.loader.folder, msg.exception))
+                return
+            elif isinstance(msg, CompleteMessage):
+                self.loads.remove(load)
+                self.show_loaded_data(load)
+                return
+
+    def handle_partial_result(self, load):
+
+        """ Shows data that is available while the rest is still loading
+        Args:
+        load : The FolderLoad that has data to show
+        """
+
+        self.show_loaded_data(load)
+
+    def show_loaded_data(self, load):
+
+        """ Shows the data loaded so far (or all of it, once loading is complete).
+        The first time data from a load is shown, its site is added to its session. The first site of a new
+        session replaces the displayed data and the default datasets are plotted.
+        Otherwise the displayed plots are refreshed with the new data, keeping any zoom the user has applied.
+        Args:
+        load : The FolderLoad that has data to show
+        """
+
+        session = load.session
+        if not session.is_loaded(load.loader):
+            session.set_site(load.site, load.loader)
+
+            if session is not self.session:
+                if self.session is not None and any(other.session is session for other in self.loads):
+                    # Keep the displayed view, in case the rest of the loading is cancelled
+                    self.previous_view = (
+                        self.session, self.gui.get_displayed_fields(), self.time_range, self.gui.get_time_range_text())
+                self.session = session
                 self.plot_default_datasets()
-            else:
-                self.gui.set_progress_percent(msg)
-        except queue.Empty:
-            pass
-        except:
-            raise
+                return
+
+            # Names of displayed datasets gain a site prefix once there is more than one site
+            for (subplot_index, display_name) in enumerate(self.gui.get_displayed_fields()):
+                if display_name is not None and display_name != "None":
+                    self.gui.set_displayed_field(session.qualified_name(display_name), subplot_index)
+
+        self.show_new_data()
+
+    def show_new_data(self):
+
+        """ Refreshes the displayed plots after data has been added, keeping any zoom the user has applied """
+
+        self.gui.set_dataset_choices(self.session.get_numeric_display_names())
+        if self.time_range == (None, None):
+            self.show_full_time_range()
+
+        self.plotter.preserve_view(True)
+        self.refresh_subplots()
+        self.plotter.preserve_view(False)
+
+    def action_load_statistics(self):
+
+        """ Handles request to show how long each stage of loading the data took (and how much memory it used) """
+
+        if len(self.load_statistics) == 0:
+            show_info_dialog("No data has been loaded yet")
+            return
+
+        self.gui.show_text_window("Load Statistics", "Load Statistics", "\n\n".join(self.load_statistics.values()))
+
+    def action_follow(self):
+
+        """ Handles the follow new data checkbox. While following, the loaded files are regularly
+        checked for new rows (e.g. from a logger still writing to them), which are added to the plots. """
+
+        if self.gui.get_follow():
+            if self.follow_id is None and not self.checking_for_new_data:
+                self.schedule_follow()
+        elif self.follow_id is not None:
+            self.gui.cancel_scheduled(self.follow_id)
+            self.follow_id = None
+
+    def schedule_follow(self):
+
+        """ Schedules the next check for new data """
+
+        interval = DEFAULT_FOLLOW_INTERVAL_SECONDS
+        if self.config is not None:
+            interval = self.config.getfloat('FOLLOW', 'IntervalSeconds', fallback=DEFAULT_FOLLOW_INTERVAL_SECONDS)
+
+        self.follow_id = self.gui.schedule(int(interval * 1000), self.check_for_new_data)
+
+    def check_for_new_data(self):
+
+        """ Reads any new data on a worker thread (files may be on a slow network share) """
+
+        self.follow_id = None
 
-        if not dataloader_finished:
-            self.loading_timer = threading.Timer(0.1, self.check_data_manager_status)
-            self.loading_timer.start()
+        if self.session is None or len(self.loads) > 0:
+            # Nothing to follow yet, or a folder is loading
+            self.schedule_follow()
+            return
+
+        session = self.session
+        self.checking_for_new_data = True
+
+        def show(new_rows):
+            """ Shows new rows (if the session is still the displayed one) and schedules the next check """
+            self.checking_for_new_data = False
+            if new_rows > 0 and session is self.session:
+                self.show_new_data()
+            if self.gui.get_follow():
+                self.schedule_follow()
+
+        def failed(exc):
+            """ Logs the failure (e.g. the network share was unavailable) and tries again later """
+            self.checking_for_new_data = False
+            get_module_logger().info("Could not read new data (%s)", exc)
+            if self.gui.get_follow():
+                self.schedule_follow()
+
+        self.jobs.submit('Follow', None, session.read_new_data, show, failed)
 
     def action_special_option(self):
 
@@ -226,35 +852,60 @@ class Application:
             get_module_logger().info("Plotting windrose")
             self.gui.add_new_window('Windrose', (7, 6))
 
-            # Get the wind direction and speed data
-            speed = self.data_manager.get_dataset('Wind Speed')
-            direction = self.data_manager.get_dataset('Direction')
+            (session, time_range) = (self.session, self.time_range)
 
-            self.windplotter.set_data(speed, direction)
+            # The wind data of the site the selected dataset is from
+            selected = self.gui.get_selected_dataset_name()
+            (direction_name, speed_name) = (
+                session.sibling_name(selected, 'Direction'), session.sibling_name(selected, 'Wind Speed'))
 
-            # Add window and axes to the GUI
-            try:
-                self.gui.draw(self.windplotter, 'Windrose')
-            except Exception as exc: #pylint: disable=broad-except
-                get_module_logger().info("Could not plot windrose (%s)", exc)
-                show_info_dialog(
-                    "Could not plot windrose - check that the windspeed and direction data are valid")
+            def compute_windrose():
+                """ Returns the windrose table for the wind data in the time range """
+                # Get the wind direction and speed data, paired by time.
+                # Each direction reading is paired with the speed over the interval ending at that reading.
+                (_, direction, speed) = session.get_aligned(direction_name, speed_name, *time_range)
+                return windrose_table(speed, direction)
+
+            self.jobs.submit('Windrose', 'Windrose', compute_windrose, self.show_windrose, self.show_windrose_error)
 
         elif action == "Histogram":
             get_module_logger().info("Plotting histogram")
             self.gui.add_new_window('Histogram', (7, 6))
 
-            # Get the windspeed data
-            speed = self.data_manager.get_dataset('Wind Speed')
+            (session, time_range) = (self.session, self.time_range)
+            speed_name = session.sibling_name(self.gui.get_selected_dataset_name(), 'Wind Speed')
+
+            def compute_histogram():
+                """ Returns the histogram table for the windspeed data in the time range """
+                return histogram_table(session.get_dataset(speed_name, *time_range))
+
+            self.jobs.submit('Histogram', 'Histogram', compute_histogram, self.show_histogram, self.show_job_error)
+
+    def show_windrose(self, table):
+        """ Draws a windrose from a table computed by windrose_table """
+        self.windplotter.set_table(table)
+
+        # Add window and axes to the GUI
+        try:
+            self.gui.draw(self.windplotter, 'Windrose')
+        except Exception as exc: #pylint: disable=broad-except
+            self.show_windrose_error(exc)
+
+    def show_windrose_error(self, exc): #pylint: disable=no-self-use
+        """ Reports that the windrose could not be computed or drawn """
+        get_module_logger().info("Could not plot windrose (%s)", exc)
+        show_info_dialog("Could not plot windrose - check that the windspeed and direction data are valid")
 
-            self.histogram.set_data(speed)
+    def show_histogram(self, table):
+        """ Draws a histogram from a table computed by histogram_table """
+        self.histogram.set_table(table)
 
-            # Add window and axes to the GUI
-            self.gui.draw(self.histogram, 'Histogram')
+        # Add window and axes to the GUI
+        self.gui.draw(self.histogram, 'Histogram')
 
     def get_special_dataset_options(self, dataset):
-        """ Callback fron other modules to get the special dataset names (via data manager) """
-        return self.data_manager.get_special_dataset_options(dataset)
+        """ Callback fron other modules to get the special dataset names (via the session) """
+        return self.session.get_special_dataset_options(dataset)
 
     def plot_default_datasets(self):
 
@@ -262,6 +913,10 @@ class Application:
 
         self.plotter.clear_data()
 
+        # New data is always shown in full to begin with
+        self.time_range = (None, None)
+        self.show_full_time_range()
+
         # Get the default fields from config
         default_fields = self.config['DEFAULT']['DefaultFields']
         default_fields = [field.strip() for field in default_fields.split(",")]
@@ -270,15 +925,15 @@ class Application:
         self.plotter.suspend_draw(True)
 
         field_count = 0
-        numeric_fields = self.data_manager.get_numeric_field_names()
+        numeric_fields = self.session.get_numeric_field_names()
         for field in default_fields:
             if field in numeric_fields:
-                display_name = self.data_manager.get_display_name(field)
+                display_name = self.session.get_display_name(field)
                 self.action_subplot_change(field_count, display_name)
                 field_count += 1
 
         # Now the plots can be drawn
-        self.gui.set_dataset_choices(self.data_manager.get_numeric_display_names())
+        self.gui.set_dataset_choices(self.session.get_numeric_display_names())
         self.plotter.suspend_draw(False)
         self.gui.draw(self.plotter)
 
@@ -286,23 +941,46 @@ def main():
 
     """ Application start """
 
-    logging.basicConfig(level=logging.INFO)
-
-    get_module_logger().setLevel(logging.INFO)
+    STARTUP.mark("Modules imported")
 
     arg_parser = get_arg_parser()
     args = arg_parser.parse_args()
 
     conf_parser = configparser.RawConfigParser()
     conf_parser.read_file(codecs.open("config.ini", "r", "utf8"))
+    STARTUP.mark("Configuration read")
+
+    if args.stats is not None:
+        # Only warnings and errors are logged, so the output can be piped to other programs
+        logging.basicConfig(level=logging.WARNING)
+        sys.exit(run_stats(args, conf_parser, arg_parser))
+
+    logging.basicConfig(level=logging.INFO)
+
+    get_module_logger().setLevel(logging.INFO)
 
     # The call to run() does not return.
     # All events are handled via GUI handlers and application callbacks.
 
-    _ = Application(args, conf_parser)
+    application = Application(args, conf_parser)
+    STARTUP.mark("GUI created")
+
+    def window_shown():
+        """ Reports startup time, then imports the remaining slow modules without holding up the GUI """
+        STARTUP.mark("Main window shown")
+        STARTUP.log_report()
+        threading.Thread(target=preload_modules, daemon=True).start()
+
+    application.gui.schedule(0, window_shown)
 
     run_gui()
 
+    # Don't start any computations that are still queued
+    application.jobs.shutdown()
+
 if __name__ == "__main__":
+    # --stats loads folders in worker processes. In the frozen release, each worker runs this executable,
+    # and freeze_support runs the worker's task instead of main.
+    multiprocessing.freeze_support()
     main()
 
@@ -0,0 +1,236 @@
+"""
+archive.py
+
+@author: James Fowkes
+
+SQLite archive of logger data, so that data only has to be parsed from CSV files once
+"""
+
+import logging
+import sqlite3
+
+import numpy as np
+import pandas as pd
+
+from aggregation import to_ns
+
+# Default archive filename (in the data folder) if no path is set in config.ini
+ARCHIVE_FILENAME = ".csvviewer_archive.sqlite"
+
+# Prefix of the table holding each logger's data
+DATA_TABLE_PREFIX = "data_"
+
+# Version of the archive's tables. Archives written with other versions are emptied and rebuilt from the files.
+ARCHIVE_VERSION = 2
+
+def get_module_logger():
+
+    """ Returns logger for this module """
+    return logging.getLogger(__name__)
+
+def _quote(identifier):
+    """ Returns an SQL identifier (table or column name) quoted for use in a statement """
+    return '"%s"' % identifier.replace('"', '""')
+
+def _column_values(values):
+    """ Returns a list of the values of a column as Python objects for sqlite3 (missing values as None) """
+    values = np.asarray(values)
+    if values.dtype.kind == 'f':
+        return np.where(np.isnan(values), None, values).tolist()
+    if values.dtype.kind in 'iub':
+        return values.tolist()
+    return [None if pd.isnull(value) else value for value in values.tolist()]
+
+class ArchiveStore:
+
+    """
+    Stores rows parsed from CSV files in an SQLite database, with one table per logger.
+    Each table has an int64 nanosecond timestamp column (which is indexed), the source file of each
+    row, and a column for each CSV column.
+
+    Source files are recorded with the folder they were loaded from, so one archive can hold the data of
+    many folders (including folders with the same name in different places) without mixing them.
+
+    Ingesting is incremental and idempotent: each source file is recorded with its size and modification
+    time. Ingesting a file that has changed replaces the rows from it, and files that have not
+    changed do not need to be parsed again.
+
+    The database is used in WAL mode, so it can be read while it is being written to.
+    Each ArchiveStore must only be used on the thread that created it.
+    """
+
+    def __init__(self, path):
+        """
+        Args:
+        path : Path of the database file (created if it does not exist)
+        """
+        self.path = path
+        self.connection = sqlite3.connect(path)
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        # Still safe with WAL (a power cut can lose the last ingest, but not corrupt the archive)
+        self.connection.execute("PRAGMA synchronous=NORMAL")
+
+        with self.connection:
+            version = self.connection.execute("PRAGMA user_version").fetchone()[0]
+            if version != ARCHIVE_VERSION:
+                self._drop_tables()
+                self.connection.execute("PRAGMA user_version = %d" % ARCHIVE_VERSION)
+
+            self.connection.execute(
+                "CREATE TABLE IF NOT EXISTS sources ("
+                "id INTEGER PRIMARY KEY, folder TEXT NOT NULL, logger TEXT NOT NULL, filename TEXT NOT NULL, "
+                "size INTEGER NOT NULL, mtime REAL NOT NULL, rows INTEGER NOT NULL, UNIQUE (folder, filename))")
+
+    def _drop_tables(self):
+        """ Removes all tables (e.g. those of an archive written by an earlier version) """
+        tables = [
+            row[0] for row in self.connection.execute("SELECT name FROM sqlite_master WHERE type = 'table'")]
+        if len(tables) > 0:
+            get_module_logger().info("Rebuilding archive '%s' (written by an earlier version)", self.path)
+        for table in tables:
+            self.connection.execute("DROP TABLE %s" % _quote(table))
+
+    def close(self):
+        """ Closes the database """
+        self.connection.close()
+
+    def loggers(self, folder):
+        """ Returns the names of the loggers with data from a folder
+        Args:
+        folder : Key of the folder (see ingest)
+        """
+        return [row[0] for row in self.connection.execute(
+            "SELECT DISTINCT logger FROM sources WHERE folder = ? ORDER BY logger", (folder,))]
+
+    def is_current(self, folder, filename, size, mtime):
+        """ Returns True if a file has been ingested and has not changed since
+        Args:
+        folder : Key of the folder the file is in (see ingest)
+        filename : Name of the source file (relative to the folder)
+        size : Current size of the file
+        mtime : Current modification time of the file
+        """
+        row = self.connection.execute(
+            "SELECT size, mtime FROM sources WHERE folder = ? AND filename = ?", (folder, filename)).fetchone()
+        return row is not None and row[0] == size and row[1] == mtime
+
+    def _table_columns(self, table):
+        """ Returns the column names of a table (an empty list if it does not exist) """
+        return [row[1] for row in self.connection.execute("PRAGMA table_info(%s)" % _quote(table))]
+
+    def columns(self, logger):
+        """ Returns the names of the data columns stored for a logger, in the order they were added """
+        return [
+            name for name in self._table_columns(DATA_TABLE_PREFIX + logger) if name not in ("timestamp", "source")]
+
+    def _prepare_table(self, logger, column_names):
+        """ Creates the data table for a logger (or adds columns it is missing). Returns the table name. """
+        table = DATA_TABLE_PREFIX + logger
+        existing = self._table_columns(table)
+
+        if len(existing) == 0:
+            self.connection.execute(
+                "CREATE TABLE %s (timestamp INTEGER NOT NULL, source INTEGER NOT NULL)" % _quote(table))
+            self.connection.execute(
+                "CREATE INDEX %s ON %s (timestamp)" % (_quote(table + "_timestamp"), _quote(table)))
+            self.connection.execute(
+                "CREATE INDEX %s ON %s (source)" % (_quote(table + "_source"), _quote(table)))
+            existing = ["timestamp", "source"]
+
+        # Columns have no declared type, so values keep the types they had in the dataframe
+        for column_name in column_names:
+            if column_name not in existing:
+                self.connection.execute("ALTER TABLE %s ADD COLUMN %s" % (_quote(table), _quote(column_name)))
+
+        return table
+
+    def ingest(self, folder, logger, filename, size, mtime, frame):
+        #pylint: disable=too-many-arguments
+        """
+        Stores the rows of a parsed file, replacing any rows previously ingested from it,
+        in a single transaction (with a bulk insert).
+        Args:
+        folder : Key of the folder the file is in (e.g. its absolute path), which identifies it in the archive
+        logger : Name of the logger the file is from
+        filename : Name of the source file (relative to the folder)
+        size : Size of the file when it was read
+        mtime : Modification time of the file when it was read
+        frame : Dataframe of the file (indexed by timestamp), or None if it has no rows
+        """
+        rows = 0 if frame is None else len(frame)
+
+        with self.connection:
+            previous = self.connection.execute(
+                "SELECT id, logger FROM sources WHERE folder = ? AND filename = ?", (folder, filename)).fetchone()
+            if previous is None:
+                source = self.connection.execute(
+                    "INSERT INTO sources (folder, logger, filename, size, mtime, rows) VALUES (?, ?, ?, ?, ?, ?)",
+                    (folder, logger, filename, size, mtime, rows)).lastrowid
+            else:
+                source = previous[0]
+                self.connection.execute(
+                    "UPDATE sources SET logger = ?, size = ?, mtime = ?, rows = ? WHERE id = ?",
+                    (logger, size, mtime, rows, source))
+
+                previous_table = DATA_TABLE_PREFIX + previous[1]
+                if len(self._table_columns(previous_table)) > 0:
+                    self.connection.execute("DELETE FROM %s WHERE source = ?" % _quote(previous_table), (source,))
+
+            if rows == 0:
+                return
+
+            column_names = [str(name).strip() for name in frame.columns]
+            table = self._prepare_table(logger, column_names)
+
+            columns = [frame.index.values.astype('datetime64[ns]').view(np.int64).tolist(), [source] * rows]
+            columns.extend(_column_values(frame[name].values) for name in frame.columns)
+
+            self.connection.executemany(
+                "INSERT INTO %s (timestamp, source, %s) VALUES (%s)" % (
+                    _quote(table), ", ".join(_quote(name) for name in column_names),
+                    ", ".join("?" * (len(column_names) + 2))),
+                zip(*columns))
+
+        get_module_logger().info("Archived %d rows of '%s' in '%s'", rows, filename, folder)
+
+    def query(self, folder, logger, fields=None, start=None, end=None):
+        #pylint: disable=too-many-arguments
+        """
+        Returns a dataframe of a logger's data from a folder between start and end (inclusive),
+        indexed by timestamp and sorted by time, or None if there is none. Only the requested fields are read.
+        Args:
+        folder : Key of the folder (see ingest)
+        logger : Name of the logger
+        fields : The column names to read (None for all columns)
+        start : Earliest timestamp to read (None for no limit)
+        end : Latest timestamp to read (None for no limit)
+        """
+        table = DATA_TABLE_PREFIX + logger
+        existing = self._table_columns(table)
+        if len(existing) == 0:
+            return None
+
+        data_columns = [name for name in existing if name not in ("timestamp", "source")]
+        if fields is not None:
+            data_columns = [name for name in data_columns if name in fields]
+
+        # Only rows from the folder's own files (another folder may have a logger with the same name)
+        conditions = ["source IN (SELECT id FROM sources WHERE folder = ?)"]
+        parameters = [folder]
+        if start is not None:
+            conditions.append("timestamp >= ?")
+            parameters.append(int(to_ns(start)))
+        if end is not None:
+            conditions.append("timestamp <= ?")
+            parameters.append(int(to_ns(end)))
+
+        sql = "SELECT %s FROM %s%s ORDER BY timestamp" % (
+            ", ".join(_quote(name) for name in ["timestamp"] + data_columns), _quote(table),
+            " WHERE " + " AND ".join(conditions))
+
+        frame = pd.read_sql_query(sql, self.connection, params=parameters)
+        if len(frame) == 0:
+            return None
+
+        frame.index = pd.DatetimeIndex(frame.pop("timestamp").values.astype('datetime64[ns]'))
+        return frame
@@ -0,0 +1,8 @@
+"""
+benchmarks
+
+@author: James Fowkes
+
+Performance benchmarks for the CSV viewer, using generated logger data.
+Run from the CSVviewer folder with "python -m benchmarks.run" (see run.py for options).
+"""
@@ -0,0 +1,129 @@
+"""
+generate.py
+
+@author: James Fowkes
+
+Generates folders of synthetic logger CSV files for benchmarking.
+Can also be run on its own, e.g. "python -m benchmarks.generate data_folder --files 30 --rows 2880"
+"""
+
+import os
+import argparse
+
+import numpy as np
+import pandas as pd
+
+# Cardinal points written to the Direction column ('D' is written by loggers when the vane is disconnected)
+DIRECTIONS = np.array(['N', 'NE', 'E', 'SE', 'S', 'SW', 'W', 'NW'])
+DISCONNECTED_DIRECTION = 'D'
+
+# Fraction of direction readings written as DISCONNECTED_DIRECTION
+DISCONNECTED_FRACTION = 0.01
+
+# Columns written to every file (after the Ref, Date and Time columns)
+STANDARD_COLUMNS = ["Wind Pulses", "Direction", "Temperature", "Battery Voltage", "Humidity"]
+
+def _logger_frame(rng, times, extra_columns):
+    """ Returns a dataframe of plausible readings at the given times
+    Args:
+    rng : numpy random Generator
+    times : datetime64 array of reading times
+    extra_columns : Number of additional numeric columns
+    """
+    rows = len(times)
+    hours = (times - times[0]) / np.timedelta64(1, 'h')
+
+    # Gusty wind that slowly picks up and dies down, so pulse counts vary realistically
+    wind_strength = 8 + 6 * np.sin(hours / 17.0) + rng.normal(0, 1, rows).cumsum() / np.sqrt(rows)
+    pulses = rng.poisson(np.clip(wind_strength, 0.5, None))
+
+    # Wind direction wanders, rather than jumping around at random
+    sectors = (np.cumsum(rng.integers(-1, 2, rows)) + rng.integers(0, 8)) % len(DIRECTIONS)
+    directions = DIRECTIONS[sectors].astype(object)
+    directions[rng.random(rows) < DISCONNECTED_FRACTION] = DISCONNECTED_DIRECTION
+
+    # Daily temperature and humidity cycles, battery charging in the day and discharging at night
+    day_phase = 2 * np.pi * (hours % 24) / 24
+    temperature = 12 - 6 * np.cos(day_phase) + rng.normal(0, 0.3, rows)
+    humidity = np.clip(0.7 + 0.2 * np.cos(day_phase) + rng.normal(0, 0.02, rows), 0, 1)
+    battery = 12.4 + 0.6 * np.clip(-np.cos(day_phase), 0, None) + rng.normal(0, 0.02, rows)
+
+    frame = pd.DataFrame({
+        "Wind Pulses": pulses,
+        "Direction": directions,
+        "Temperature": temperature.round(2),
+        "Battery Voltage": battery.round(3),
+        "Humidity": humidity.round(3)}, columns=STANDARD_COLUMNS)
+
+    for index in range(extra_columns):
+        frame["Channel %d" % (index + 1)] = rng.normal(100, 10, rows).round(3)
+
+    return frame
+
+def generate_logger_folder(
+        folder, file_count=10, rows_per_file=2880, extra_columns=0,
+        date_format="%d/%m/%Y", interval_seconds=30, start="2015-01-01", seed=0):
+    #pylint: disable=too-many-arguments
+    """
+    Writes a folder of CSV files like those written by the loggers: one file per period of
+    rows_per_file readings, with Ref, Date and Time columns followed by Wind Pulses, Direction,
+    Temperature, Battery Voltage and Humidity (and any extra numeric columns).
+    The same arguments always generate the same data. Returns the paths of the files written.
+    Args:
+    folder : The folder to write to (created if it does not exist)
+    file_count : Number of files
+    rows_per_file : Number of readings in each file
+    extra_columns : Number of additional numeric columns ("Channel 1", "Channel 2"...)
+    date_format : strftime format of the Date column (dates must be day first, or year first)
+    interval_seconds : Time between readings
+    start : Time of the first reading
+    seed : Random seed
+    """
+    os.makedirs(folder, exist_ok=True)
+    rng = np.random.default_rng(seed)
+
+    interval = np.timedelta64(int(interval_seconds), 's')
+    first = np.datetime64(start, 's')
+
+    paths = []
+    for file_index in range(file_count):
+        times = first + interval * (file_index * rows_per_file + np.arange(rows_per_file))
+        frame = _logger_frame(rng, times, extra_columns)
+
+        timestamps = pd.Series(pd.DatetimeIndex(times))
+        frame.insert(0, "Time", timestamps.dt.strftime("%H:%M:%S").values)
+        frame.insert(0, "Date", timestamps.dt.strftime(date_format).values)
+        frame.insert(0, "Ref", np.arange(rows_per_file))
+
+        path = os.path.join(folder, "%08d.csv" % file_index)
+        # Loggers write a space after each comma in the header
+        with open(path, "w", newline="") as csv_file:
+            csv_file.write(", ".join(frame.columns) + "\n")
+            frame.to_csv(csv_file, header=False, index=False)
+        paths.append(path)
+
+    return paths
+
+def get_arg_parser():
+    """ Return a command line argument parser for this module """
+    arg_parser = argparse.ArgumentParser(description='Generate synthetic logger CSV files')
+
+    arg_parser.add_argument('folder', help="The folder to write the files to")
+    arg_parser.add_argument('--files', type=int, default=10, help="Number of files")
+    arg_parser.add_argument('--rows', type=int, default=2880, help="Rows in each file")
+    arg_parser.add_argument('--extra_columns', type=int, default=0, help="Additional numeric columns")
+    arg_parser.add_argument('--date_format', default="%d/%m/%Y", help="strftime format of the Date column")
+    arg_parser.add_argument('--interval', type=float, default=30, help="Seconds between readings")
+    arg_parser.add_argument('--seed', type=int, default=0, help="Random seed")
+
+    return arg_parser
+
+def main():
+    """ Generates a folder from the command line arguments """
+    args = get_arg_parser().parse_args()
+    paths = generate_logger_folder(
+        args.folder, args.files, args.rows, args.extra_columns, args.date_format, args.interval, seed=args.seed)
+    print("Wrote %d files to '%s'" % (len(paths), args.folder))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,292 @@
+"""
+run.py
+
+@author: James Fowkes
+
+Times the slow parts of the CSV viewer on generated logger data and writes the results to JSON.
+Run from the CSVviewer folder, e.g.
+    python -m benchmarks.run --files 30 --rows 2880 --output results-2.6.json
+    python -m benchmarks.run --compare results-2.6.json
+Comparing with an earlier results file reports the change in each timing, and exits with status 1
+if anything is slower by more than the allowed ratio.
+"""
+
+import os
+import sys
+import json
+import queue
+import codecs
+import configparser
+import shutil
+import argparse
+import platform
+import tempfile
+import time
+
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+
+# The benchmarks time the application's own modules, which live in the folder above this package
+APP_FOLDER = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, APP_FOLDER)
+
+#pylint: disable=wrong-import-position
+import matplotlib
+matplotlib.use("Agg")
+from matplotlib.figure import Figure
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+
+from app_info import VERSION
+from datamanager import DataManager, get_csv_filenames
+from messages import ErrorMessage
+from data_files import is_compressed
+from plotter import Plotter, WINDROSE_BIN_COUNT, WINDROSE_SECTORS
+from tail import TailReader
+from benchmarks.generate import generate_logger_folder
+#pylint: enable=wrong-import-position
+
+# Default number of times each benchmark is run (the fastest run is reported)
+DEFAULT_REPEATS = 3
+
+# Averaging periods benchmarked (seconds)
+AVERAGE_PERIODS = {"hour": 60 * 60, "day": 24 * 60 * 60}
+
+# Datasets averaged (one on the shared time index, one with its own index)
+AVERAGED_DATASETS = ["Temperature", "Wind Speed"]
+
+# Datasets plotted on the three subplots
+PLOTTED_DATASETS = ["Wind Speed", "Temperature", "Battery Voltage"]
+
+# A timing more than this many times the previous one is reported as a regression
+DEFAULT_REGRESSION_RATIO = 1.2
+
+# ...unless it is slower by less than this (timings of very quick operations are mostly noise)
+MIN_REGRESSION_SECONDS = 0.001
+
+def read_config():
+    """ Returns the application's config.ini (so benchmarks use the same settings as the application).
+    Partial updates are turned off, so every run of the load benchmark does the same work. """
+    config = configparser.RawConfigParser()
+    config.read_file(codecs.open(os.path.join(APP_FOLDER, "config.ini"), "r", "utf8"))
+    config.set('DATA', 'PartialUpdateSeconds', '0')
+    return config
+
+def time_call(function, repeats, setup=None):
+    """
+    Returns {"best_seconds", "mean_seconds", "repeats"} for calls of a function
+    Args:
+    function : Function (taking no arguments) to time
+    repeats : Number of times to call it
+    setup : Optional function called (untimed) before each call
+    """
+    timings = []
+    for _ in range(repeats):
+        if setup is not None:
+            setup()
+        start = time.perf_counter()
+        function()
+        timings.append(time.perf_counter() - start)
+
+    return {"best_seconds": min(timings), "mean_seconds": sum(timings) / len(timings), "repeats": repeats}
+
+def load_folder(folder, config):
+    """ Loads a folder with a DataManager (on this thread) and returns it.
+    Raises the exception that stopped the load if it fails (so a failed load is not timed as a fast one). """
+    msg_queue = queue.Queue()
+    manager = DataManager(msg_queue, folder, config)
+    manager.run()
+
+    for msg in list(msg_queue.queue):
+        if isinstance(msg, ErrorMessage):
+            raise msg.exception
+
+    return manager
+
+def read_raw_frame(folder):
+    """ Returns the unconverted data of the (uncompressed) CSV files in a folder,
+    parsed in the same way as the data manager parses them """
+    frames = [
+        TailReader(os.path.join(folder, filename)).read_frame()
+        for filename in get_csv_filenames(folder) if not is_compressed(filename)]
+    frame = pd.concat(frames)
+    frame.rename(columns=lambda name: name.strip(), inplace=True)
+    return frame
+
+def benchmark_special_fields(manager, raw, repeats):
+    """ Returns timings of each special field conversion on the raw data """
+    results = {}
+    timestamps = raw.index.values
+    for (field_name, special_field) in manager.special_fields.items():
+        values = raw[field_name].values
+        results["convert_%s" % field_name] = time_call(
+            lambda field=special_field, data=values: field.convert(timestamps, data), repeats)
+    return results
+
+def benchmark_averaging(manager, repeats):
+    """ Returns timings of averaging datasets (with the average cache cleared before each run) """
+    results = {}
+    for display_name in AVERAGED_DATASETS:
+        for (period_name, seconds) in AVERAGE_PERIODS.items():
+            results["average_%s_%s" % (display_name, period_name)] = time_call(
+                lambda name=display_name, period=seconds: manager.get_dataset_average(name, period),
+                repeats, setup=manager.clear_average_cache)
+    return results
+
+def benchmark_plotting(manager, config, repeats):
+    """ Returns timings of drawing the three subplots (including rendering with the Agg backend) """
+    plotter = Plotter(config)
+    for (index, display_name) in enumerate(PLOTTED_DATASETS):
+        plotter.set_visibility(index, True)
+        plotter.set_dataset(
+            manager.get_timestamps(display_name), manager.get_dataset(display_name),
+            display_name, index, gaps=manager.get_gaps(display_name))
+
+    figure = Figure(figsize=(8, 5))
+    canvas = FigureCanvasAgg(figure)
+
+    def draw():
+        """ Draws and renders the plots """
+        plotter.draw(figure)
+        canvas.draw()
+
+    return {"plotter_draw": time_call(draw, repeats)}
+
+def benchmark_windrose(manager, repeats):
+    """ Returns timings of computing the windrose histogram """
+    import windrose
+
+    (_, direction, speed) = manager.get_aligned('Direction', 'Wind Speed')
+    bins = np.linspace(np.min(speed), np.max(speed), WINDROSE_BIN_COUNT)
+
+    return {"windrose_histogram": time_call(
+        lambda: windrose.histogram(direction, speed, bins, WINDROSE_SECTORS, normed=True), repeats)}
+
+def run_benchmarks(folder, repeats=DEFAULT_REPEATS):
+    """
+    Runs all the benchmarks on a folder of logger data. Returns {benchmark name: timings}.
+    A benchmark that fails is recorded with its error instead of timings, so the others still run
+    (and the run then exits with an error).
+    Args:
+    folder : The folder of CSV files
+    repeats : Number of times each benchmark is run
+    """
+    config = read_config()
+
+    # Nothing else can run if the folder cannot be loaded, so a failed load stops the benchmarks
+    results = {"load_folder": time_call(lambda: load_folder(folder, config), repeats)}
+    manager = load_folder(folder, config)
+
+    benchmarks = [
+        lambda: benchmark_special_fields(manager, read_raw_frame(folder), repeats),
+        lambda: benchmark_averaging(manager, repeats),
+        lambda: benchmark_plotting(manager, config, repeats),
+        lambda: benchmark_windrose(manager, repeats),
+    ]
+
+    for (benchmark, name) in zip(benchmarks, ["special_fields", "averaging", "plotting", "windrose"]):
+        try:
+            results.update(benchmark())
+        except Exception as exc: #pylint: disable=broad-except
+            results[name] = {"error": "%s: %s" % (type(exc).__name__, exc)}
+
+    return results
+
+def compare_results(results, previous, regression_ratio):
+    """
+    Returns (report lines, list of regressed benchmark names) comparing results with earlier results
+    Args:
+    results : The new benchmark results
+    previous : Results read from an earlier results file
+    regression_ratio : A best time more than this many times the earlier one is a regression
+        (if it is also more than MIN_REGRESSION_SECONDS slower)
+    """
+    (lines, regressions) = ([], [])
+    for (name, timing) in sorted(results.items()):
+        old_timing = previous.get(name, {})
+        if "best_seconds" not in timing or "best_seconds" not in old_timing:
+            continue
+
+        ratio = timing["best_seconds"] / max(old_timing["best_seconds"], 1e-9)
+        regressed = ratio > regression_ratio and (
+            timing["best_seconds"] - old_timing["best_seconds"] > MIN_REGRESSION_SECONDS)
+        lines.append("%-40s %9.4fs -> %9.4fs (x%.2f)%s" % (
+            name, old_timing["best_seconds"], timing["best_seconds"], ratio, "  REGRESSION" if regressed else ""))
+        if regressed:
+            regressions.append(name)
+
+    return (lines, regressions)
+
+def get_arg_parser():
+    """ Return a command line argument parser for this module """
+    arg_parser = argparse.ArgumentParser(description='Benchmark the CSV viewer on generated logger data')
+
+    arg_parser.add_argument('--files', type=int, default=10, help="Number of generated files")
+    arg_parser.add_argument('--rows', type=int, default=2880, help="Rows in each generated file")
+    arg_parser.add_argument('--extra_columns', type=int, default=0, help="Additional numeric columns")
+    arg_parser.add_argument('--date_format', default="%d/%m/%Y", help="strftime format of the Date column")
+    arg_parser.add_argument('--repeats', type=int, default=DEFAULT_REPEATS, help="Runs of each benchmark")
+    arg_parser.add_argument(
+        '--folder', default=None, help="Benchmark an existing folder of CSV files instead of generating one")
+    arg_parser.add_argument('--output', default=None, help="File to write the JSON results to")
+    arg_parser.add_argument('--compare', default=None, help="Earlier JSON results file to compare with")
+    arg_parser.add_argument(
+        '--regression_ratio', type=float, default=DEFAULT_REGRESSION_RATIO,
+        help="Slow-down (compared with --compare) reported as a regression")
+
+    return arg_parser
+
+def main():
+    """ Runs the benchmarks from the command line arguments """
+    args = get_arg_parser().parse_args()
+
+    folder = args.folder
+    if folder is None:
+        folder = tempfile.mkdtemp(prefix="csvviewer_benchmark_")
+        generate_logger_folder(folder, args.files, args.rows, args.extra_columns, args.date_format)
+
+    try:
+        results = run_benchmarks(folder, args.repeats)
+    finally:
+        if args.folder is None:
+            shutil.rmtree(folder, ignore_errors=True)
+
+    report = {
+        "version": VERSION,
+        "time": datetime.now().isoformat(),
+        "platform": platform.platform(),
+        "python": platform.python_version(),
+        "numpy": np.__version__,
+        "pandas": pd.__version__,
+        "matplotlib": matplotlib.__version__,
+        "dataset": {"folder": args.folder} if args.folder is not None else {
+            "files": args.files, "rows_per_file": args.rows,
+            "extra_columns": args.extra_columns, "date_format": args.date_format},
+        "results": results,
+    }
+
+    text = json.dumps(report, indent=2, sort_keys=True)
+    if args.output is None:
+        print(text)
+    else:
+        with open(args.output, "w") as output_file:
+            output_file.write(text)
+
+    # Failed benchmarks are kept in the results, but must not pass unnoticed
+    failed = sorted(name for (name, result) in results.items() if "error" in result)
+    for name in failed:
+        print("Benchmark '%s' failed (%s)" % (name, results[name]["error"]), file=sys.stderr)
+
+    regressions = []
+    if args.compare is not None:
+        with open(args.compare, "r") as previous_file:
+            previous = json.load(previous_file)["results"]
+        (lines, regressions) = compare_results(results, previous, args.regression_ratio)
+        print("\n".join(lines))
+
+    if len(failed) > 0 or len(regressions) > 0:
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
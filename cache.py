@@ -0,0 +1,94 @@
+"""
+cache.py
+
+@author: James Fowkes
+
+Defines a size-limited least-recently-used cache for computed datasets
+"""
+
+import threading
+
+from collections import OrderedDict
+
+class LRUCache:
+
+    """
+    A dictionary-like cache with a memory budget.
+    When the total size of the cached values exceeds the budget, the least recently used
+    entries are evicted until it fits again.
+
+    The cache is thread-safe, as it is accessed both by the data manager thread and by the GUI.
+    """
+
+    def __init__(self, max_bytes, sizeof):
+        """
+        Args:
+        max_bytes : The memory budget for the cache (0 disables caching)
+        sizeof : Function that returns the (approximate) size in bytes of a cached value
+        """
+        self.max_bytes = max_bytes
+        self.sizeof = sizeof
+
+        self._entries = OrderedDict()
+        self._sizes = {}
+        self._total_bytes = 0
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        """ Returns the value for key (marking it as most recently used) or None if not cached
+        Args:
+        key : The key to look up
+        """
+        with self._lock:
+            try:
+                self._entries.move_to_end(key)
+                return self._entries[key]
+            except KeyError:
+                return None
+
+    def put(self, key, value):
+        """ Adds a value to the cache, evicting least recently used entries if required.
+        Values larger than the whole budget are not cached.
+        Args:
+        key : The key to store the value under
+        value : The value to store
+        """
+        size = self.sizeof(value)
+
+        with self._lock:
+            self._remove(key)
+
+            if size > self.max_bytes:
+                return
+
+            self._entries[key] = value
+            self._sizes[key] = size
+            self._total_bytes += size
+
+            while self._total_bytes > self.max_bytes:
+                oldest_key = next(iter(self._entries))
+                self._remove(oldest_key)
+
+    def clear(self):
+        """ Removes all entries from the cache """
+        with self._lock:
+            self._entries.clear()
+            self._sizes.clear()
+            self._total_bytes = 0
+
+    def _remove(self, key):
+        """ Removes an entry (if it exists). Lock must be held by the caller. """
+        if key in self._entries:
+            del self._entries[key]
+            self._total_bytes -= self._sizes.pop(key)
+
+    @property
+    def total_bytes(self):
+        """ Returns the current size of all cached values """
+        return self._total_bytes
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __contains__(self, key):
+        return key in self._entries
@@ -0,0 +1,221 @@
+"""
+data_files.py
+
+@author: James Fowkes
+
+Finds logger data files (plain or compressed CSV files) in folder trees, opens them and parses their rows
+"""
+
+import os
+import bz2
+import gzip
+import fnmatch
+import zipfile
+
+from collections import namedtuple, deque
+from concurrent.futures import ThreadPoolExecutor
+
+import pandas as pd
+
+# Extensions of files that are read as CSV data (compared in lower case)
+PLAIN_EXTENSIONS = (".csv",)
+COMPRESSED_EXTENSIONS = (".csv.gz", ".csv.bz2", ".zip")
+
+# Default number of threads walking subfolders at once (can be changed in config.ini)
+DEFAULT_SCAN_WORKERS = 8
+
+# How to search a folder for data files.
+# recursive : Search subfolders (e.g. site/year/month trees) as well. Off by default, as the files in all the
+#             subfolders are loaded as one time series (so a folder of several site folders would be mixed together).
+# include : Glob patterns a file must match (any of) to be loaded. Empty to load all data files.
+# exclude : Glob patterns of files and subfolders to skip
+# Patterns are matched against names and against paths relative to the folder (with / separators).
+ScanOptions = namedtuple("ScanOptions", ["recursive", "include", "exclude", "workers"])
+
+DEFAULT_SCAN_OPTIONS = ScanOptions(False, (), (), DEFAULT_SCAN_WORKERS)
+
+def is_data_file(filename):
+    """ Returns True if the filename is a CSV file, or a compressed CSV file or zip archive of CSV files """
+    return filename.lower().endswith(PLAIN_EXTENSIONS + COMPRESSED_EXTENSIONS)
+
+def is_compressed(filename):
+    """ Returns True if the file has to be decompressed to read it (so cannot be read from a byte offset) """
+    return filename.lower().endswith(COMPRESSED_EXTENSIONS)
+
+def _is_csv_member(info):
+    """ Returns True if a zip archive member is a CSV file """
+    return not info.is_dir() and info.filename.lower().endswith(".csv")
+
+def csv_streams(path):
+    """
+    Yields a binary stream of decompressed CSV data for each CSV file in a data file,
+    decompressing as the stream is read (nothing is written to disk).
+    Plain and gzip/bzip2 compressed files have one CSV file. Zip archives can have any number
+    (other files in the archive are ignored). Each stream is closed once the next one is requested.
+    Args:
+    path : Full path to the data file
+    """
+    lower_path = path.lower()
+
+    if lower_path.endswith(".zip"):
+        with zipfile.ZipFile(path) as archive:
+            for info in sorted(archive.infolist(), key=lambda info: info.filename):
+                if _is_csv_member(info):
+                    with archive.open(info) as stream:
+                        yield stream
+    elif lower_path.endswith(".gz"):
+        with gzip.open(path, "rb") as stream:
+            yield stream
+    elif lower_path.endswith(".bz2"):
+        with bz2.open(path, "rb") as stream:
+            yield stream
+    else:
+        with open(path, "rb") as stream:
+            yield stream
+
+def _index_by_timestamp(frame):
+    """ Returns a dataframe of logger data indexed by the timestamps in its date and time columns
+    (the second and third), which are removed. The other columns keep their order. """
+    (date_column, time_column) = frame.columns[1:3]
+    timestamps = pd.to_datetime(
+        frame[date_column].astype(str).str.strip() + " " + frame[time_column].astype(str).str.strip(), dayfirst=True)
+
+    frame = frame.drop(columns=[date_column, time_column])
+    frame.index = pd.DatetimeIndex(timestamps, name="%s_%s" % (date_column, time_column))
+    return frame
+
+def read_data_csv(stream, chunksize=None, usecols=None):
+    """
+    Yields dataframes of the rows of logger CSV data, indexed by the timestamp of each row.
+    Dates are day first (e.g. 31/12/2015). The first column (the reference) is the first column of each dataframe.
+    Args:
+    stream : Path or stream of CSV data
+    chunksize : Number of rows in each dataframe (None to read all the rows into one dataframe)
+    usecols : Names of the columns to read (None for all). Must include the first three.
+    """
+    if chunksize is None:
+        yield _index_by_timestamp(pd.read_csv(stream, usecols=usecols))
+        return
+
+    for chunk in pd.read_csv(stream, chunksize=chunksize, usecols=usecols):
+        yield _index_by_timestamp(chunk)
+
+def _patterns(text):
+    """ Returns the glob patterns in a comma separated list """
+    return tuple(pattern.strip() for pattern in text.split(",") if pattern.strip())
+
+def scan_options_from_config(config=None):
+    """
+    Returns ScanOptions from the SCAN section of config.ini (defaults if config is None)
+    Args:
+    config : Optional configparser object
+    """
+    if config is None:
+        return DEFAULT_SCAN_OPTIONS
+
+    return ScanOptions(
+        config.getboolean('SCAN', 'Recursive', fallback=DEFAULT_SCAN_OPTIONS.recursive),
+        _patterns(config.get('SCAN', 'Include', fallback="")),
+        _patterns(config.get('SCAN', 'Exclude', fallback="")),
+        config.getint('SCAN', 'Workers', fallback=DEFAULT_SCAN_OPTIONS.workers))
+
+def _matches(name, relative_path, patterns):
+    """ Returns True if a name or relative path matches any of the glob patterns """
+    return any(fnmatch.fnmatch(name, pattern) or fnmatch.fnmatch(relative_path, pattern) for pattern in patterns)
+
+def _directory_entries(folder, relative_dir, options):
+    """
+    Yields (relative path, is_folder) for the data files and subfolders (if recursive) in one folder,
+    skipping excluded ones. Uses os.scandir, so the type of each entry is known without a stat call
+    per file, and entries are yielded as they are listed.
+    Args:
+    folder : The folder being searched
+    relative_dir : The folder to list, relative to folder ("" for folder itself)
+    options : ScanOptions
+    """
+    try:
+        entries = os.scandir(os.path.join(folder, relative_dir))
+    except OSError:
+        # Unreadable folders (e.g. permissions on a network share) are skipped
+        return
+
+    with entries:
+        for entry in entries:
+            relative_path = entry.name if relative_dir == "" else relative_dir + "/" + entry.name
+
+            if _matches(entry.name, relative_path, options.exclude):
+                continue
+
+            try:
+                if entry.is_dir(follow_symlinks=False):
+                    if options.recursive:
+                        yield (relative_path, True)
+                elif is_data_file(entry.name):
+                    if len(options.include) == 0 or _matches(entry.name, relative_path, options.include):
+                        yield (relative_path, False)
+            except OSError:
+                continue
+
+def _scan_directory(folder, relative_dir, options):
+    """ Returns ([relative paths of data files], [relative paths of subfolders to search]) for one folder """
+    (filenames, subdirs) = ([], [])
+    for (relative_path, is_folder) in _directory_entries(folder, relative_dir, options):
+        (subdirs if is_folder else filenames).append(relative_path)
+    return (filenames, subdirs)
+
+def _walk(folder, relative_dir, options):
+    """ Returns the relative paths of data files in a folder and (if recursive) all its subfolders """
+    (found, pending) = ([], [relative_dir])
+
+    while len(pending) > 0:
+        (filenames, subdirs) = _scan_directory(folder, pending.pop(), options)
+        found.extend(filenames)
+        pending.extend(subdirs)
+
+    return found
+
+def find_data_files(folder, options=DEFAULT_SCAN_OPTIONS):
+    """
+    Returns the paths (relative to folder, with / separators) of all data files in a folder, sorted.
+    If the search is recursive, separate subtrees are walked at the same time on a pool of threads
+    (listing folders is mostly waiting for the disk or network).
+    Args:
+    folder : The folder to search
+    options : ScanOptions
+    """
+    (found, subtrees) = _scan_directory(folder, "", options)
+
+    # Split the tree into enough subtrees to keep the threads busy (e.g. one per site, then one per year)
+    workers = max(options.workers, 1)
+    while 0 < len(subtrees) < workers:
+        next_level = []
+        for subtree in subtrees:
+            (filenames, subdirs) = _scan_directory(folder, subtree, options)
+            found.extend(filenames)
+            next_level.extend(subdirs)
+        subtrees = next_level
+
+    if len(subtrees) > 0:
+        with ThreadPoolExecutor(max_workers=min(workers, len(subtrees))) as pool:
+            for filenames in pool.map(lambda subtree: _walk(folder, subtree, options), subtrees):
+                found.extend(filenames)
+
+    return sorted(found)
+
+def has_data_files(folder, options=DEFAULT_SCAN_OPTIONS):
+    """
+    Returns True if a folder (or, if the search is recursive, any subfolder) has at least one data file.
+    Stops at the first data file found, finishing each level of the tree before going deeper.
+    Args:
+    folder : The folder to search
+    options : ScanOptions
+    """
+    pending = deque([""])
+
+    while len(pending) > 0:
+        for (relative_path, is_folder) in _directory_entries(folder, pending.popleft(), options):
+            if not is_folder:
+                return True
+            pending.append(relative_path)
+
+    return False
@@ -7,60 +7,250 @@ Datamanager class for data from CSV files
 """
 
 import pandas as pd
+import numpy as np
 import os
 import logging
 
 import threading
+import time
 
 from datetime import timedelta
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
 
 from special_fields import Windspeed, Humidity, WindDirection
+from messages import ProgressMessage, PartialResultMessage, ErrorMessage, CompleteMessage, LoadStatisticsMessage
+from instrumentation import LoadTrace
+from cache import LRUCache
+from data_files import is_data_file, is_compressed, csv_streams, read_data_csv
+from data_files import find_data_files, has_data_files, scan_options_from_config, DEFAULT_SCAN_OPTIONS
+from file_index import FolderManifest
+from archive import ArchiveStore, ARCHIVE_FILENAME
+from field_store import FieldStore, GrowableArray, read_only
+from tail import TailReader
+from export import ExportError
+from aggregation import AggregationIndex, AggregateResult, time_slice, to_ns
+from aggregation import gaps_in_slice, median_interval_seconds, nearest_matches
+
+# Default memory budget for cached averaging results (can be changed in config.ini)
+DEFAULT_AVERAGE_CACHE_MB = 64
+
+# Default number of rows read from a CSV file at a time (between checks for cancellation)
+DEFAULT_READ_CHUNK_ROWS = 100000
+
+# Default number of files read (and decompressed) at once
+DEFAULT_READ_WORKERS = min(4, os.cpu_count() or 1)
+
+# Default minimum time between showing partially loaded data (0 turns off progressive display)
+DEFAULT_PARTIAL_UPDATE_SECONDS = 2
+
+# Default number of the most recently written files to check for new rows when following
+DEFAULT_FOLLOW_FILES = 1
+
+# Unless set in config.ini, intervals this many times longer than the median sample interval are gaps
+GAP_MEDIAN_MULTIPLIER = 10
+
+# Aggregations that are computed from the prefix-sum index without resampling,
+# mapped to their AggregateResult member
+INDEXED_AGGREGATIONS = {"mean":"mean", "min":"minimum", "max":"maximum", "std":"std", "count":"count"}
 
 def valid_filename(filename):
-    """ Returns true if the filename ends with .csv.
+    """ Returns true if the filename is a CSV file (plain, .csv.gz, .csv.bz2 or a .zip of CSV files).
     Used for filtering a directory listing for valid files """
-    return filename.lower().endswith(".csv")
+    return is_data_file(filename)
 
 def get_module_logger():
 
     """ Returns logger for this module """
     return logging.getLogger(__name__)
 
-def get_csv_filenames(folder):
+def _average_result_nbytes(result):
+    """ Returns memory used by an averaging result (a tuple of numpy arrays) """
+    return sum(array.nbytes for array in result if array is not None)
+
+def _range_key(start, end):
+    """ Returns a hashable representation of a time range for use in cache keys """
+    return (None if start is None else int(to_ns(start)), None if end is None else int(to_ns(end)))
+
+def get_folder_key(folder):
+    """ Returns the key a folder's data is archived under: its normalised absolute path (with / separators),
+    so that folders with the same name in different places are archived separately
+    Args:
+    folder : The folder being loaded
+    """
+    return os.path.normcase(os.path.abspath(folder)).replace(os.sep, "/")
+
+def get_logger_name(folder, filename):
+    """ Returns the name a file's logger is archived under: the folder's key,
+    followed by the subfolder the file is in (if it is in one), e.g. "/data/Site/2015/01"
+    Args:
+    folder : The folder being loaded
+    filename : Path of the file, relative to folder (with / separators)
+    """
+    (subfolder, _, _) = filename.rpartition("/")
+    folder_key = get_folder_key(folder)
+    return folder_key + "/" + subfolder if subfolder else folder_key
+
+def get_csv_filenames(folder, scan_options=DEFAULT_SCAN_OPTIONS):
 
-    """ Get a list of valid CSV files
+    """ Get a sorted list of valid CSV files (relative to the folder, including any in subfolders)
     Args:
     folder: folder to search in
+    scan_options: ScanOptions (whether to search subfolders, and which files to include and exclude)
+    """
+
+    return find_data_files(folder, scan_options)
+
+class LoadCancelled(Exception):
+    """ Raised inside the data manager thread when loading has been cancelled """
+    pass
+
+class CancelToken:
+
+    """ Thread-safe flag used to ask a running load to stop """
+
+    def __init__(self):
+        self._event = threading.Event()
+
+    def cancel(self):
+        """ Requests cancellation """
+        self._event.set()
+
+    @property
+    def cancelled(self):
+        """ Returns True if cancellation has been requested """
+        return self._event.is_set()
+
+    def check(self):
+        """ Raises LoadCancelled if cancellation has been requested """
+        if self._event.is_set():
+            raise LoadCancelled()
+
+class LoadedData:
+
+    """
+    One version of the loaded data, with the averaging indexes and cache built from it.
+
+    While loading progressively, the data manager thread replaces this as a whole (a single
+    attribute assignment) each time more data is ready. The field names are part of each version,
+    and anything computed from an older version stays with that version, so the application thread
+    never mixes data (or names) from two versions.
     """
 
-    filenames = []
-    for filename in os.listdir(folder):
-        if valid_filename(filename):
-            filenames.append(filename)
+    def __init__(self, store, cache_bytes, field_to_display=None, display_to_field=None, numeric_fields=None):
+        #pylint: disable=too-many-arguments
+        """
+        Args:
+        store : FieldStore of the data
+        cache_bytes : Memory budget for cached averaging results
+        field_to_display : {field name: display name} of the fields in the store
+        display_to_field : {display name: field name} of the fields in the store
+        numeric_fields : Names of the fields that can be considered numeric data
+        """
+        self.store = store
+        self.field_to_display = {} if field_to_display is None else field_to_display
+        self.display_to_field = {} if display_to_field is None else display_to_field
+        self.numeric_fields = [] if numeric_fields is None else numeric_fields
+        self.aggregation_indexes = {}
+        self.average_cache = LRUCache(cache_bytes, _average_result_nbytes)
+
+    def get_aggregation_index(self, field_name):
+        """ Returns the prefix-sum index for a field, building it on first use.
+        Building on first use (rather than for every field at load) avoids holding
+        the cumulative arrays for fields that are never averaged.
+        """
+        try:
+            return self.aggregation_indexes[field_name]
+        except KeyError:
+            index = AggregationIndex(*self.store.series(field_name))
+            self.aggregation_indexes[field_name] = index
+            return index
 
-    return filenames
+    def clear(self):
+        """ Discards all cached averaging results and indexes """
+        self.average_cache.clear()
+        self.aggregation_indexes.clear()
 
 class DataManager(threading.Thread):
 
     """
     The data manager is responsible for reading CSV files, performing data
-    conversions and presenting dataframes to the application.
+    conversions and presenting datasets to the application.
+
+    Loaded data is kept in a FieldStore: one shared time index with a plain numpy array per field.
 
     The data manager is dependent on the pandas library for dataset processing.
 
     The data manager runs in a separate thread to the rest of the application.
     This is so the application can get IO status updates during long operations
-    such as CSV file read and parsing.
+    such as CSV file read and parsing. A load can be cancelled with cancel(), which is
+    checked between files and between chunks of each file.
+
+    Files are loaded newest first. Every so often during the load, the data read so far is
+    published (replacing the previously published data) and a PartialResultMessage is sent,
+    so the most recent data can be shown while older files are still loading.
+
+    Averaged datasets are kept in an LRU cache, so switching back to a previously
+    used averaging period does not need to resample the data again.
     """
-    def __init__(self, msg_queue, folder):
+    def __init__(self, msg_queue, folder, config=None, time_range=(None, None), fields=None):
+        #pylint: disable=too-many-arguments
+        """
+        Args:
+        msg_queue : Queue for sending progress updates to the application
+        folder : The folder to read CSV files from
+        config : Optional configparser object (used for cache sizes etc.)
+        time_range : Optional (start, end) to load. Only files overlapping this range are read.
+        fields : Optional field names (CSV column names, or the display names of special fields) to load.
+            Other fields are not parsed from CSV files (unless archiving) or read from the archive. None for all.
+        """
         threading.Thread.__init__(self)
+
+        # Don't keep the application alive just to finish (or notice the cancellation of) a load
+        self.daemon = True
+
         self.queue = msg_queue
         self.folder = folder
+        self.config = config
+        self.time_range = time_range
+        self.cancel_token = CancelToken()
+
+        self.read_chunk_rows = DEFAULT_READ_CHUNK_ROWS
+        if config is not None:
+            self.read_chunk_rows = config.getint('DATA', 'ReadChunkRows', fallback=DEFAULT_READ_CHUNK_ROWS)
+
+        self.partial_update_seconds = DEFAULT_PARTIAL_UPDATE_SECONDS
+        if config is not None:
+            self.partial_update_seconds = config.getfloat(
+                'DATA', 'PartialUpdateSeconds', fallback=DEFAULT_PARTIAL_UPDATE_SECONDS)
+
+        self.scan_options = scan_options_from_config(config)
+
+        # SQLite archive to load from (and add new files to), or None to parse the files every time
+        self.archive_path = None
+        if config is not None and config.getboolean('ARCHIVE', 'Enabled', fallback=False):
+            self.archive_path = config.get('ARCHIVE', 'Path', fallback="").strip() or os.path.join(
+                folder, ARCHIVE_FILENAME)
+
+        self.read_workers = DEFAULT_READ_WORKERS
+        if config is not None:
+            self.read_workers = config.getint('DATA', 'ReadWorkers', fallback=DEFAULT_READ_WORKERS)
+
+        # Timing (and optionally memory use) of each stage of the load and each file read
+        trace_memory = config is not None and config.getboolean('INSTRUMENTATION', 'TraceMemory', fallback=False)
+        self.trace = LoadTrace(folder, trace_memory)
+        self.trace_file = None
+        if config is not None:
+            self.trace_file = config.get('INSTRUMENTATION', 'TraceFile', fallback="").strip() or None
 
-        self._numeric_fields = None
-        self._display_to_field_dict = None
-        self._field_to_display_dict = None
-        self.dataframes = None
+        self.gap_threshold_seconds = None
+
+        # Files in the folder and size of each file when it was loaded,
+        # then readers and growable arrays for following new data
+        self._known_filenames = set()
+        self._loaded_sizes = {}
+        self._tail_readers = None
+        self._growable = None
 
         # These fields have special processing applied before they are displayed
         self.special_fields = {
@@ -69,136 +259,802 @@ class DataManager(threading.Thread):
             "Direction" : WindDirection("Direction"),
         }
 
+        # Special fields can be requested by their display names (e.g. "Wind Speed" for "Wind Pulses")
+        self.fields = None
+        if fields is not None:
+            display_fields = {field.display_name: name for (name, field) in self.special_fields.items()}
+            self.fields = set(display_fields.get(name, name) for name in fields)
+
+        cache_mb = DEFAULT_AVERAGE_CACHE_MB
+        if config is not None:
+            cache_mb = config.getfloat('AVERAGING', 'CacheSizeMB', fallback=DEFAULT_AVERAGE_CACHE_MB)
+
+        self._cache_bytes = int(cache_mb * 1024 * 1024)
+        self._loaded = LoadedData(FieldStore([]), self._cache_bytes)
+
+    @property
+    def store(self):
+        """ The FieldStore of the most recently published data """
+        return self._loaded.store
+
     def run(self):
+        """
+        Loads the data, reporting progress, errors and completion to the application through the message queue
+        """
+        self.trace.begin()
+        try:
+            with self.trace.stage("Total") as total:
+                if self.archive_path is None:
+                    self._load()
+                else:
+                    self._load_from_archive()
+                total["rows"] = len(self.store.index)
+        except LoadCancelled:
+            get_module_logger().info("Loading from '%s' cancelled", self.folder)
+            return
+        except Exception as exc: #pylint: disable=broad-except
+            get_module_logger().exception("Loading from '%s' failed", self.folder)
+            self.queue.put(ErrorMessage(exc))
+            return
+        finally:
+            self.trace.end()
+
+        self._report_statistics()
+
+        # Signal to main thread that data load and conversion is complete
+        self.queue.put(CompleteMessage())
+
+    def _report_statistics(self):
+        """ Logs the load statistics, sends them to the application and writes them to the trace file (if set) """
+        self.trace.log_report()
+
+        if self.trace_file is not None:
+            try:
+                self.trace.save(self.trace_file)
+            except OSError as exc:
+                get_module_logger().info("Could not write trace file '%s' (%s)", self.trace_file, exc)
+
+        self.queue.put(LoadStatisticsMessage(self.folder, self.trace.get_records(), self.trace.report()))
+
+    def cancel(self):
+        """ Asks the load to stop. Safe to call from any thread. The thread exits at the next check. """
+        self.cancel_token.cancel()
+
+    def _read_csv(self, path):
+        """ Reads a data file in chunks (checking for cancellation between chunks).
+        Compressed files are decompressed as they are parsed. All the CSV files in a zip archive are read.
+        Returns a dataframe, or None if the file has no data rows.
+        Args:
+        path : Full path to the file
+        """
+        chunks = []
+        for stream in csv_streams(path):
+            for chunk in read_data_csv(stream, self.read_chunk_rows, self._csv_columns(stream)):
+                self.cancel_token.check()
+                chunks.append(chunk)
+
+        if len(chunks) == 0:
+            return None
+
+        return chunks[0] if len(chunks) == 1 else pd.concat(chunks)
+
+    def _csv_columns(self, stream):
+        """
+        Returns the names of the columns to parse from a CSV stream: the reference, date and time columns
+        (the first three) and the requested fields. Returns None to parse all columns, if all fields are
+        requested or the data is being archived (the archive keeps every column).
+        The header is parsed by pandas (so quoted names and byte order marks are handled as they are when
+        the rows are read) to find the names, then the stream is rewound.
+        Args:
+        stream : Binary stream of CSV data, at its start
+        """
+        if self.fields is None or self.archive_path is not None:
+            return None
+
+        names = list(pd.read_csv(stream, nrows=0).columns)
+        stream.seek(0)
+
+        return names[:3] + [name for name in names[3:] if name.strip() in self.fields]
+
+    def _read_file(self, filename):
+        """ Reads a data file in the folder (on a worker thread). Returns a dataframe, or None if it has no rows.
+        Args:
+        filename : Name of the file in the folder
+        """
+        self.cancel_token.check()
+
+        full_path = os.path.join(self.folder, filename)
+
+        # Anything appended after this is picked up by read_new_data (duplicates are skipped by timestamp)
+        self._loaded_sizes[filename] = os.stat(full_path).st_size
+
+        start = time.perf_counter()
+        dataframe = self._read_csv(full_path)
+        self.trace.add_file(
+            filename, start, time.perf_counter() - start, 0 if dataframe is None else len(dataframe))
+
+        return dataframe
+
+    def _load(self):
         """
         Parse the file with pandas
         Use columns 1 and 2 to get datetime from
         This creates a new column 0, which is the combined datetime used as index
         """
 
-        filenames = get_csv_filenames(self.folder)
+        with self.trace.stage("Find files") as details:
+            filenames = get_csv_filenames(self.folder, self.scan_options)
+            details["rows"] = len(filenames)
+        self._known_filenames = set(filenames)
+
+        progressive = self.partial_update_seconds > 0
+
+        # The folder manifest is only built (and saved in the folder) for loads of a time range.
+        # Building it reads the start and end of every file, which would delay showing the first data.
+        manifest = None
+        if self.time_range != (None, None):
+            with self.trace.stage("Folder manifest"):
+                manifest = FolderManifest(self.folder, filenames)
+
+            # Use the folder manifest to skip files entirely outside the requested range
+            filenames = manifest.filenames_in_range(*self.time_range)
+            get_module_logger().info("Loading %d files in requested time range", len(filenames))
+
+        if progressive:
+            # Newest data first, as that is usually what the user wants to see
+            if manifest is not None:
+                filenames = manifest.newest_first(filenames)
+            else:
+                filenames = self._most_recently_modified_first(filenames)
 
         frames = []
         total_file_count = len(filenames)
         percent_complete = 0
 
-        for fcount, filename in enumerate(filenames):
+        # Rows and time at which data was last published, and whether more has been read since
+        published_rows = 0
+        published_time = time.monotonic()
+        loaded_rows = 0
+
+        # Files are read (and decompressed) on a pool of threads, but added to the data in order
+        pool = ThreadPoolExecutor(max_workers=max(self.read_workers, 1))
+        reads = [pool.submit(self._read_file, filename) for filename in filenames]
+
+        # Includes showing partially loaded data, which is also recorded as stages of its own
+        with self.trace.stage("Read files") as details:
+            try:
+                for fcount, read in enumerate(reads):
+
+                    self.cancel_token.check()
+
+                    # Create a dataframe for each CSV file and append to the frames list
+                    dataframe = read.result()
+                    if dataframe is not None:
+                        frames.append(dataframe)
+                        loaded_rows += len(dataframe)
+
+                        # Spans of compressed files are only known once they have been parsed
+                        if manifest is not None and not manifest.is_known(filenames[fcount]):
+                            manifest.record(
+                                filenames[fcount], dataframe.index.min(), dataframe.index.max(), len(dataframe))
+
+                    percent_complete = (fcount * 95) / total_file_count
+                    self.queue.put(ProgressMessage(percent_complete))
+
+                    # Publish the first data as soon as it is read, then no more often than the update interval.
+                    # Each publication rebuilds all the data read so far, so also wait for the rows to double
+                    # (keeping the total work of publishing proportional to the size of the data).
+                    if progressive and fcount < total_file_count - 1 and loaded_rows > 0:
+                        if published_rows == 0 or (
+                                time.monotonic() - published_time >= self.partial_update_seconds and
+                                loaded_rows >= 2 * published_rows):
+                            self._publish(*self._build_store(frames))
+                            self.queue.put(PartialResultMessage(percent_complete))
+                            (published_rows, published_time) = (loaded_rows, time.monotonic())
+            finally:
+                # If the load failed or was cancelled, abandon reads that have not started
+                # (running reads stop at their next check for cancellation)
+                for read in reads:
+                    read.cancel()
+                pool.shutdown(wait=False)
+            details["rows"] = loaded_rows
 
-            # Create a dataframe for each CSV file and append to the frames list
+        if manifest is not None:
+            manifest.save()
 
-            full_path = os.path.join(self.folder, filename)
-            dataframe = pd.read_csv(full_path, parse_dates=[[1, 2]], dayfirst=True, index_col=0)
-            frames.append(dataframe)
+        self._publish(*self._build_store(frames, report_progress=True))
 
-            percent_complete = (fcount * 95) / total_file_count
-            self.queue.put(percent_complete)
+    def _most_recently_modified_first(self, filenames):
+        """ Returns filenames ordered by modification time, newest first (then by name, last first) """
+        def sort_key(filename):
+            """ Sorts by modification time, then by name """
+            return (os.stat(os.path.join(self.folder, filename)).st_mtime, filename)
+
+        return sorted(filenames, key=sort_key, reverse=True)
+
+    def _load_from_archive(self):
+        """
+        Adds any new or changed files in the folder to the archive, then loads the data in the requested
+        time range from the archive. Files that are already archived are not parsed again, and the
+        timestamp index of each logger's table means only rows in the time range are read.
+        Data from files that have since been removed from the folder is still loaded from the archive.
+        """
+
+        filenames = get_csv_filenames(self.folder, self.scan_options)
+        self._known_filenames = set(filenames)
+
+        folder_key = get_folder_key(self.folder)
+        archive = ArchiveStore(self.archive_path)
+        try:
+            # Files are read on a pool of threads, but only this thread writes to the archive
+            stats = {}
+            for filename in filenames:
+                stat = os.stat(os.path.join(self.folder, filename))
+                if archive.is_current(folder_key, filename, stat.st_size, stat.st_mtime):
+                    self._loaded_sizes[filename] = stat.st_size
+                else:
+                    stats[filename] = stat
+
+            get_module_logger().info(
+                "Archiving %d new or changed files (of %d) in '%s'", len(stats), len(filenames), self.folder)
+
+            pool = ThreadPoolExecutor(max_workers=max(self.read_workers, 1))
+            reads = [(filename, pool.submit(self._read_file, filename)) for filename in stats]
+
+            with self.trace.stage("Read and archive new files") as details:
+                try:
+                    for fcount, (filename, read) in enumerate(reads):
+                        self.cancel_token.check()
+                        archive.ingest(
+                            folder_key, get_logger_name(self.folder, filename), filename,
+                            stats[filename].st_size, stats[filename].st_mtime, read.result())
+                        self.queue.put(ProgressMessage((fcount * 90) / len(reads)))
+                finally:
+                    for (_, read) in reads:
+                        read.cancel()
+                    pool.shutdown(wait=False)
+                details["rows"] = len(reads)
+
+            self.cancel_token.check()
+
+            with self.trace.stage("Query archive") as details:
+                frames = [
+                    archive.query(folder_key, logger, self._archive_columns(archive, logger), *self.time_range)
+                    for logger in archive.loggers(folder_key)]
+                details["rows"] = sum(len(frame) for frame in frames if frame is not None)
+            self.queue.put(ProgressMessage(95))
+        finally:
+            archive.close()
+
+        self._publish(*self._build_store([frame for frame in frames if frame is not None], report_progress=True))
+
+    def _archive_columns(self, archive, logger):
+        """ Returns the columns to read from the archive for a logger: None for all of them, or the reference
+        column (the first column, which is not loaded as a field) and the requested fields """
+        if self.fields is None:
+            return None
+        columns = archive.columns(logger)
+        return columns[:1] + [name for name in columns[1:] if name in self.fields]
+
+    def _build_store(self, frames, report_progress=False):
+        """
+        Merges dataframes into a FieldStore, applying special field conversions and finding gaps.
+        Returns (store, column_names).
+        Args:
+        frames : The dataframes read from the CSV files (in any order)
+        report_progress : If True, send progress messages as each stage completes
+        """
+
+        # Stages of building partially loaded data are recorded separately from the final build
+        prefix = "" if report_progress else "Partial: "
 
         # All dataframes created, now merge them and sort by time
-        data = pd.concat(frames)
-        data.sort_index(inplace=True)
+        with self.trace.stage(prefix + "Concatenate") as details:
+            if len(frames) > 0:
+                data = pd.concat(frames)
+            else:
+                data = pd.DataFrame(index=pd.DatetimeIndex([]))
+            details["rows"] = len(data)
 
-        self.queue.put(96)
+        with self.trace.stage(prefix + "Sort by time") as details:
+            data.sort_index(inplace=True)
+            details["rows"] = len(data)
+
+        if self.time_range != (None, None):
+            # Files at the ends of the range can contain data outside it
+            with self.trace.stage(prefix + "Trim to time range") as details:
+                data = data.iloc[time_slice(data.index.values, *self.time_range)]
+                details["rows"] = len(data)
+
+        self._stage_complete(96, report_progress)
+
+        # Gaps (e.g. logger offline) are found from the intervals between samples
+        with self.trace.stage(prefix + "Gap threshold"):
+            self.gap_threshold_seconds = self._get_gap_threshold(data.index.values)
+            self.special_fields["Wind Pulses"].max_delta_seconds = self.gap_threshold_seconds
 
         # Strip any whitespace from the column names
         data.rename(columns=lambda x: x.strip(), inplace=True)
 
-        self.queue.put(97)
+        self._stage_complete(97, report_progress)
+
+        # Split data into seperate arrays (ignoring reference field) against a single shared index
+        with self.trace.stage(prefix + "Split columns") as details:
+            column_names = [
+                name for name in list(data.columns.values)[1:] if self.fields is None or name in self.fields]
+            store = FieldStore(data.index.values)
+            columns = [(key, data[key].values) for key in column_names]
+            details["rows"] = len(data)
 
-        # Split data into seperate dataframes (ignoring reference field)
-        column_names = list(data.columns.values)[1:]
-        self.dataframes = {}
-        for col in column_names:
-            self.dataframes[col] = pd.DataFrame(data[col], index=data.index)
+        # The merged frame is no longer needed (the column arrays from it are kept)
+        del data
 
-        self.queue.put(98)
+        self._stage_complete(98, report_progress)
 
         # Apply any special data conversions
-        for key, dataframe in self.dataframes.items():
+        for (key, values) in columns:
+            timestamps = store.index
             try:
-                self.dataframes[key] = self.special_fields[key].convert(dataframe)
+                special_field = self.special_fields[key]
+            except KeyError:
+                special_field = None # No special field exists for this data
+
+            if special_field is not None:
+                with self.trace.stage(prefix + "Convert '%s'" % key) as details:
+                    (timestamps, values) = special_field.convert(timestamps, values)
+                    details["rows"] = len(values)
                 get_module_logger().info("Applied special conversion to field '%s'", key)
+
+            store.add(key, values, timestamps)
+
+        # Find gaps once now, rather than each time data is plotted
+        with self.trace.stage(prefix + "Find gaps"):
+            store.find_gaps(self.gap_threshold_seconds)
+
+        self._stage_complete(99, report_progress)
+
+        return (store, column_names)
+
+    def _stage_complete(self, percent, report_progress):
+        """ Checks for cancellation between stages of building the data, and optionally reports progress
+        Args:
+        percent : Percentage of loading complete
+        report_progress : If True, send a progress message
+        """
+        self.cancel_token.check()
+        if report_progress:
+            self.queue.put(ProgressMessage(percent))
+
+    def _publish(self, store, column_names):
+        """
+        Makes newly built data available to the application.
+        Cached averages and indexes belong to the previous data, so they are replaced with it.
+        Args:
+        store : The FieldStore of the new data
+        column_names : The names of the fields in the store
+        """
+
+        # The names are published with the store, so the application never sees a name
+        # (e.g. of a column that first appears in a later file) before the store has its data
+        (field_to_display, display_to_field) = self._get_display_names(column_names)
+
+        self._loaded = LoadedData(
+            store, self._cache_bytes, field_to_display, display_to_field, self._get_numeric_fields(store))
+
+    def read_new_data(self):
+        """
+        Reads rows appended to the data files since they were loaded, and rows in any new files,
+        then publishes the extended data. Returns the number of new rows.
+        Only the most recently written files (FOLLOW/Files in config.ini) and new files are checked,
+        and only the appended bytes of each are parsed. The existing data is not copied
+        (except occasionally when its growable buffers fill up), so the work done is proportional to
+        the number of new rows. Must not be called while loading, or from more than one thread at once.
+        """
+
+        if self._tail_readers is None:
+            self._tail_readers = self._get_tail_readers()
+
+        # Any files that have appeared since the last check are read from the start.
+        # Compressed files cannot be read from an offset, so are read once, whole.
+        new_frames = []
+        for filename in get_csv_filenames(self.folder, self.scan_options):
+            if filename not in self._known_filenames:
+                get_module_logger().info("Following new file '%s'", filename)
+                self._known_filenames.add(filename)
+                if is_compressed(filename):
+                    new_frames.append(self._read_csv(os.path.join(self.folder, filename)))
+                else:
+                    self._tail_readers[filename] = TailReader(os.path.join(self.folder, filename))
+
+        frames = new_frames + [reader.read_frame() for reader in self._tail_readers.values()]
+        frames = [frame for frame in frames if frame is not None and len(frame) > 0]
+        if len(frames) == 0:
+            return 0
+
+        data = pd.concat(frames) if len(frames) > 1 else frames[0]
+        data.sort_index(inplace=True)
+        data.rename(columns=lambda x: x.strip(), inplace=True)
+
+        # Keep only rows after the data already loaded (and within the requested time range)
+        store = self.store
+        start = store.index[-1] + 1 if len(store.index) > 0 else self.time_range[0]
+        data = data.iloc[time_slice(data.index.values, start, self.time_range[1])]
+        if len(data) == 0:
+            return 0
+
+        self._publish(self._extend_store(store, data), store.field_names())
+
+        get_module_logger().info("Read %d new rows", len(data))
+        return len(data)
+
+    def _get_tail_readers(self):
+        """ Returns {filename: TailReader} for the most recently written of the loaded (uncompressed) files,
+        starting from the size each file had when it was loaded """
+
+        file_count = DEFAULT_FOLLOW_FILES
+        if self.config is not None:
+            file_count = self.config.getint('FOLLOW', 'Files', fallback=DEFAULT_FOLLOW_FILES)
+
+        def modified_time(filename):
+            """ Returns the modification time of a loaded file """
+            return os.stat(os.path.join(self.folder, filename)).st_mtime
+
+        plain_filenames = [filename for filename in self._loaded_sizes if not is_compressed(filename)]
+        newest = sorted(plain_filenames, key=modified_time, reverse=True)[:file_count]
+
+        return {
+            filename: TailReader(os.path.join(self.folder, filename), self._loaded_sizes[filename])
+            for filename in newest}
+
+    def _extend_store(self, store, data):
+        """
+        Returns a new FieldStore with the rows of a dataframe appended to the fields of an existing one.
+        Special conversions are applied to the new rows only.
+        Args:
+        store : The existing store
+        data : Dataframe of new rows (all later than the data in the store)
+        """
+
+        if self._growable is None:
+            # First extension: copy the data into arrays with room to grow
+            self._growable = {None: GrowableArray(store.index)}
+            for field_name in store.field_names():
+                self._growable[(field_name, "values")] = GrowableArray(store.values(field_name))
+                if store.has_own_index(field_name):
+                    self._growable[(field_name, "timestamps")] = GrowableArray(store.timestamps(field_name))
+
+        new_times = data.index.values
+        new_store = FieldStore(self._growable[None].append(new_times))
+
+        # Conversions that work between consecutive samples (e.g. wind speed) need the last existing timestamp.
+        # It is given a placeholder value, as only its timestamp is used.
+        overlap = store.index[-1:]
+        times = np.concatenate((overlap, new_times))
+
+        for field_name in store.field_names():
+            if field_name in data:
+                values = data[field_name].values
+            else:
+                values = np.full(len(data), np.nan)
+            values = np.concatenate((values[:len(overlap)], values))
+
+            (timestamps, values) = (times, values)
+            try:
+                (timestamps, values) = self.special_fields[field_name].convert(timestamps, values)
             except KeyError:
                 pass # No special field exists for this data
-            except:
-                raise
 
-        self.queue.put(99)
+            if timestamps is times:
+                new_store.add(
+                    field_name, self._growable[(field_name, "values")].append(values[len(overlap):]), new_store.index)
+            else:
+                # Converted fields on their own index keep only the points after their existing data
+                existing = store.timestamps(field_name)
+                if len(existing) > 0:
+                    keep = timestamps > existing[-1]
+                    (timestamps, values) = (timestamps[keep], values[keep])
+                new_store.add(
+                    field_name, self._growable[(field_name, "values")].append(values),
+                    self._growable[(field_name, "timestamps")].append(timestamps))
 
-        # The fields are fixed, so save them to a member now rather than compute each time
-        self._set_fieldnames(column_names)
+        new_store.find_gaps(self.gap_threshold_seconds, previous=store)
 
-        # Can also get numeric fieldnames now
-        self._set_numeric_fields()
+        return new_store
 
-        # Signal to main thread that data load and conversion is complete
-        self.queue.put(100)
+    def _get_gap_threshold(self, timestamps):
+        """ Returns the interval (in seconds) above which there is a gap in the data.
+        Uses GapThresholdSeconds from config.ini if it is set (and not zero),
+        otherwise a multiple of the median sample interval.
+        Args:
+        timestamps: The timestamps of the data
+        """
+        threshold = 0
+        if self.config is not None:
+            threshold = self.config.getfloat('DATA', 'GapThresholdSeconds', fallback=0)
+
+        if threshold <= 0:
+            threshold = median_interval_seconds(timestamps) * GAP_MEDIAN_MULTIPLIER
+
+        get_module_logger().info("Treating intervals of more than %f seconds as gaps", threshold)
+        return threshold
 
-    def _set_fieldnames(self, names):
+    def _get_display_names(self, names):
         """
-        Get a set of display names from field names
+        Returns ({field name: display name}, {display name: field name}) for field names
         """
 
-        self._field_to_display_dict = {}
-        self._display_to_field_dict = {}
+        field_to_display_dict = {}
+        display_to_field_dict = {}
         for name in names:
             try:
                 display_name = self.special_fields[name].display_name
-                self._field_to_display_dict[name] = display_name
-                self._display_to_field_dict[display_name] = name
+                field_to_display_dict[name] = display_name
+                display_to_field_dict[display_name] = name
             except KeyError: # Special field does not exist for this field
-                self._field_to_display_dict[name] = name
-                self._display_to_field_dict[name] = name
+                field_to_display_dict[name] = name
+                display_to_field_dict[name] = name
 
-    def _set_numeric_fields(self):
-        """ Set field names of fields that can be considered numeric data """
+        return (field_to_display_dict, display_to_field_dict)
+
+    @staticmethod
+    def _get_numeric_fields(store):
+        """ Returns the names of fields that can be considered numeric data
+        Args:
+        store : The FieldStore holding the fields
+        """
 
         # Datatype can be considered numeric if its kind is one of b,i,u,f,c
         # These are numpy kinds (see http://docs.scipy.org/doc/numpy/reference/arrays.dtypes.html)
         # (boolean, integer, unsigned, float, complex)
 
-        frames = [dataframe for (key, dataframe) in self.dataframes.items() if dataframe[key].dtype.kind in 'biufc']
+        return [
+            field_name for field_name in store.field_names()
+            if store.values(field_name).dtype.kind in 'biufc']
 
-        self._numeric_fields = [list(frame.columns.values)[0] for frame in frames]
+    @staticmethod
+    def _get_series(store, field_name, start=None, end=None):
+        """ Returns (timestamps, values) numpy arrays for a field of a store without copying.
+        If start and/or end are given, only data in that range is returned (as views found by binary search)
+        """
+        (timestamps, values) = store.series(field_name)
+        if start is None and end is None:
+            return (timestamps, values)
 
-    def get_timestamps(self, display_name):
-        """ Return timestamps (the dataframe index) for the requested series """
-        field_name = self._display_to_field_dict[display_name]
-        return self.dataframes[field_name].index
+        rows = time_slice(timestamps, start, end)
+        return (timestamps[rows], values[rows])
+
+    def get_timestamps(self, display_name, start=None, end=None):
+        """ Return timestamps for the requested series as a read-only datetime64 array
+        Args:
+        display_name : The requested series
+        start : Earliest timestamp to return (None for no limit)
+        end : Latest timestamp to return (None for no limit)
+        """
+        loaded = self._loaded
+        field_name = loaded.display_to_field[display_name]
+        return read_only(self._get_series(loaded.store, field_name, start, end)[0])
 
     def has_dataset(self, display_name):
         """ Return true if dataset with this name exists in datasets """
-        return display_name in self._display_to_field_dict.keys()
+        loaded = self._loaded
+        return display_name in loaded.display_to_field.keys()
+
+    def get_dataset(self, display_name, start=None, end=None):
+        """ Return data for the requested series as a read-only numpy array
+        Args:
+        display_name : The requested series
+        start : Earliest timestamp to return data for (None for no limit)
+        end : Latest timestamp to return data for (None for no limit)
+        """
+        loaded = self._loaded
+        field_name = loaded.display_to_field[display_name]
+        return read_only(self._get_series(loaded.store, field_name, start, end)[1])
+
+    def get_gaps(self, display_name, start=None, end=None):
+        """ Returns positions of gaps in the requested series, as an int array.
+        A position i means there is a gap between sample i and sample i+1 of the series
+        returned by get_dataset/get_timestamps with the same start and end.
+        Args:
+        display_name : The requested series
+        start : Earliest timestamp of the series (None for no limit)
+        end : Latest timestamp of the series (None for no limit)
+        """
+        loaded = self._loaded
+        field_name = loaded.display_to_field[display_name]
+        store = loaded.store
+        gaps = store.gaps(field_name)
+        if start is None and end is None:
+            return gaps
+
+        rows = time_slice(store.timestamps(field_name), start, end)
+        return gaps_in_slice(gaps, rows)
+
+    def get_aligned(self, display_name_a, display_name_b, start=None, end=None):
+        """ Returns (timestamps, data_a, data_b) numpy arrays of two series paired by time.
+        Each point of series a is paired with the nearest point of series b, if there is one within
+        the alignment tolerance. This allows series with different timestamps (or different numbers
+        of points) to be compared directly, e.g. for windrose plots.
+        The tolerance is AlignToleranceSeconds from config.ini, or the median sample interval of series b
+        if that is not set (or zero).
+        Args:
+        display_name_a : The series to pair points from. The returned timestamps are from this series.
+        display_name_b : The series to pair points with
+        start : Earliest timestamp of series a to return (None for no limit)
+        end : Latest timestamp of series a to return (None for no limit)
+        """
+        #pylint: disable=too-many-arguments
+        loaded = self._loaded
+        store = loaded.store
+        (times_a, values_a) = self._get_series(store, loaded.display_to_field[display_name_a], start, end)
+        (times_b, values_b) = self._get_series(store, loaded.display_to_field[display_name_b])
+
+        tolerance = 0
+        if self.config is not None:
+            tolerance = self.config.getfloat('DATA', 'AlignToleranceSeconds', fallback=0)
+        if tolerance <= 0:
+            tolerance = median_interval_seconds(times_b)
+
+        (positions_a, positions_b) = nearest_matches(times_a, times_b, tolerance)
 
-    def get_dataset(self, display_name):
-        """ Return data for the requested series """
-        field_name = self._display_to_field_dict[display_name]
-        return self.dataframes[field_name][field_name].values
+        return (times_a[positions_a], values_a[positions_a], values_b[positions_b])
 
-    def get_dataset_average(self, display_name, average_time_seconds):
-        """ Use resampling functionality to get average of dataset over requested number of seconds """
-        field_name = self._display_to_field_dict[display_name]
-        resampled_data = self.dataframes[field_name].resample("%dS" % average_time_seconds, how='mean')
+    def get_time_span(self):
+        """ Returns (first, last) timestamps over all loaded datasets as datetime64 values """
+        return self.store.time_span()
+
+    def get_dataset_statistics(self, display_name, average_time_seconds, start=None, end=None):
+        """ Get mean, minimum, maximum, standard deviation and count of a dataset over
+        each period of the requested number of seconds, in a single pass over the data.
+        Results are cached, so repeated requests for the same averaging return immediately.
+        Returns an AggregateResult of read-only numpy arrays (see aggregation.py).
+        Args:
+        display_name : The dataset to average
+        average_time_seconds : The averaging period
+        start : Earliest timestamp to average (None for no limit)
+        end : Latest timestamp to average (None for no limit)
+        """
+        loaded = self._loaded
+        field_name = loaded.display_to_field[display_name]
+
+        cache_key = (field_name, average_time_seconds, "buckets", _range_key(start, end))
+        result = loaded.average_cache.get(cache_key)
+        if result is not None:
+            get_module_logger().info("Using cached statistics for '%s'", field_name)
+            return result
+
+        result = loaded.get_aggregation_index(field_name).aggregate(average_time_seconds, start, end)
+        result = AggregateResult(*[read_only(array) for array in result])
+        loaded.average_cache.put(cache_key, result)
+
+        return result
+
+    def get_dataset_rolling(self, display_name, window_seconds, start=None, end=None):
+        """ Get centred moving average, standard deviation and count of a dataset over a time window.
+        Results are cached, so repeated requests for the same window return immediately.
+        Returns an AggregateResult of read-only numpy arrays (minimum and maximum are None).
+        Args:
+        display_name : The dataset to smooth
+        window_seconds : The length of the moving window
+        start : Earliest sample to return (None for no limit)
+        end : Latest sample to return (None for no limit)
+        """
+        loaded = self._loaded
+        field_name = loaded.display_to_field[display_name]
+
+        cache_key = (field_name, window_seconds, "rolling", _range_key(start, end))
+        result = loaded.average_cache.get(cache_key)
+        if result is not None:
+            get_module_logger().info("Using cached rolling statistics for '%s'", field_name)
+            return result
+
+        result = loaded.get_aggregation_index(field_name).rolling(window_seconds, start, end)
+        result = AggregateResult(*[None if array is None else read_only(array) for array in result])
+        loaded.average_cache.put(cache_key, result)
+
+        return result
+
+    def get_dataset_average(self, display_name, average_time_seconds, how='mean', start=None, end=None):
+        """ Get average of dataset over requested number of seconds
+        Mean, min, max, standard deviation and count come from the field's prefix-sum index
+        (see get_dataset_statistics). Other aggregations use pandas resampling.
+        Results are cached, so repeated requests for the same averaging return immediately.
+        Returns (data, timestamps) as read-only numpy arrays.
+        Args:
+        display_name : The dataset to average
+        average_time_seconds : The averaging period
+        how : The aggregation to apply to each period (e.g. 'mean')
+        start : Earliest timestamp to average (None for no limit)
+        end : Latest timestamp to average (None for no limit)
+        """
+        #pylint: disable=too-many-arguments
+        loaded = self._loaded
+        if how in INDEXED_AGGREGATIONS:
+            statistics = self.get_dataset_statistics(display_name, average_time_seconds, start, end)
+            return (getattr(statistics, INDEXED_AGGREGATIONS[how]), statistics.timestamps)
+
+        field_name = loaded.display_to_field[display_name]
+
+        cache_key = (field_name, average_time_seconds, how, _range_key(start, end))
+        result = loaded.average_cache.get(cache_key)
+        if result is not None:
+            get_module_logger().info("Using cached average for '%s'", field_name)
+            return result
+
+        (timestamps, values) = self._get_series(loaded.store, field_name, start, end)
+        dataframe = pd.DataFrame({field_name:values}, index=timestamps)
+        resampled_data = dataframe.resample(pd.Timedelta(seconds=average_time_seconds)).agg(how)
         # Resampled data is placed at start of time periods. Re-index to middle of periods.
         new_index = resampled_data.index + timedelta(seconds=average_time_seconds/2)
         resampled_data.index = new_index
 
-        return (list(resampled_data[field_name].values), list(resampled_data[field_name].index))
+        result = (read_only(resampled_data[field_name].values), read_only(resampled_data.index.values))
+        loaded.average_cache.put(cache_key, result)
+
+        return result
+
+    def get_export_groups(self, display_names=None, average_time_seconds=None, how='mean', start=None, end=None):
+        """ Returns the data of numeric datasets grouped by time index, for export.export_groups.
+        Datasets on the shared time index form the first group ("Data"). Each dataset with its own
+        index (e.g. wind speed) is a group of its own, named after the dataset.
+        Raw data is returned as views (no data is copied). Averaged datasets on the same index
+        have the same averaging periods, so they stay in the same group.
+        Args:
+        display_names : The datasets to export (None for all numeric datasets)
+        average_time_seconds : Averaging period (None to export the raw data)
+        how : The aggregation to apply to each period (see get_dataset_average)
+        start : Earliest timestamp to export (None for no limit)
+        end : Latest timestamp to export (None for no limit)
+        """
+        #pylint: disable=too-many-arguments
+        loaded = self._loaded
+        numeric_names = [loaded.field_to_display[field_name] for field_name in loaded.numeric_fields]
+        if display_names is None:
+            display_names = numeric_names
+
+        store = loaded.store
+        groups = OrderedDict([("Data", (None, OrderedDict()))])
+
+        for display_name in display_names:
+            if display_name not in numeric_names:
+                raise ExportError("'%s' is not a numeric dataset, so cannot be exported" % display_name)
+
+            field_name = loaded.display_to_field[display_name]
+            if average_time_seconds is None:
+                (timestamps, values) = self._get_series(store, field_name, start, end)
+            else:
+                (values, timestamps) = self.get_dataset_average(display_name, average_time_seconds, how, start, end)
+
+            group_name = display_name if store.has_own_index(field_name) else "Data"
+            if group_name not in groups:
+                groups[group_name] = (None, OrderedDict())
+            groups[group_name][1][display_name] = values
+            groups[group_name] = (timestamps, groups[group_name][1])
+
+        return [
+            (group_name, timestamps, columns) for (group_name, (timestamps, columns)) in groups.items()
+            if timestamps is not None]
+
+    def clear_average_cache(self):
+        """ Discards all cached averaging results and indexes """
+        self._loaded.clear()
 
     def len(self, display_name):
-        """ Returns length of a dataframe
-        Returns 0 if the requested frame does not exist
+        """ Returns length of a dataset
+        Returns 0 if the requested dataset does not exist
         Args:
-        display_name : the dataframe to get length of
+        display_name : the dataset to get length of
         """
+        loaded = self._loaded
         try:
-            field_name = self._display_to_field_dict[display_name]
-            return len(self.dataframes[field_name][field_name])
+            field_name = loaded.display_to_field[display_name]
+            return len(loaded.store.values(field_name))
         except KeyError:
             return 0
 
     def _get_all_display_names(self):
         """ Returns a list of display names from the dictionary """
-        return list(self._field_to_display_dict.values())
+        loaded = self._loaded
+        return list(loaded.field_to_display.values())
 
     def get_special_dataset_options(self, dataset):
         """ Returns a list of special capabilities for a dataset.
@@ -207,7 +1063,8 @@ class DataManager(threading.Thread):
         Args:
         dataset: the dataset of interest
         """
-        field_name = self._display_to_field_dict[dataset]
+        loaded = self._loaded
+        field_name = loaded.display_to_field[dataset]
         try:
             special_field = self.special_fields[field_name]
             return special_field.capabilities(self)
@@ -218,21 +1075,30 @@ class DataManager(threading.Thread):
 
     def get_numeric_display_names(self):
         """ Return display names of fields that can be considered numeric data """
-        return [self._field_to_display_dict[key] for key in self._numeric_fields]
+        loaded = self._loaded
+        return [loaded.field_to_display[key] for key in loaded.numeric_fields]
 
     def get_numeric_field_names(self):
         """ Return display names of fields that can be considered numeric data """
-        return self._numeric_fields.copy()
+        loaded = self._loaded
+        return loaded.numeric_fields.copy()
 
     def get_field_name_from_display_name(self, display_name): #pylint: disable=invalid-name
         """ For a given "nice" display name from special field return the field name (from CSV file) """
-        return self._display_to_field_dict[display_name]
+        loaded = self._loaded
+        return loaded.display_to_field[display_name]
 
     def get_display_name(self, field_name):
         """ Returns the display name associated with a field name """
-        return self._field_to_display_dict[field_name]
+        loaded = self._loaded
+        return loaded.field_to_display[field_name]
 
     @staticmethod
-    def directory_has_data_files(directory):
-        """ Returns True if directory has at least one .csv or .CSV file """
-        return True in [".csv" in filename.lower() for filename in os.listdir(directory)]
+    def directory_has_data_files(directory, config=None):
+        """ Returns True if directory (or a subfolder, if searching subfolders) has at least one
+        (plain or compressed) CSV file. Stops searching at the first one found.
+        Args:
+        directory : The folder to search
+        config : Optional configparser object (for the SCAN settings)
+        """
+        return has_data_files(directory, scan_options_from_config(config))
@@ -0,0 +1,189 @@
+"""
+export.py
+
+@author: James Fowkes
+
+Writes loaded (and optionally averaged) datasets to columnar file formats, a chunk at a time
+"""
+
+import os
+import re
+import zipfile
+import importlib.util
+
+from collections import OrderedDict
+
+import numpy as np
+
+# Default number of rows written at a time. Only one chunk of each table is held in memory for writing.
+DEFAULT_CHUNK_ROWS = 500000
+
+# Default compression for each format (can be overridden when exporting)
+DEFAULT_COMPRESSION = {
+    ".parquet": "snappy",
+    ".feather": "lz4",
+    ".h5": "blosc",
+    ".hdf5": "blosc",
+    ".npz": "deflate",
+}
+
+# Compression level for HDF5 files
+HDF5_COMPRESSION_LEVEL = 5
+
+# Name of the timestamp column in exported tables
+TIME_COLUMN = "Time"
+
+class ExportError(Exception):
+    """ Raised when data cannot be exported (e.g. unknown format, or a required package is not installed) """
+    pass
+
+def supported_extensions():
+    """ Returns the file extensions that can be exported to """
+    return list(DEFAULT_COMPRESSION.keys())
+
+def _chunks(length, chunk_rows):
+    """ Yields slices of up to chunk_rows rows covering length rows (a single empty slice if length is 0) """
+    chunk_rows = max(int(chunk_rows), 1)
+    for start in range(0, max(length, 1), chunk_rows):
+        yield slice(start, min(start + chunk_rows, length))
+
+def _safe_name(name):
+    """ Returns a name that can be used in filenames and HDF5 keys """
+    return re.sub(r'\W+', '_', name).strip('_')
+
+def _group_path(path, group_index, group_name):
+    """ Returns the path to write a group to, for formats that hold one table per file.
+    The first group is written to the requested path, others to <name>_<group><extension> beside it. """
+    if group_index == 0:
+        return path
+    (root, extension) = os.path.splitext(path)
+    return "%s_%s%s" % (root, _safe_name(group_name), extension)
+
+def _arrow_table(pyarrow, timestamps, columns, rows):
+    """ Returns a pyarrow Table of one chunk of a group """
+    arrays = OrderedDict([(TIME_COLUMN, pyarrow.array(timestamps[rows]))])
+    for (name, values) in columns.items():
+        arrays[name] = pyarrow.array(values[rows])
+    return pyarrow.table(arrays)
+
+def _require_pyarrow(format_name):
+    """ Raises ExportError if pyarrow is not installed """
+    if importlib.util.find_spec("pyarrow") is None:
+        raise ExportError("Exporting to %s needs the pyarrow package (pip install pyarrow)" % format_name)
+
+def _write_parquet(path, groups, chunk_rows, compression):
+    """ Writes each group to a Parquet file, one row group per chunk """
+    _require_pyarrow("Parquet")
+    import pyarrow
+    import pyarrow.parquet
+
+    for (group_index, (group_name, timestamps, columns)) in enumerate(groups):
+        writer = None
+        try:
+            for rows in _chunks(len(timestamps), chunk_rows):
+                table = _arrow_table(pyarrow, timestamps, columns, rows)
+                if writer is None:
+                    writer = pyarrow.parquet.ParquetWriter(
+                        _group_path(path, group_index, group_name), table.schema, compression=compression)
+                writer.write_table(table)
+        finally:
+            if writer is not None:
+                writer.close()
+
+def _write_feather(path, groups, chunk_rows, compression):
+    """ Writes each group to a Feather (version 2, i.e. Arrow IPC) file, one record batch per chunk """
+    _require_pyarrow("Feather")
+    import pyarrow
+    import pyarrow.ipc
+
+    options = pyarrow.ipc.IpcWriteOptions(compression=None if compression == "none" else compression)
+
+    for (group_index, (group_name, timestamps, columns)) in enumerate(groups):
+        with pyarrow.OSFile(_group_path(path, group_index, group_name), "wb") as sink:
+            writer = None
+            try:
+                for rows in _chunks(len(timestamps), chunk_rows):
+                    table = _arrow_table(pyarrow, timestamps, columns, rows)
+                    if writer is None:
+                        writer = pyarrow.ipc.new_file(sink, table.schema, options=options)
+                    writer.write_table(table)
+            finally:
+                if writer is not None:
+                    writer.close()
+
+def _write_hdf5(path, groups, chunk_rows, compression):
+    """ Writes each group to a table in one HDF5 file (keyed by group name), appending a chunk at a time """
+    if importlib.util.find_spec("tables") is None:
+        raise ExportError("Exporting to HDF5 needs the tables package (pip install tables)")
+
+    import pandas as pd
+
+    complevel = 0 if compression == "none" else HDF5_COMPRESSION_LEVEL
+    complib = None if compression == "none" else compression
+
+    with pd.HDFStore(path, mode="w", complib=complib, complevel=complevel) as store:
+        for (group_name, timestamps, columns) in groups:
+            key = "/" + (_safe_name(group_name) or "data")
+            for rows in _chunks(len(timestamps), chunk_rows):
+                frame = pd.DataFrame(
+                    OrderedDict((name, values[rows]) for (name, values) in columns.items()),
+                    index=pd.DatetimeIndex(timestamps[rows], name=TIME_COLUMN))
+                store.append(key, frame, format="table")
+
+def _write_npy_member(archive, member_name, array, chunk_rows):
+    """ Writes a 1D array to a .npy member of a zip archive a chunk at a time
+    (numpy.savez would need the whole array in memory to compress it) """
+    header = {
+        "descr": np.lib.format.dtype_to_descr(array.dtype),
+        "fortran_order": False,
+        "shape": (len(array),)}
+
+    with archive.open(member_name, "w", force_zip64=True) as member:
+        np.lib.format.write_array_header_1_0(member, header)
+        for rows in _chunks(len(array), chunk_rows):
+            member.write(np.ascontiguousarray(array[rows]).tobytes())
+
+def _write_npz(path, groups, chunk_rows, compression):
+    """ Writes all groups to one .npz archive, as arrays named <group>/<column>
+    (e.g. numpy.load(path)["Data/Time"]) """
+    zip_compression = zipfile.ZIP_STORED if compression == "none" else zipfile.ZIP_DEFLATED
+
+    with zipfile.ZipFile(path, "w", compression=zip_compression, allowZip64=True) as archive:
+        for (group_name, timestamps, columns) in groups:
+            arrays = [(TIME_COLUMN, timestamps)] + list(columns.items())
+            for (name, array) in arrays:
+                _write_npy_member(archive, "%s/%s.npy" % (group_name, name), np.asarray(array), chunk_rows)
+
+WRITERS = {
+    ".parquet": _write_parquet,
+    ".feather": _write_feather,
+    ".h5": _write_hdf5,
+    ".hdf5": _write_hdf5,
+    ".npz": _write_npz,
+}
+
+def export_groups(path, groups, chunk_rows=DEFAULT_CHUNK_ROWS, compression=None):
+    """
+    Writes groups of columns to a file. The format is chosen by the file extension
+    (.parquet, .feather, .h5/.hdf5 or .npz).
+    HDF5 and npz files hold all the groups. Parquet and Feather files hold one table each, so groups after
+    the first are written to separate files named <name>_<group><extension>.
+    Data is written in chunks of rows, so memory use does not depend on the size of the data.
+    Args:
+    path : The file to write
+    groups : List of (group_name, timestamps, OrderedDict of column name: values). All the columns
+        in a group have one value per timestamp.
+    chunk_rows : Number of rows written at a time
+    compression : Compression codec name (None for the format's default, "none" for no compression)
+    """
+    extension = os.path.splitext(path)[1].lower()
+    try:
+        writer = WRITERS[extension]
+    except KeyError:
+        raise ExportError(
+            "Cannot export to '%s' files (use one of %s)" % (extension, ", ".join(supported_extensions())))
+
+    if compression is None:
+        compression = DEFAULT_COMPRESSION[extension]
+
+    writer(path, groups, chunk_rows, compression)
@@ -0,0 +1,181 @@
+"""
+field_store.py
+
+@author: James Fowkes
+
+Column store for loaded data: one shared time index and one numpy array per field
+"""
+
+import numpy as np
+
+from collections import OrderedDict
+
+from aggregation import find_gaps
+
+def read_only(array):
+    """ Returns a read-only view of a numpy array (no data is copied) """
+    view = array.view()
+    view.flags.writeable = False
+    return view
+
+class GrowableArray:
+
+    """
+    A numpy array that can be appended to in amortised constant time per value.
+
+    Spare capacity is kept at the end of the buffer. The arrays returned by view() only cover the
+    values appended so far, so they are unchanged by later appends and can be used in other stores.
+    """
+
+    # Minimum number of values the buffer can hold
+    MIN_CAPACITY = 1024
+
+    def __init__(self, values):
+        """
+        Args:
+        values : Initial values (copied into the buffer)
+        """
+        values = np.asarray(values)
+        self._buffer = np.empty(max(len(values) * 3 // 2, self.MIN_CAPACITY), dtype=values.dtype)
+        self._buffer[:len(values)] = values
+        self._length = len(values)
+
+    def append(self, values):
+        """
+        Appends values, returning a read-only view of all the values.
+        The buffer is only reallocated (doubling in size) when it is full,
+        or if the new values need a wider dtype (e.g. float values appended to integers).
+        Args:
+        values : The values to append
+        """
+        values = np.asarray(values)
+        dtype = np.result_type(self._buffer.dtype, values.dtype)
+        length = self._length + len(values)
+
+        if length > len(self._buffer) or dtype != self._buffer.dtype:
+            buffer = np.empty(max(length, 2 * len(self._buffer)), dtype=dtype)
+            buffer[:self._length] = self._buffer[:self._length]
+            self._buffer = buffer
+
+        self._buffer[self._length:length] = values
+        self._length = length
+
+        return self.view()
+
+    def view(self):
+        """ Returns a read-only view of the values appended so far """
+        return read_only(self._buffer[:self._length])
+
+    def __len__(self):
+        return self._length
+
+class FieldStore:
+
+    """
+    Stores each field as a plain numpy array against a single, shared, immutable datetime64 index.
+
+    Most fields come straight from the CSV files and have one value per row, so they all use
+    the shared index. Fields whose conversion changes the timestamps (e.g. wind speed, which is
+    placed between the logged timestamps) are stored with their own index.
+    """
+
+    def __init__(self, index):
+        """
+        Args:
+        index : Sorted timestamps shared by all fields (anything convertible to datetime64[ns])
+        """
+        self.index = read_only(np.asarray(index, dtype='datetime64[ns]'))
+        self._columns = OrderedDict()
+        self._own_indexes = {}
+        self._gaps = {}
+
+    def add(self, field_name, values, timestamps=None):
+        """
+        Adds a field to the store
+        Args:
+        field_name : The name of the field
+        values : numpy array of values for the field
+        timestamps : Timestamps for the values if different to the shared index (None to use the shared index)
+        """
+        values = np.asarray(values)
+        if timestamps is None or timestamps is self.index:
+            if len(values) != len(self.index):
+                raise ValueError(
+                    "Field '%s' has %d values for %d timestamps" % (field_name, len(values), len(self.index)))
+        else:
+            self._own_indexes[field_name] = read_only(np.asarray(timestamps, dtype='datetime64[ns]'))
+
+        self._columns[field_name] = read_only(values)
+
+    def timestamps(self, field_name):
+        """ Returns the timestamps of a field (the shared index unless the field has its own) """
+        return self._own_indexes.get(field_name, self.index)
+
+    def values(self, field_name):
+        """ Returns the values of a field """
+        return self._columns[field_name]
+
+    def series(self, field_name):
+        """ Returns (timestamps, values) of a field """
+        return (self.timestamps(field_name), self._columns[field_name])
+
+    def has_own_index(self, field_name):
+        """ Returns True if the field does not use the shared index """
+        return field_name in self._own_indexes
+
+    def field_names(self):
+        """ Returns the names of all fields, in the order they were added """
+        return list(self._columns.keys())
+
+    def find_gaps(self, threshold_seconds, previous=None):
+        """
+        Finds gaps in the time indexes (see aggregation.find_gaps).
+        The shared index is only searched once, however many fields use it.
+        Args:
+        threshold_seconds : Intervals longer than this are gaps
+        previous : Optional store that this store extends (i.e. whose indexes start this store's indexes).
+            Its gaps are reused, so only the new timestamps are searched.
+        """
+        def extended_gaps(timestamps, previous_timestamps, previous_gaps):
+            """ Returns the gaps of timestamps, given the gaps of the first part of them """
+            # The last previous timestamp is included, to find any gap before the first new one
+            start = max(len(previous_timestamps) - 1, 0)
+            new_gaps = find_gaps(timestamps[start:], threshold_seconds) + start
+            return read_only(np.concatenate((previous_gaps, new_gaps)))
+
+        indexes = {field_name: self.timestamps(field_name) for field_name in self._own_indexes}
+        indexes[None] = self.index
+
+        self._gaps = {}
+        for (field_name, timestamps) in indexes.items():
+            if previous is not None and (field_name is None or field_name in previous):
+                self._gaps[field_name] = extended_gaps(
+                    timestamps, previous.timestamps(field_name), previous.gaps(field_name))
+            else:
+                self._gaps[field_name] = read_only(find_gaps(timestamps, threshold_seconds))
+
+    def gaps(self, field_name):
+        """ Returns the gap positions of a field (find_gaps must have been called) """
+        return self._gaps.get(field_name, self._gaps[None])
+
+    def time_span(self):
+        """ Returns (first, last) timestamps over all fields as datetime64 values ((None, None) if empty) """
+        indexes = [self.index] + list(self._own_indexes.values())
+        indexes = [index for index in indexes if len(index) > 0]
+
+        if len(indexes) == 0:
+            return (None, None)
+
+        return (min(index[0] for index in indexes), max(index[-1] for index in indexes))
+
+    @property
+    def nbytes(self):
+        """ Returns the memory used by all indexes and field arrays """
+        arrays = [self.index] + list(self._own_indexes.values()) + list(self._columns.values())
+        return sum(array.nbytes for array in arrays)
+
+    def __contains__(self, field_name):
+        return field_name in self._columns
+
+    def __len__(self):
+        return len(self._columns)
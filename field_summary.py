@@ -0,0 +1,108 @@
+"""
+field_summary.py
+
+@author: James Fowkes
+
+Summary statistics (count, min, max, mean and percentiles) of every field of loaded data
+"""
+
+from collections import OrderedDict
+
+import numpy as np
+
+# Percentiles included in summaries by default
+DEFAULT_PERCENTILES = (5, 25, 50, 75, 95)
+
+def percentile_name(percentile):
+    """ Returns the name of a percentile in summaries (e.g. "p50", or "p99.9") """
+    return "p%g" % percentile
+
+def summarise_block(values, percentiles=DEFAULT_PERCENTILES):
+    """
+    Returns {statistic: array with a value for each row} of the count, min, max, mean and percentiles
+    of each row of a 2D array, ignoring NaN values. Each row is sorted once, and the min, max and percentiles
+    (interpolated linearly, as numpy.percentile does) are all read from the sorted rows, so the statistics
+    of many fields are computed together. Statistics of rows with no values are NaN.
+    Args:
+    values : 2D float array (one row per field, one column per sample)
+    percentiles : The percentiles to compute (0 to 100)
+    """
+    (field_count, sample_count) = values.shape
+
+    # NaN values are sorted to the end of each row, after the count of valid values
+    ordered = np.sort(values, axis=1)
+    counts = np.count_nonzero(~np.isnan(values), axis=1)
+
+    summary = OrderedDict()
+    summary["count"] = counts
+
+    if sample_count == 0:
+        empty = np.full(field_count, np.nan)
+        for name in ["min", "max", "mean"] + [percentile_name(percentile) for percentile in percentiles]:
+            summary[name] = empty
+        return summary
+
+    rows = np.arange(field_count)
+    last = np.maximum(counts - 1, 0)
+    has_values = counts > 0
+
+    summary["min"] = np.where(has_values, ordered[:, 0], np.nan)
+    summary["max"] = np.where(has_values, ordered[rows, last], np.nan)
+    summary["mean"] = np.where(has_values, np.nansum(values, axis=1) / np.maximum(counts, 1), np.nan)
+
+    # Position of each percentile in each row's valid values, interpolating between the values either side
+    positions = last[:, np.newaxis] * (np.asarray(percentiles, dtype=float) / 100.0)[np.newaxis, :]
+    lower = np.floor(positions).astype(int)
+    upper = np.minimum(lower + 1, last[:, np.newaxis])
+    (lower_values, upper_values) = (ordered[rows[:, np.newaxis], lower], ordered[rows[:, np.newaxis], upper])
+    interpolated = lower_values + (upper_values - lower_values) * (positions - lower)
+
+    for (index, percentile) in enumerate(percentiles):
+        summary[percentile_name(percentile)] = np.where(has_values, interpolated[:, index], np.nan)
+
+    return summary
+
+def summarise_fields(data, percentiles=DEFAULT_PERCENTILES):
+    """
+    Returns {display name: {statistic: value}} for each numeric dataset of a DataManager (or Session).
+    Datasets with the same number of samples (e.g. all those on the shared time index) are summarised
+    together (see summarise_block).
+    Args:
+    data : The DataManager (or Session) with the loaded data
+    percentiles : The percentiles to compute (0 to 100)
+    """
+    groups = OrderedDict()
+    for display_name in data.get_numeric_display_names():
+        groups.setdefault(len(data.get_dataset(display_name)), []).append(display_name)
+
+    summaries = {}
+    for display_names in groups.values():
+        values = np.vstack([np.asarray(data.get_dataset(name), dtype=float) for name in display_names])
+        block = summarise_block(values, percentiles)
+        for (index, display_name) in enumerate(display_names):
+            summaries[display_name] = OrderedDict(
+                (statistic, block_values[index].item()) for (statistic, block_values) in block.items())
+
+    return OrderedDict((name, summaries[name]) for name in data.get_numeric_display_names())
+
+def format_summary(title, summaries):
+    """
+    Returns a summary as a text table, with a row for each dataset
+    Args:
+    title : Title of the table (e.g. the folder the data was loaded from)
+    summaries : {display name: {statistic: value}} from summarise_fields
+    """
+    lines = [title]
+    if len(summaries) == 0:
+        lines.append("  No numeric data")
+        return "\n".join(lines)
+
+    statistics = list(next(iter(summaries.values())).keys())
+    name_width = max([len(name) for name in summaries] + [5])
+
+    lines.append("  %-*s" % (name_width, "Field") + "".join("%12s" % statistic for statistic in statistics))
+    for (display_name, summary) in summaries.items():
+        lines.append("  %-*s" % (name_width, display_name) + "".join(
+            "%12d" % value if statistic == "count" else "%12.4g" % value for (statistic, value) in summary.items()))
+
+    return "\n".join(lines)
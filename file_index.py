@@ -0,0 +1,220 @@
+"""
+file_index.py
+
+@author: James Fowkes
+
+Folder manifest recording the time span of each CSV file,
+so that only the files covering a requested time range need to be parsed
+"""
+
+import os
+import json
+import logging
+
+from collections import namedtuple
+
+import pandas as pd
+
+from aggregation import to_ns
+from data_files import is_compressed
+
+# The manifest is cached in the data folder under this name
+MANIFEST_FILENAME = ".csvviewer_manifest.json"
+
+# Number of bytes read from the start and end of each file
+HEAD_BYTES = 64 * 1024
+TAIL_BYTES = 8 * 1024
+
+# Summary of one CSV file. first and last are int64 nanosecond timestamps (None if they are not known).
+# rows is exact for files that fit in the head sample (or whose span was recorded when they were parsed),
+# otherwise estimated from the average line length (None if not known).
+FileSummary = namedtuple("FileSummary", ["filename", "size", "mtime", "first", "last", "rows"])
+
+def get_module_logger():
+
+    """ Returns logger for this module """
+    return logging.getLogger(__name__)
+
+def _line_timestamp(line):
+    """ Returns the date/time text from columns 1 and 2 of a CSV line """
+    columns = line.split(",")
+    return "%s %s" % (columns[1].strip(), columns[2].strip())
+
+def summarise_file(path):
+    """
+    Returns a FileSummary for a CSV file by reading only its first and last few kilobytes.
+    The end of a compressed file cannot be read without decompressing all of it, so the span of a compressed
+    file is left unknown (until it is recorded when the file is parsed, see FolderManifest.record).
+    Args:
+    path : Full path to the file
+    """
+    stat = os.stat(path)
+    filename = os.path.basename(path)
+
+    if is_compressed(filename):
+        return FileSummary(filename, stat.st_size, stat.st_mtime, None, None, None)
+
+    with open(path, "rb") as csv_file:
+        head = csv_file.read(HEAD_BYTES)
+        if stat.st_size > HEAD_BYTES:
+            csv_file.seek(max(stat.st_size - TAIL_BYTES, 0))
+            tail = csv_file.read()
+        else:
+            tail = head
+
+    head_lines = head.decode("utf8", "replace").splitlines()
+    tail_lines = tail.decode("utf8", "replace").splitlines()
+
+    # First line is the header
+    data_lines = [line for line in head_lines[1:] if line.strip()]
+    last_lines = [line for line in tail_lines if line.strip()]
+
+    if stat.st_size <= HEAD_BYTES:
+        rows = len(data_lines)
+    elif len(head_lines) > 2:
+        # The final line in the sample is probably cut short, so leave it out of the average
+        complete_lines = head_lines[1:-1]
+        mean_length = float(sum(len(line) + 1 for line in complete_lines)) / len(complete_lines)
+        rows = int(round((stat.st_size - len(head_lines[0]) - 1) / mean_length))
+    else:
+        rows = None
+
+    try:
+        times = pd.to_datetime(
+            [_line_timestamp(data_lines[0]), _line_timestamp(last_lines[-1])], dayfirst=True)
+        (first, last) = (int(to_ns(times[0])), int(to_ns(times[1])))
+    except (IndexError, ValueError):
+        get_module_logger().info("Could not read time span of '%s'", filename)
+        (first, last) = (None, None)
+
+    return FileSummary(filename, stat.st_size, stat.st_mtime, first, last, rows)
+
+class FolderManifest:
+
+    """
+    Records the first and last timestamp and row count of each CSV file in a folder.
+
+    The manifest is saved in the folder, and a file is only summarised again if its size or
+    modification time changes. If the folder is read-only the manifest is just not saved.
+    Spans that cannot be read cheaply (e.g. of compressed files) are unknown until they are recorded
+    from the parsed data.
+    """
+
+    def __init__(self, folder, filenames):
+        """
+        Args:
+        folder : The folder containing the files
+        filenames : The CSV filenames (relative to folder) to summarise
+        """
+        self.folder = folder
+        self.summaries = {}
+
+        cached = self._load()
+        self._changed = False
+
+        for filename in filenames:
+            path = os.path.join(folder, filename)
+            stat = os.stat(path)
+
+            summary = cached.get(filename)
+            if summary is None or summary.size != stat.st_size or summary.mtime != stat.st_mtime:
+                summary = summarise_file(path)._replace(filename=filename)
+                self._changed = True
+
+            self.summaries[filename] = summary
+
+        if len(cached) != len(self.summaries):
+            self._changed = True
+        self.save()
+
+    @property
+    def path(self):
+        """ Returns the full path of the manifest file """
+        return os.path.join(self.folder, MANIFEST_FILENAME)
+
+    def _load(self):
+        """ Returns previously saved summaries (an empty dict if there is no valid manifest) """
+        try:
+            with open(self.path, "r") as manifest_file:
+                return {entry[0]: FileSummary(*entry) for entry in json.load(manifest_file)}
+        except (OSError, ValueError, TypeError):
+            return {}
+
+    def save(self):
+        """ Saves the summaries to the manifest file, if they have changed (and the folder is writable) """
+        if not self._changed:
+            return
+
+        self._changed = False
+        try:
+            with open(self.path, "w") as manifest_file:
+                json.dump([list(summary) for summary in self.summaries.values()], manifest_file)
+        except OSError as exc:
+            get_module_logger().info("Could not save manifest (%s)", exc)
+
+    def is_known(self, filename):
+        """ Returns True if the time span of a file is known """
+        summary = self.summaries[filename]
+        return summary.first is not None and summary.last is not None
+
+    def record(self, filename, first, last, rows):
+        """
+        Records the time span and row count of a file found by parsing it (e.g. a compressed file).
+        Call save to keep them in the manifest file.
+        Args:
+        filename : Filename (from this manifest)
+        first : First timestamp in the file (anything convertible to datetime64[ns])
+        last : Last timestamp in the file
+        rows : Number of rows in the file
+        """
+        self.summaries[filename] = self.summaries[filename]._replace(
+            first=int(to_ns(first)), last=int(to_ns(last)), rows=rows)
+        self._changed = True
+
+    def filenames_in_range(self, start=None, end=None):
+        """
+        Returns the filenames of files with data between start and end (inclusive).
+        Files whose time span is unknown are always included.
+        Args:
+        start : Earliest timestamp required (None for no limit)
+        end : Latest timestamp required (None for no limit)
+        """
+        start = None if start is None else to_ns(start)
+        end = None if end is None else to_ns(end)
+
+        filenames = []
+        for summary in self.summaries.values():
+            if summary.first is None or summary.last is None:
+                filenames.append(summary.filename)
+            elif (start is None or summary.last >= start) and (end is None or summary.first <= end):
+                filenames.append(summary.filename)
+
+        return sorted(filenames)
+
+    def newest_first(self, filenames):
+        """
+        Returns filenames ordered by the last timestamp in each file, newest first.
+        Files whose time span is unknown come last.
+        Args:
+        filenames : Filenames (from this manifest) to order
+        """
+        def sort_key(filename):
+            """ Sorts known spans (newest first) before unknown ones (by name) """
+            last = self.summaries[filename].last
+            return (last is None, 0 if last is None else -last, filename)
+
+        return sorted(filenames, key=sort_key)
+
+    def time_span(self):
+        """ Returns (first, last) int64 nanosecond timestamps over all files (None if unknown) """
+        firsts = [summary.first for summary in self.summaries.values() if summary.first is not None]
+        lasts = [summary.last for summary in self.summaries.values() if summary.last is not None]
+
+        if len(firsts) == 0:
+            return (None, None)
+
+        return (min(firsts), max(lasts))
+
+    def total_rows(self):
+        """ Returns the (estimated) total number of data rows in all files """
+        return sum(summary.rows for summary in self.summaries.values() if summary.rows is not None)
@@ -8,18 +8,14 @@ Defines a GUI for the CSV viewer application
 """
 
 import os
+import time
 import logging
 
-import matplotlib
-matplotlib.use('TkAgg')
-
-from matplotlib.backends.backend_tkagg import FigureCanvasTkAgg, NavigationToolbar2TkAgg
-from matplotlib.figure import Figure
-
 import tkinter as Tk
-from tkinter import messagebox, filedialog
+from tkinter import messagebox, filedialog, simpledialog
 
-from tk_helpers import TkOptionMenuHelper, TkLabelledEntryHelper, TkProgressBarHelper
+from tk_helpers import TkOptionMenuHelper, TkLabelledEntryHelper, TkProgressBarHelper, TkCheckbuttonHelper
+from instrumentation import RenderProfile, render_phase, CANVAS_PHASE
 import app_info
 
 def run_gui():
@@ -31,6 +27,18 @@ def get_module_logger():
     """ Returns logger for this module """
     return logging.getLogger(__name__)
 
+def load_matplotlib():
+    """ Imports matplotlib with the Tk backend, returning (Figure, FigureCanvasTkAgg, NavigationToolbar2TkAgg).
+    matplotlib is slow to import, so this is only done when the first figure is needed
+    (after the main window is already showing) """
+    import matplotlib
+    matplotlib.use('TkAgg')
+
+    from matplotlib.backends.backend_tkagg import FigureCanvasTkAgg, NavigationToolbar2TkAgg
+    from matplotlib.figure import Figure
+
+    return (Figure, FigureCanvasTkAgg, NavigationToolbar2TkAgg)
+
 def ask_directory(title):
     """
     Brings up Tk askdirectory window and if there are valid files, redraws plot
@@ -40,6 +48,32 @@ def ask_directory(title):
 
     return filedialog.askdirectory(title=title)
 
+def ask_string(title, prompt):
+    """
+    Brings up a Tk dialog asking for a line of text. Returns None if the dialog is cancelled.
+    Args:
+    title: The title for the dialog
+    prompt: The text explaining what to enter
+    """
+    return simpledialog.askstring(title, prompt)
+
+def ask_save_filename(title, filetypes):
+    """
+    Brings up a Tk save file dialog. Returns '' if the dialog is cancelled.
+    Args:
+    title: The title for the dialog
+    filetypes: List of (description, pattern) pairs, e.g. [("Parquet", "*.parquet")]
+    """
+    return filedialog.asksaveasfilename(title=title, filetypes=filetypes)
+
+def ask_yes_no(text):
+    """
+    Brings up a Tk yes/no messagebox. Returns True if yes is chosen.
+    Args:
+    text: The question to ask
+    """
+    return messagebox.askyesno(app_info.TITLE, text)
+
 def show_info_dialog(text):
     """
     Show a Tk messagebox
@@ -68,13 +102,17 @@ class GUI:
         def __init__(self):
             """
             Each window has a window object and a master frame.
-            It may also have a canvas, toolbar and figure
+            It may also have a canvas, toolbar and figure (drawn in the master frame).
+            Figures can be created when first drawn, until then their (size, add_nav_toolbar) are pending.
+            When rendering is profiled, each figure also has a status label showing the last profile.
             """
             self.windows = {}
             self.frames = {}
             self.canvases = {}
             self.toolbars = {}
             self.figures = {}
+            self.pending_figures = {}
+            self.status_labels = {}
 
     class SubplotSelectDropdowns:
 
@@ -139,8 +177,8 @@ class GUI:
        #pylint: disable=too-many-arguments
         def __init__(
                 self, subplot_select_dropdowns, dataset_dropdown,
-                average_text_entry, average_period_dropdown, average_button, average_reset_button,
-                special_option_dropdown, special_option_button):
+                average_text_entry, average_period_dropdown, average_mode_dropdown, average_button,
+                average_reset_button, average_envelope_checkbox, special_option_dropdown, special_option_button):
             """
             Args:
             master: The frame to draw on
@@ -148,8 +186,10 @@ class GUI:
             dataset_dropdown: The dataset selection dropdown
             average_text_entry: The text entry for entering the time value
             average_period_dropdown: The dropdown to select a time period
+            average_mode_dropdown: The dropdown to select fixed periods or a moving window
             average_button: The button to apply selected averaging
             average_reset_button: The button to reset averaging (display raw data)
+            average_envelope_checkbox: Checkbox (with a var member) to show min/max of averaged data
             special_option_dropdown: The dropdown to select any special operations to perform
             special_option_button: The button to perform and special operations
 
@@ -159,8 +199,10 @@ class GUI:
             self.dataset_dropdown = dataset_dropdown
             self.average_text_entry = average_text_entry
             self.average_period_dropdown = average_period_dropdown
+            self.average_mode_dropdown = average_mode_dropdown
             self.average_button = average_button
             self.average_reset_button = average_reset_button
+            self.average_envelope_checkbox = average_envelope_checkbox
             self.special_option_dropdown = special_option_dropdown
             self.special_option_button = special_option_button
 
@@ -176,6 +218,14 @@ class GUI:
             """ Returns the selected averaging period (seconds, minutes etc.) """
             return self.average_period_dropdown.var.get()
 
+        def get_averaging_mode(self):
+            """ Returns the selected averaging mode ("Periods" or "Moving") """
+            return self.average_mode_dropdown.var.get()
+
+        def get_averaging_show_envelope(self):
+            """ Returns True if the min/max envelope of averaged data should be shown """
+            return self.average_envelope_checkbox.var.get() == 1
+
         def get_special_action(self):
             """ Returns the current selected special action """
             return self.special_option_dropdown.var.get()
@@ -199,8 +249,10 @@ class GUI:
             self.dataset_dropdown.pack(**kwargs)
             self.average_text_entry.pack(**kwargs)
             self.average_period_dropdown.pack(**kwargs)
+            self.average_mode_dropdown.pack(**kwargs)
             self.average_button.pack(**kwargs)
             self.average_reset_button.pack(**kwargs)
+            self.average_envelope_checkbox.pack(**kwargs)
 
         def pack_subplot_controls(self, **kwargs): #pylint: disable=star-args
             """ Passes pack request through to subplot object """
@@ -225,6 +277,39 @@ class GUI:
             except ValueError:
                 return None
 
+    class TimeRangeControls:
+
+        """ Handles Tk objects for selecting the time range of data to display """
+
+        def __init__(self, start_entry, end_entry, apply_button, reset_button):
+            """
+            Args:
+            start_entry: The text entry for the start of the range
+            end_entry: The text entry for the end of the range
+            apply_button: The button to apply the entered range
+            reset_button: The button to show the full range of data
+            """
+            self.start_entry = start_entry
+            self.end_entry = end_entry
+            self.apply_button = apply_button
+            self.reset_button = reset_button
+
+        def get_range_text(self):
+            """ Returns the (start, end) text from the entries """
+            return (self.start_entry.var.get(), self.end_entry.var.get())
+
+        def set_range_text(self, start, end):
+            """ Sets the text of the start and end entries """
+            self.start_entry.var.set(start)
+            self.end_entry.var.set(end)
+
+        def pack(self, **kwargs): #pylint: disable=star-args
+            """ Draws the objects on the frame """
+            self.start_entry.pack(**kwargs)
+            self.end_entry.pack(**kwargs)
+            self.apply_button.pack(**kwargs)
+            self.reset_button.pack(**kwargs)
+
     class MainWindowFrameCollection:
         """ Implements a collection of frames for the main GUI window """
         #pylint: disable=too-many-arguments
@@ -270,6 +355,11 @@ class GUI:
 
         self.tk_handles = self.TkHandleCollection()
 
+        # If set, the time taken by each phase of drawing each figure is logged and shown below the figure
+        self.profile_rendering = application.config.getboolean(
+            'INSTRUMENTATION', 'ProfileRendering', fallback=False)
+        self.render_profiles = {}
+
         application_frame = Tk.Frame(self.root, bd=1, relief=Tk.SUNKEN)
         control_frame = Tk.Frame(self.root, bd=1, relief=Tk.SUNKEN)
 
@@ -314,12 +404,17 @@ class GUI:
             TkOptionMenuHelper(
                 self.main_window_frames.data_controls_subframes[1], "Seconds",
                 ["Seconds", "Minutes", "Hours", "Days", "Weeks"], command=None, width=10),
+            TkOptionMenuHelper(
+                self.main_window_frames.data_controls_subframes[1], "Periods",
+                ["Periods", "Moving"], command=None, width=8),
             Tk.Button(
                 self.main_window_frames.data_controls_subframes[1],
                 text='Apply', command=self.application.action_average_data),
             Tk.Button(
                 self.main_window_frames.data_controls_subframes[1],
                 text='Reset', command=self.application.reset_average_data),
+            TkCheckbuttonHelper(
+                self.main_window_frames.data_controls_subframes[1], text='Show min/max'),
             TkOptionMenuHelper(
                 self.main_window_frames.data_controls_subframes[2],
                 "Special Options", ["Special Options"], command=None),
@@ -328,17 +423,63 @@ class GUI:
                 text='Show', command=self.application.action_special_option)
         )
 
+        # Time range selection
+        self.time_range_controls = self.TimeRangeControls(
+            TkLabelledEntryHelper(
+                self.main_window_frames.data_controls_subframes[0],
+                {"text":"Show from:"},
+                {"side":Tk.LEFT, "padx":2, "pady":2},
+                width=20),
+            TkLabelledEntryHelper(
+                self.main_window_frames.data_controls_subframes[0],
+                {"text":"to:"},
+                {"side":Tk.LEFT, "padx":2, "pady":2},
+                width=20),
+            Tk.Button(
+                self.main_window_frames.data_controls_subframes[0],
+                text='Apply Range', command=self.application.action_apply_time_range),
+            Tk.Button(
+                self.main_window_frames.data_controls_subframes[0],
+                text='Full Range', command=self.application.action_reset_time_range)
+        )
+
         self.progress_bar = None
 
         self.ui_exists = False
 
-        self.add_new_window('Main', (8, 5))
+        # The figure is not needed until there is data to plot, so let the window appear without waiting for matplotlib
+        self.add_new_window('Main', (8, 5), defer_figure=True)
 
         self.new_data_button = Tk.Button(
             self.main_window_frames.application,
             text='Open CSV Folder', command=self.application.action_new_data)
         self.new_data_button.pack(padx=10, pady=10)
 
+        self.new_data_range_button = Tk.Button(
+            self.main_window_frames.application,
+            text='Open Date Range', command=self.application.action_new_data_range)
+        self.new_data_range_button.pack(padx=10, pady=10)
+
+        self.add_site_button = Tk.Button(
+            self.main_window_frames.application,
+            text='Add Site Folder', command=self.application.action_add_site)
+        self.add_site_button.pack(padx=10, pady=10)
+
+        self.export_button = Tk.Button(
+            self.main_window_frames.application,
+            text='Export Data', command=self.application.action_export)
+        self.export_button.pack(padx=10, pady=10)
+
+        self.follow_checkbox = TkCheckbuttonHelper(
+            self.main_window_frames.application,
+            text='Follow New Data', command=self.application.action_follow)
+        self.follow_checkbox.pack(padx=10, pady=10)
+
+        self.statistics_button = Tk.Button(
+            self.main_window_frames.application,
+            text='Load Statistics', command=self.application.action_load_statistics)
+        self.statistics_button.pack(padx=10, pady=10)
+
         self.about_button = Tk.Button(
             self.main_window_frames.application,
             text='About CSV Viewer', command=self.application.action_about_dialog)
@@ -352,17 +493,48 @@ class GUI:
         self.main_window_frames.plot_select.pack()
         self.main_window_frames.data_controls.pack()
 
-    def reset_and_show_progress_bar(self, folder):
+    def schedule(self, delay_ms, callback):
+        """
+        Calls a function on the Tk thread after a delay. Returns an id that can be passed to cancel_scheduled.
+        Args:
+        delay_ms: The delay in milliseconds
+        callback: The function to call
+        """
+        return self.root.after(delay_ms, callback)
+
+    def cancel_scheduled(self, schedule_id):
+        """
+        Cancels a function call requested by schedule
+        Args:
+        schedule_id: The id returned by schedule
+        """
+        self.root.after_cancel(schedule_id)
+
+    def set_busy(self, key, busy):
+        """
+        Shows a busy cursor over a window while work for it is in progress
+        Args:
+        key: The name of the window
+        busy: True to show the busy cursor, False to restore the normal cursor
+        """
+        try:
+            self.tk_handles.windows[key].config(cursor="watch" if busy else "")
+        except (KeyError, Tk.TclError):
+            pass # Window does not exist (or has been closed)
+
+    def reset_and_show_progress_bar(self, folder, cancel_command=None):
         """
         Creates a new progress bar to show loading files from a folder
         Args:
         folder: Name of the folder
+        cancel_command: If given, a Cancel button (and closing the window) calls this function
         """
 
         self.add_new_window("Progress Bar", (5, 0.5), False, False)
+        window = self.tk_handles.windows["Progress Bar"]
 
         self.progress_bar = TkProgressBarHelper(
-            self.tk_handles.windows["Progress Bar"],
+            window,
             {"text":"Loading from folder '%s'" % folder},
             {},
             orient="horizontal", length="5i", mode="determinate"
@@ -370,6 +542,36 @@ class GUI:
 
         self.progress_bar.pack()
 
+        if cancel_command is not None:
+            Tk.Button(window, text="Cancel", command=cancel_command).pack(pady=5)
+            window.protocol("WM_DELETE_WINDOW", cancel_command)
+
+    def show_text_window(self, key, title, text):
+        """
+        Shows text (e.g. a table of statistics) in its own window, in a fixed width font
+        Args:
+        key: The name of the window (an existing window with this name is replaced)
+        title: The window title
+        text: The text to show
+        """
+        self.kill_window(key)
+        self.add_new_window(key, (0, 0), False, False)
+        window = self.tk_handles.windows[key]
+        window.wm_title(title)
+
+        lines = text.splitlines()
+        text_box = Tk.Text(
+            window, font=("Courier", 9), wrap=Tk.NONE,
+            width=max([len(line) for line in lines] + [40]), height=min(len(lines) + 1, 40))
+        scrollbar = Tk.Scrollbar(window, command=text_box.yview)
+        text_box.config(yscrollcommand=scrollbar.set)
+
+        text_box.insert(Tk.END, text)
+        text_box.config(state=Tk.DISABLED)
+
+        scrollbar.pack(side=Tk.RIGHT, fill=Tk.Y)
+        text_box.pack(side=Tk.LEFT, fill=Tk.BOTH, expand=1)
+
     def set_progress_percent(self, percent):
         """
         Updates the progress bar with a new percentage
@@ -396,7 +598,8 @@ class GUI:
         except KeyError:
             pass
 
-    def add_new_window(self, key, size, add_figure=True, add_nav_toolbar=True):
+    def add_new_window(self, key, size, add_figure=True, add_nav_toolbar=True, defer_figure=False):
+        #pylint: disable=too-many-arguments
         """
         Adds a new Tk window, overwriting if the key already exists
         Args:
@@ -404,20 +607,75 @@ class GUI:
         size: (x, y) tuple of window size in inches
         add_figure: True if a matplotlib figure should be added to the window.
         add_nav_toolbar: True if a matplotlib toolbar should be added to the window.
+        defer_figure: True to create the figure when it is first drawn (space is reserved for it now)
         """
         window = self.root if key == "Main" else Tk.Toplevel(self.root)
         self.tk_handles.windows[key] = window
         self.tk_handles.frames[key] = Tk.Frame(window)
+        self.tk_handles.pending_figures.pop(key, None)
         if add_figure:
-            self.tk_handles.figures[key] = Figure(figsize=size, dpi=100)
+            self.tk_handles.frames[key].config(width=int(size[0] * 100), height=int(size[1] * 100))
+            self.tk_handles.frames[key].pack(side=Tk.TOP, fill=Tk.BOTH, expand=1)
 
-            self.tk_handles.canvases[key] = FigureCanvasTkAgg(
-                self.tk_handles.figures[key], master=window)
-            self.tk_handles.canvases[key].get_tk_widget().pack(side=Tk.TOP, fill=Tk.BOTH, expand=1)
-            if add_nav_toolbar:
-                self.tk_handles.toolbars[key] = NavigationToolbar2TkAgg(
-                    self.tk_handles.canvases[key], window)
-                self.tk_handles.toolbars[key].update()
+            self.tk_handles.pending_figures[key] = (size, add_nav_toolbar)
+            if not defer_figure:
+                self._create_figure(key)
+
+    def _create_figure(self, key):
+        """
+        Creates the pending figure, canvas and toolbar (if requested) for a window
+        Args:
+        key: The name of the window
+        """
+        (size, add_nav_toolbar) = self.tk_handles.pending_figures.pop(key)
+        (figure_class, canvas_class, toolbar_class) = load_matplotlib()
+
+        frame = self.tk_handles.frames[key]
+
+        if self.profile_rendering:
+            # Packed first so that it stays visible when the window is made smaller
+            self.tk_handles.status_labels[key] = Tk.Label(frame, anchor=Tk.W, justify=Tk.LEFT, font=("Courier", 8))
+            self.tk_handles.status_labels[key].pack(side=Tk.BOTTOM, fill=Tk.X)
+            self.render_profiles[key] = RenderProfile(key)
+
+        self.tk_handles.figures[key] = figure_class(figsize=size, dpi=100)
+
+        self.tk_handles.canvases[key] = canvas_class(self.tk_handles.figures[key], master=frame)
+        self.tk_handles.canvases[key].get_tk_widget().pack(side=Tk.TOP, fill=Tk.BOTH, expand=1)
+        if add_nav_toolbar:
+            self.tk_handles.toolbars[key] = toolbar_class(self.tk_handles.canvases[key], frame)
+            self.tk_handles.toolbars[key].update()
+
+        if self.profile_rendering:
+            self._profile_zooming(key)
+
+    def _profile_zooming(self, key):
+        """
+        Profiles the redraws after zooming or panning a figure with its toolbar.
+        These redraws are done by matplotlib, so the time recorded is from releasing the mouse button
+        to the end of the redraw (how long the user waits to see the result).
+        Args:
+        key: The name of the window
+        """
+        canvas = self.tk_handles.canvases[key]
+        released = []
+
+        def on_release(_):
+            """ Notes the time a zoom or pan finished (if the toolbar is in zoom or pan mode) """
+            toolbar = self.tk_handles.toolbars.get(key)
+            if toolbar is not None and toolbar.mode:
+                released[:] = [time.perf_counter()]
+
+        def on_draw(_):
+            """ Records the redraw that followed a zoom or pan """
+            if len(released) > 0:
+                profile = self.render_profiles[key]
+                profile.add_time(CANVAS_PHASE, time.perf_counter() - released.pop())
+                profile.finish(self.tk_handles.figures[key], "Zoom/pan")
+                self.tk_handles.status_labels[key].config(text=profile.last_summary)
+
+        canvas.mpl_connect('button_release_event', on_release)
+        canvas.mpl_connect('draw_event', on_draw)
 
     def get_figure(self, key):
         """
@@ -425,6 +683,9 @@ class GUI:
         Args:
         key: The name of the window to get the handle for
         """
+        if key in self.tk_handles.pending_figures:
+            self._create_figure(key)
+
         try:
             return self.tk_handles.figures[key]
         except KeyError:
@@ -452,10 +713,22 @@ class GUI:
         """ Returns the selected averaging period (seconds, minutes etc.) """
         return self.dataset_controls.get_averaging_time_units()
 
+    def get_averaging_mode(self):
+        """ Returns the selected averaging mode ("Periods" or "Moving") """
+        return self.dataset_controls.get_averaging_mode()
+
+    def get_averaging_show_envelope(self):
+        """ Returns True if the min/max envelope of averaged data should be shown """
+        return self.dataset_controls.get_averaging_show_envelope()
+
     def get_special_action(self):
         """ Returns the current selected special action """
         return self.dataset_controls.get_special_action()
 
+    def get_follow(self):
+        """ Returns True if new data written to the loaded files should be shown as it arrives """
+        return self.follow_checkbox.var.get() == 1
+
     def set_dataset_choices(self, datasets):
         """ Sets the list of possible datasets that can be selected for each plot
         Args:
@@ -488,6 +761,7 @@ class GUI:
         # Signal that the UI is drawn
         self.ui_exists = True
 
+        self.time_range_controls.pack(side=Tk.LEFT, padx=2, pady=2)
         self.dataset_controls.pack(side=Tk.LEFT, padx=2, pady=2)
 
         for frame in self.main_window_frames.data_controls_subframes:
@@ -495,6 +769,22 @@ class GUI:
 
         self.dataset_controls.pack_subplot_controls(side=Tk.LEFT)
 
+    def get_time_range_text(self):
+        """ Returns the (start, end) text entered for the displayed time range """
+        return self.time_range_controls.get_range_text()
+
+    def set_time_range_text(self, start, end):
+        """ Sets the text of the displayed time range entries
+        Args:
+        start: Text for the start of the range
+        end: Text for the end of the range
+        """
+        self.time_range_controls.set_range_text(start, end)
+
+    def get_displayed_fields(self):
+        """ Returns a list of the dataset names displayed on each subplot (None if no dataset is displayed) """
+        return list(self.dataset_controls.subplot_select_dropdowns.current_subplot_names)
+
     def get_index_of_displayed_plot(self, display_name):
         """
         Returns the subplot index (0 to 2) of a plot (or None if name is not displayed)
@@ -509,8 +799,16 @@ class GUI:
         plotter: The plotter object that will do the drwaing
         figure_key: The key of the figure on which to plot
         """
-        plotter.draw(self.tk_handles.figures[figure_key])
-        self.tk_handles.canvases[figure_key].draw()
+        figure = self.get_figure(figure_key)
+        profile = self.render_profiles.get(figure_key)
+
+        plotter.draw(figure, profile)
+        with render_phase(profile, CANVAS_PHASE):
+            self.tk_handles.canvases[figure_key].draw()
+
+        if profile is not None:
+            profile.finish(figure, "Draw", type(plotter).__name__)
+            self.tk_handles.status_labels[figure_key].config(text=profile.last_summary)
 
     def _exit(self):
         """
@@ -0,0 +1,343 @@
+"""
+instrumentation.py
+
+@author: James Fowkes
+
+Timing of the stages of slow operations (e.g. application startup, loading data and drawing plots)
+"""
+
+import json
+import logging
+import threading
+import time
+import tracemalloc
+
+from collections import OrderedDict
+from contextlib import contextmanager, nullcontext
+
+# Time this module was first imported. application.py imports it first, so this is close to the process start.
+PROCESS_START = time.perf_counter()
+
+# Number of files (the slowest) listed in load reports
+FILE_REPORT_COUNT = 10
+
+# Phases of drawing a figure recorded by RenderProfile
+DATA_PREP_PHASE = "Data prep"
+ARTISTS_PHASE = "Artists"
+CANVAS_PHASE = "Canvas draw"
+
+def get_module_logger():
+
+    """ Returns logger for this module """
+    return logging.getLogger(__name__)
+
+class StageTimer:
+
+    """
+    Records the time at which each stage of an operation completes.
+    Stages can be marked from any thread.
+    """
+
+    def __init__(self, name, start=None):
+        """
+        Args:
+        name : Name of the operation (used in the report)
+        start : perf_counter time the operation started (None for now)
+        """
+        self.name = name
+        self.start = time.perf_counter() if start is None else start
+        self.marks = []
+        self._lock = threading.Lock()
+
+    def mark(self, stage):
+        """
+        Records that a stage has completed
+        Args:
+        stage : Name of the stage
+        """
+        with self._lock:
+            self.marks.append((stage, time.perf_counter()))
+
+    def report(self):
+        """ Returns a table of the stages, with the time each took and the total time at which each completed """
+        with self._lock:
+            marks = list(self.marks)
+
+        lines = ["%s timing:" % self.name]
+        previous = self.start
+        for (stage, mark_time) in marks:
+            lines.append("  %-40s %8.3fs (total %8.3fs)" % (stage, mark_time - previous, mark_time - self.start))
+            previous = mark_time
+
+        return "\n".join(lines)
+
+    def log_report(self):
+        """ Logs the report """
+        get_module_logger().info(self.report())
+
+# Stages of application startup
+STARTUP = StageTimer("Startup", PROCESS_START)
+
+class _MemoryTracing:
+
+    """
+    tracemalloc is global to the process, so this counts the loads tracing memory. It is started by the first
+    and stopped when the last one ends (unless it was already running, e.g. with python -X tracemalloc).
+    Peaks can only be measured while a single load is tracing, as they would otherwise include the memory of
+    the other loads, and each load resetting the peak would reset it for the others too.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._users = 0
+        self._started = False
+        # Changes each time a load starts tracing, so a peak that another load overlapped is not used
+        self._generation = 0
+
+    def acquire(self):
+        """ Starts tracing memory for a load """
+        with self._lock:
+            if self._users == 0 and not tracemalloc.is_tracing():
+                tracemalloc.start()
+                self._started = True
+            self._users += 1
+            self._generation += 1
+
+    def release(self):
+        """ Ends tracing memory for a load (stopping tracemalloc after the last load, if acquire started it) """
+        with self._lock:
+            self._users -= 1
+            if self._users == 0 and self._started:
+                tracemalloc.stop()
+                self._started = False
+
+    def reset_peak(self):
+        """ Resets the peak and returns a token for peak (None if more than one load is tracing) """
+        with self._lock:
+            if self._users != 1:
+                return None
+            tracemalloc.reset_peak()
+            return self._generation
+
+    def peak(self, token):
+        """ Returns the peak bytes since reset_peak returned token (None if another load has traced since) """
+        with self._lock:
+            if token is None or self._users != 1 or self._generation != token:
+                return None
+            return tracemalloc.get_traced_memory()[1]
+
+_MEMORY_TRACING = _MemoryTracing()
+
+class LoadTrace:
+
+    """
+    Records the wall time, number of rows and (optionally) peak memory of each stage of loading data,
+    and of reading each file. Records can be added from any thread.
+
+    Peak memory is measured with tracemalloc (which numpy and pandas report their allocations to),
+    as the largest amount of memory allocated during the stage. Tracing memory slows loading,
+    so it is off unless requested. Memory use is for the whole process, so files (which are read in parallel)
+    do not have peaks of their own. Peaks are not recorded for stages run while another load is also tracing
+    memory (e.g. when several folders load at once), as they would include the other load's memory.
+    """
+
+    def __init__(self, name, trace_memory=False):
+        """
+        Args:
+        name : Name of what is being loaded (used in the report)
+        trace_memory : If True, record the peak memory of each stage
+        """
+        self.name = name
+        self.trace_memory = trace_memory
+        self.start = time.perf_counter()
+        self.records = []
+        self._lock = threading.Lock()
+        self._tracing = False
+
+    def begin(self):
+        """ Starts tracing memory (if requested) """
+        if self.trace_memory and not self._tracing:
+            _MEMORY_TRACING.acquire()
+            self._tracing = True
+
+    def end(self):
+        """ Ends tracing memory, if begin started it """
+        if self._tracing:
+            _MEMORY_TRACING.release()
+            self._tracing = False
+
+    def _add(self, kind, name, start, seconds, rows, peak_bytes):
+        #pylint: disable=too-many-arguments
+        """ Adds a record """
+        with self._lock:
+            self.records.append({
+                "kind": kind, "name": name, "start_seconds": start - self.start, "seconds": seconds,
+                "rows": rows, "peak_bytes": peak_bytes})
+
+    @contextmanager
+    def stage(self, name):
+        """
+        Context manager that records the stage run within it.
+        Yields a dict, in which "rows" can be set to the number of rows the stage processed.
+        Args:
+        name : Name of the stage
+        """
+        peak_token = _MEMORY_TRACING.reset_peak() if self._tracing else None
+
+        details = {"rows": None}
+        start = time.perf_counter()
+        yield details
+        seconds = time.perf_counter() - start
+
+        peak_bytes = _MEMORY_TRACING.peak(peak_token)
+        self._add("stage", name, start, seconds, details["rows"], peak_bytes)
+
+    def add_file(self, filename, start, seconds, rows):
+        """
+        Records reading a file
+        Args:
+        filename : Name of the file
+        start : perf_counter time reading started
+        seconds : Time taken to read it
+        rows : Number of rows read
+        """
+        self._add("file", filename, start, seconds, rows, None)
+
+    def get_records(self):
+        """ Returns a copy of the records, in the order they were added """
+        with self._lock:
+            return [dict(record) for record in self.records]
+
+    def report(self):
+        """ Returns a table of the records (stages first, then the slowest files) """
+        records = self.get_records()
+        stages = [record for record in records if record["kind"] == "stage"]
+        files = sorted(
+            (record for record in records if record["kind"] == "file"), key=lambda record: -record["seconds"])
+
+        lines = ["Loading '%s':" % self.name]
+        lines.append("  %-40s %10s %12s %12s" % ("Stage", "Seconds", "Rows", "Peak MB"))
+        for record in stages:
+            lines.append("  %-40s %10.3f %12s %12s" % (
+                record["name"], record["seconds"], "" if record["rows"] is None else record["rows"],
+                "" if record["peak_bytes"] is None else "%.1f" % (record["peak_bytes"] / 1e6)))
+
+        if len(files) > 0:
+            lines.append("  %d files read in %.3fs total (slowest first):" % (
+                len(files), sum(record["seconds"] for record in files)))
+            for record in files[:FILE_REPORT_COUNT]:
+                lines.append("  %-40s %10.3f %12s" % (record["name"], record["seconds"], record["rows"]))
+
+        return "\n".join(lines)
+
+    def log_report(self):
+        """ Logs the report """
+        get_module_logger().info(self.report())
+
+    def save(self, path):
+        """
+        Writes the records to a JSON trace file
+        Args:
+        path : The file to write
+        """
+        with open(path, "w") as trace_file:
+            json.dump({"name": self.name, "records": self.get_records()}, trace_file, indent=1)
+
+def count_vertices(axes):
+    """ Returns the number of vertices of the lines, collections (e.g. shaded envelopes) and patches
+    (e.g. histogram and windrose bars) drawn on a matplotlib axes """
+    count = sum(len(line.get_xydata()) for line in axes.lines)
+    count += sum(len(path.vertices) for collection in axes.collections for path in collection.get_paths())
+    count += sum(len(patch.get_path().vertices) for patch in axes.patches)
+    return count
+
+def axes_label(axes, index):
+    """ Returns the name used for a matplotlib axes in render profiles (its y axis label or title) """
+    return axes.get_ylabel() or axes.get_title() or "Axes %d" % (index + 1)
+
+def render_phase(profile, name, label=None):
+    """
+    Returns a context manager that times a phase of drawing for a RenderProfile,
+    or does nothing if profile is None (so plotters can be drawn with or without profiling)
+    Args:
+    profile : RenderProfile or None
+    name : Name of the phase (e.g. DATA_PREP_PHASE)
+    label : Label of the axes the phase is for (None if it is not for a particular axes)
+    """
+    return nullcontext() if profile is None else profile.phase(name, label)
+
+class RenderProfile:
+
+    """
+    Records how long each phase of drawing a figure takes: preparing the data, creating the
+    matplotlib artists and rendering the canvas, and the number of vertices drawn on each axes.
+    Times are added up over a draw, then finish reports them and starts the next draw.
+    Only used on the Tk thread.
+    """
+
+    def __init__(self, name):
+        """
+        Args:
+        name : Name of the figure (used in the report)
+        """
+        self.name = name
+        self.plot_type = None
+        self.last_summary = ""
+        self._phases = OrderedDict()
+        self._axes_phases = {}
+
+    @contextmanager
+    def phase(self, name, label=None):
+        """
+        Context manager that adds the time taken within it to a phase of the current draw
+        Args:
+        name : Name of the phase
+        label : Label of the axes the phase is for (None if it is not for a particular axes)
+        """
+        start = time.perf_counter()
+        yield
+        self.add_time(name, time.perf_counter() - start, label)
+
+    def add_time(self, name, seconds, label=None):
+        """
+        Adds time to a phase of the current draw
+        Args:
+        name : Name of the phase
+        seconds : The time to add
+        label : Label of the axes the phase is for (None if it is not for a particular axes)
+        """
+        self._phases[name] = self._phases.get(name, 0.0) + seconds
+        if label is not None:
+            axes_phases = self._axes_phases.setdefault(label, OrderedDict())
+            axes_phases[name] = axes_phases.get(name, 0.0) + seconds
+
+    def finish(self, figure, kind, plot_type=None):
+        """
+        Logs the phases and vertex counts of the draw that has just completed, and returns the record of it:
+        {"figure", "kind", "plot_type", "phases": {phase: seconds}, "axes": [{"label", "vertices", "phases"}]}
+        Args:
+        figure : The matplotlib figure that was drawn
+        kind : What caused the draw (e.g. "Draw" or "Zoom/pan")
+        plot_type : The type of plot drawn, e.g. the plotter class name (None for the same as the last draw)
+        """
+        if plot_type is not None:
+            self.plot_type = plot_type
+
+        axes_records = []
+        for (index, axes) in enumerate(figure.get_axes()):
+            label = axes_label(axes, index)
+            axes_records.append({
+                "label": label, "vertices": count_vertices(axes), "phases": dict(self._axes_phases.get(label, {}))})
+
+        record = {
+            "figure": self.name, "kind": kind, "plot_type": self.plot_type,
+            "phases": dict(self._phases), "axes": axes_records}
+        (self._phases, self._axes_phases) = (OrderedDict(), {})
+
+        self.last_summary = "%s %s: %s | %s" % (
+            kind, self.plot_type,
+            ", ".join("%s %.0fms" % (name, seconds * 1000) for (name, seconds) in record["phases"].items()),
+            ", ".join("%s %d vertices" % (axes["label"], axes["vertices"]) for axes in axes_records))
+        get_module_logger().info("Rendered '%s': %s", self.name, self.last_summary)
+
+        return record
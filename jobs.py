@@ -0,0 +1,152 @@
+"""
+jobs.py
+
+@author: James Fowkes
+
+Runs slow computations (averaging, histograms etc.) on worker threads so the GUI stays responsive
+"""
+
+import logging
+import queue
+import itertools
+
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+
+# Default number of worker threads (can be changed in config.ini)
+DEFAULT_WORKERS = 2
+
+# How often the GUI thread checks for finished jobs
+RESULT_POLL_INTERVAL_MS = 50
+
+def get_module_logger():
+
+    """ Returns logger for this module """
+    return logging.getLogger(__name__)
+
+class JobExecutor:
+
+    """
+    Runs computations on a shared, bounded pool of worker threads.
+
+    Each job is submitted for a view (e.g. a subplot or the windrose window). Results are passed
+    back to the GUI thread (by polling with GUI.schedule), so the result handlers can safely draw.
+    Only the latest job for each view matters: submitting a new job for a view cancels the previous
+    one if it has not started, and drops its result if it has.
+
+    While a window has jobs running, the GUI shows it as busy.
+    """
+
+    def __init__(self, gui, config=None):
+        """
+        Args:
+        gui : The GUI (used for scheduling result polling and showing busy windows)
+        config : Optional configparser object
+        """
+        self.gui = gui
+
+        workers = DEFAULT_WORKERS
+        if config is not None:
+            workers = config.getint('JOBS', 'Workers', fallback=DEFAULT_WORKERS)
+
+        self._pool = ThreadPoolExecutor(max_workers=max(workers, 1))
+        self._results = queue.Queue()
+        self._job_ids = itertools.count()
+
+        # The latest job (id, future) for each view
+        self._latest = {}
+
+        # Number of unfinished jobs for each window
+        self._busy_count = Counter()
+
+        self._poll_id = None
+
+    def submit(self, view, window, compute, on_result, on_error=None):
+        #pylint: disable=too-many-arguments
+        """
+        Runs compute() on a worker thread, then on_result(result) on the GUI thread.
+        If a newer job is submitted for the same view first, on_result is not called.
+        Args:
+        view : Hashable key of what the result will be shown in
+        window : Key of the window to show as busy while the job runs (None for no busy indicator)
+        compute : Function (taking no arguments) to run on a worker thread
+        on_result : Function called with the result of compute
+        on_error : Optional function called with the exception if compute raises one
+        """
+        job_id = next(self._job_ids)
+
+        try:
+            (_, superseded) = self._latest[view]
+            superseded.cancel() # Only succeeds if the job has not started yet
+        except KeyError:
+            pass
+
+        future = self._pool.submit(compute)
+        self._latest[view] = (job_id, future)
+
+        if window is not None:
+            self._busy_count[window] += 1
+            self.gui.set_busy(window, True)
+
+        # Done callbacks run on the worker thread (or this one, if already done), so just queue the result
+        future.add_done_callback(
+            lambda finished: self._results.put((view, window, job_id, finished, on_result, on_error)))
+
+        if self._poll_id is None:
+            self._poll_id = self.gui.schedule(RESULT_POLL_INTERVAL_MS, self._handle_results)
+
+    def discard(self, view):
+        """
+        Forgets the latest job for a view (e.g. because the view has been updated directly),
+        so its result is dropped
+        Args:
+        view : Key of the view
+        """
+        try:
+            (_, future) = self._latest.pop(view)
+            future.cancel()
+        except KeyError:
+            pass
+
+    def _handle_results(self):
+        """ Passes results of finished jobs to their handlers (runs on the GUI thread) """
+
+        self._poll_id = None
+
+        while True:
+            try:
+                (view, window, job_id, future, on_result, on_error) = self._results.get_nowait()
+            except queue.Empty:
+                break
+
+            if window is not None:
+                self._busy_count[window] -= 1
+                if self._busy_count[window] <= 0:
+                    del self._busy_count[window]
+                    self.gui.set_busy(window, False)
+
+            if future.cancelled():
+                continue
+
+            if self._latest.get(view, (None, None))[0] != job_id:
+                get_module_logger().info("Dropping stale result for %s", view)
+                continue
+
+            del self._latest[view]
+
+            exc = future.exception()
+            if exc is None:
+                on_result(future.result())
+            elif on_error is not None:
+                on_error(exc)
+            else:
+                get_module_logger().error("Job for %s failed (%s)", view, exc)
+
+        if self._latest or self._busy_count:
+            self._poll_id = self.gui.schedule(RESULT_POLL_INTERVAL_MS, self._handle_results)
+
+    def shutdown(self):
+        """ Cancels jobs that have not started and stops the worker threads once running jobs finish """
+        for (_, future) in self._latest.values():
+            future.cancel()
+        self._pool.shutdown(wait=False)
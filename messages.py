@@ -0,0 +1,62 @@
+"""
+messages.py
+
+@author: James Fowkes
+
+Messages sent from the data manager thread to the application
+"""
+
+#pylint: disable=too-few-public-methods
+class ProgressMessage:
+
+    """ Loading progress update """
+
+    def __init__(self, percent):
+        """
+        Args:
+        percent : Percentage of loading complete (0 to 100)
+        """
+        self.percent = percent
+
+class PartialResultMessage:
+
+    """ Some of the data has been loaded and can be displayed while loading continues """
+
+    def __init__(self, percent):
+        """
+        Args:
+        percent : Percentage of loading complete (0 to 100)
+        """
+        self.percent = percent
+
+class ErrorMessage:
+
+    """ Loading failed. No further messages will be sent. """
+
+    def __init__(self, exception):
+        """
+        Args:
+        exception : The exception that stopped the load
+        """
+        self.exception = exception
+
+class LoadStatisticsMessage:
+
+    """ Timing (and memory use) of each stage of a load and each file read. Sent just before CompleteMessage. """
+
+    def __init__(self, folder, records, report):
+        """
+        Args:
+        folder : The folder that was loaded
+        records : List of dicts, one per stage or file (see instrumentation.LoadTrace)
+        report : The records formatted as a table of text
+        """
+        self.folder = folder
+        self.records = records
+        self.report = report
+
+class CompleteMessage:
+
+    """ Loading and conversion of all data is complete. No further messages will be sent. """
+
+    pass
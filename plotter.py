@@ -7,21 +7,95 @@ Defines a data plotter for the CSV viewer application using
 
 """
 
-from windrose import WindroseAxes
+import numpy as np
+
+from instrumentation import render_phase, DATA_PREP_PHASE, ARTISTS_PHASE
+
+# windrose (and the parts of matplotlib it uses) is imported on first use, to speed up startup
+
+# Windrose speed bins and direction sectors
+WINDROSE_BIN_COUNT = 6
+WINDROSE_SECTORS = 16
+
+# Number of bars in windspeed histograms
+HISTOGRAM_BIN_COUNT = 50
 
 #pylint: disable=too-few-public-methods
 class InvalidDataException(Exception):
     """ Just rename the base exception class """
     pass
 
+def break_at_gaps(times, data, gaps):
+    """
+    Returns (times, data) with a NaN point inserted in the middle of each gap,
+    so that matplotlib breaks the plotted line there instead of drawing across the gap.
+    The original arrays are returned unchanged if there are no gaps.
+    Args:
+    times - the timestamps for the data (numpy datetime64 array)
+    data - the data
+    gaps - positions of gaps (a position i means a gap between points i and i+1)
+    """
+    if gaps is None or len(gaps) == 0:
+        return (times, data)
+
+    #pylint: disable=no-member
+    positions = gaps + 1
+    break_times = times[gaps] + (times[positions] - times[gaps]) // 2
+    times = np.insert(times, positions, break_times)
+    data = np.insert(np.asarray(data, dtype=np.float64), positions, np.nan)
+    #pylint: enable=no-member
+
+    return (times, data)
+
+def windrose_table(speed, direction):
+    """
+    Returns (bins, table) for drawing a windrose with WindPlotter.set_table.
+    This is the slow part of plotting a windrose, and does not use matplotlib,
+    so it can be run on a worker thread.
+    Args:
+    speed - The speed data
+    direction - The direction data (same length as speed)
+    """
+    from windrose import histogram
+
+    if len(speed) != len(direction):
+        raise InvalidDataException(
+            "Length of direction (%d) and speed (%d) lists are not equal" % (len(direction), len(speed)))
+
+    bins = np.linspace(np.min(speed), np.max(speed), WINDROSE_BIN_COUNT)
+    return (bins, histogram(direction, speed, bins, WINDROSE_SECTORS, normed=True))
+
+def histogram_table(windspeed):
+    """
+    Returns (density, edges) for drawing a histogram with Histogram.set_table.
+    density is normalised so that the total area of the bars is 1.
+    Does not use matplotlib, so it can be run on a worker thread.
+    Args:
+    windspeed - The speed data (NaN values are ignored)
+    """
+    windspeed = np.asarray(windspeed, dtype=np.float64)
+    windspeed = windspeed[np.isfinite(windspeed)]
+    if len(windspeed) == 0:
+        return (np.zeros(0), np.zeros(0))
+
+    (density, edges) = np.histogram(windspeed, HISTOGRAM_BIN_COUNT, density=True)
+    return (density, edges)
+
 class DataSet:
 
-    """ Simple object to store data, timestamps and a label for the data """
+    """ Simple object to store data, timestamps and a label for the data
+    An optional (lower, upper) envelope can be stored to shade the range of the data (e.g. min/max)
+    Optional gap positions can be stored so that lines are not drawn across gaps in the data
+    An optional legend label identifies the data when several datasets share a subplot """
 
-    def __init__(self, ylabel, data, times):
+    def __init__(self, ylabel, data, times, envelope=None, gaps=None, legend=None):
+        #pylint: disable=too-many-arguments
         self.ylabel = ylabel
         self.data = data
         self.times = times
+        self.envelope = envelope
+        self.gaps = gaps
+        self.legend = legend
 
 class WindPlotter:
 
@@ -30,8 +104,7 @@ class WindPlotter:
     def __init__(self, config):
         """ Initialise the wind plotter """
         self.config = config
-        self.windspeed = None
-        self.direction = None
+        self.table = None
 
     def set_data(self, speed, direction):
         """
@@ -40,43 +113,52 @@ class WindPlotter:
         direction - The direction data to display
         len(speed) must equal len(direction)
         """
+        self.set_table(windrose_table(speed, direction))
+
+    def set_table(self, table):
+        """
+        Args:
+        table - (bins, table) from windrose_table
+        """
+        self.table = table
 
-        if len(speed) == len(direction):
-            self.windspeed = speed
-            self.direction = direction
-        else:
-            raise InvalidDataException(
-                "Length of direction (%d) and speed (%d) lists are not equal" % (len(direction), len(speed)))
+    def draw(self, fig, profile=None):
 
-    def draw(self, fig):
+        """ Draw windrose plot of current data on figure
+        Args:
+        fig - The figure to draw on
+        profile - Optional RenderProfile to record the time taken in
+        """
 
-        """ Draw windrose plot of current data on figure """
+        from windrose import WindroseAxes
 
-        try:
-            axes = WindroseAxes(fig, rect=[0.1, 0.1, 0.8, 0.8])
-            fig.add_axes(axes)
+        with render_phase(profile, ARTISTS_PHASE):
+            try:
+                axes = WindroseAxes(fig, rect=[0.1, 0.1, 0.8, 0.8])
+                fig.add_axes(axes)
 
-            axes.bar(self.direction, self.windspeed, normed=True)
+                (bins, table) = self.table
+                axes.bar(None, None, bins=bins, nsector=WINDROSE_SECTORS, histogram=table)
 
-            axes.set_title("Windrose (by % in 6 bins)")
-            legend = axes.legend(borderaxespad=-0.10, fontsize=8, bbox_to_anchor=(-0.2, 0))
+                axes.set_title("Windrose (by % in 6 bins)")
+                legend = axes.legend(borderaxespad=-0.10, fontsize=8, bbox_to_anchor=(-0.2, 0))
 
-            legend_title = "Wind Speed"
+                legend_title = "Wind Speed"
 
-            try:
-                units = self.config['UNITS'] # Get unit strings from config
                 try:
-                    #Try adding a unit to the legend title
-                    legend_title = legend_title + " " + units["Wind Speed"].strip()
-                except KeyError:
-                    pass #If no unit exists, just use the axis label with no units
+                    units = self.config['UNITS'] # Get unit strings from config
+                    try:
+                        #Try adding a unit to the legend title
+                        legend_title = legend_title + " " + units["Wind Speed"].strip()
+                    except KeyError:
+                        pass #If no unit exists, just use the axis label with no units
 
-            except (KeyError, ValueError):
-                pass # If no units exists, or the config isn't valid, just use title without units
+                except (KeyError, ValueError):
+                    pass # If no units exists, or the config isn't valid, just use title without units
 
-            legend.set_title(legend_title, prop={"size":8})
-        except:
-            raise
+                legend.set_title(legend_title, prop={"size":8})
+            except:
+                raise
 
 class Histogram:
 
@@ -85,25 +167,40 @@ class Histogram:
     def __init__(self, config):
         """ Initialise the histogram """
         self.config = config
-        self.windspeed = None
+        self.table = None
 
     def set_data(self, windspeed):
         """
         Args:
         speed - The speed data to display
         """
-        self.windspeed = windspeed
+        self.set_table(histogram_table(windspeed))
+
+    def set_table(self, table):
+        """
+        Args:
+        table - (density, edges) from histogram_table
+        """
+        self.table = table
 
-    def draw(self, fig):
+    def draw(self, fig, profile=None):
 
-        """ Draw histogram of current data on figure """
+        """ Draw histogram of current data on figure
+        Args:
+        fig - The figure to draw on
+        profile - Optional RenderProfile to record the time taken in
+        """
 
-        axes = fig.add_subplot(111)
-        axes.hist(self.windspeed, 50, normed=1)
+        with render_phase(profile, ARTISTS_PHASE):
+            axes = fig.add_subplot(111)
+            (density, edges) = self.table
+            if len(edges) > 0:
+                # The bars are already computed, so draw each bin as a single weighted value
+                axes.hist(edges[:-1], edges, weights=density)
 
-        axes.set_xlabel("Wind Speed")
-        axes.set_ylabel("Frequency (%)")
-        axes.grid(True)
+            axes.set_xlabel("Wind Speed")
+            axes.set_ylabel("Frequency (%)")
+            axes.grid(True)
 
 class Plotter:
 
@@ -116,6 +213,12 @@ class Plotter:
         """
         self.config = config
         self.suspend = False
+        self.keep_view = False
+
+        # Axes from the last draw, and the limits they were autoscaled to (to tell if the user has zoomed)
+        self.axes = {}
+        self.autoscaled_limits = {}
+
         self.clear_data()
 
     def suspend_draw(self, suspend):
@@ -125,6 +228,26 @@ class Plotter:
         """
         self.suspend = suspend
 
+    def preserve_view(self, keep_view):
+        """
+        Args:
+        keep_view - If true, redrawing keeps any zoom or pan the user has applied to each subplot
+        (e.g. while more data arrives). Subplots the user has not zoomed are autoscaled as usual.
+        """
+        self.keep_view = keep_view
+
+    def _get_user_views(self):
+        """
+        Returns {subplot index: (xlim, ylim)} of the subplots drawn last time.
+        Each limit is None unless it has been changed (by zooming or panning) since it was drawn.
+        """
+        views = {}
+        for (idx, axis) in self.axes.items():
+            (auto_xlim, auto_ylim) = self.autoscaled_limits[idx]
+            (xlim, ylim) = (axis.get_xlim(), axis.get_ylim())
+            views[idx] = (xlim if xlim != auto_xlim else None, ylim if ylim != auto_ylim else None)
+        return views
+
     def clear_data(self):
         """
         Clears all subplots and associated data
@@ -152,19 +275,39 @@ class Plotter:
 
         return label
 
-    def set_dataset(self, times, dataset, axis_label, field_index):
+    def set_dataset(self, times, dataset, axis_label, field_index, envelope=None, gaps=None):
+        #pylint: disable=too-many-arguments
         """
         For a particular subplot, set its data, timestamps and label.
+        The arrays are stored (not copied), so read-only views from the data manager can be passed directly.
         Args:
         times - the timestamps for the data
         dataset - the data
         axis_label - label for the y-axis (units will be applied)
         field_index - the subplot index (0 to 2). Values outside this range will produce no effects
+        envelope - optional (lower, upper) data to draw as a shaded band around the data (e.g. min/max)
+        gaps - optional positions of gaps in the data (where the line should be broken)
         """
 
         if field_index < 3:
             axis_label = self.apply_units_to_axis_label(axis_label)
-            self.subplot_data[field_index] = DataSet(axis_label, dataset, times)
+            self.subplot_data[field_index] = [DataSet(axis_label, dataset, times, envelope, gaps)]
+
+    def set_overlay(self, series, axis_label, field_index):
+        """
+        For a particular subplot, set several datasets to draw on the same axes (e.g. one per site).
+        The arrays are stored (not copied).
+        Args:
+        series - list of (legend label, times, data, envelope, gaps) for each dataset (see set_dataset)
+        axis_label - label for the y-axis (units will be applied)
+        field_index - the subplot index (0 to 2). Values outside this range will produce no effects
+        """
+
+        if field_index < 3:
+            axis_label = self.apply_units_to_axis_label(axis_label)
+            self.subplot_data[field_index] = [
+                DataSet(axis_label, data, times, envelope, gaps, legend)
+                for (legend, times, data, envelope, gaps) in series]
 
     def set_visibility(self, plot_index, show):
         """
@@ -176,32 +319,73 @@ class Plotter:
         if plot_index < 3:
             self.subplot_visible[plot_index] = show
 
-    def draw(self, fig):
+    def draw(self, fig, profile=None):
 
-        """ Draws this plot on provided figure """
+        """ Draws this plot on provided figure
+        Args:
+        fig - The figure to draw on
+        profile - Optional RenderProfile to record the time taken by each subplot in
+        """
         if self.suspend:
             return # Drawing has been suspended
 
+        views = self._get_user_views() if self.keep_view else {}
+
         fig.clf()
+        self.axes = {}
+        self.autoscaled_limits = {}
 
         first_axis = None
         plot_count = 0
         for idx in range(3):
             if self.subplot_visible[idx]: #Only show visible plots
 
-                #sharex parameter means axes will zoom as one w.r.t x-axis
-                axis = fig.add_subplot(self.visible_count, 1, plot_count+1, sharex=first_axis)
+                datasets = self.subplot_data[idx]
+                label = datasets[0].ylabel
+
+                with render_phase(profile, ARTISTS_PHASE, label):
+                    #sharex parameter means axes will zoom as one w.r.t x-axis
+                    axis = fig.add_subplot(self.visible_count, 1, plot_count+1, sharex=first_axis)
+                    axis.tick_params(axis='both', which='major', labelsize=10)
 
-                axis.tick_params(axis='both', which='major', labelsize=10)
-                axis.plot(self.subplot_data[idx].times, self.subplot_data[idx].data)
-                axis.set_ylabel(self.subplot_data[idx].ylabel, fontsize=10)
+                for dataset in datasets:
+                    with render_phase(profile, DATA_PREP_PHASE, label):
+                        (times, data) = break_at_gaps(dataset.times, dataset.data, dataset.gaps)
+                        if dataset.envelope is not None:
+                            # The envelope is broken at the same gaps (fill_between leaves out NaN points)
+                            (_, lower) = break_at_gaps(dataset.times, dataset.envelope[0], dataset.gaps)
+                            (_, upper) = break_at_gaps(dataset.times, dataset.envelope[1], dataset.gaps)
+
+                    with render_phase(profile, ARTISTS_PHASE, label):
+                        lines = axis.plot(times, data, label=dataset.legend)
+                        if dataset.envelope is not None:
+                            axis.fill_between(
+                                times, lower, upper, facecolor=lines[0].get_color(), alpha=0.3, linewidth=0)
+
+                with render_phase(profile, ARTISTS_PHASE, label):
+                    axis.set_ylabel(label, fontsize=10)
+
+                    if any(dataset.legend is not None for dataset in datasets):
+                        axis.legend(fontsize=8, loc="best")
 
                 #Save the first subplot so that other plots can share its x axis
                 first_axis = axis if idx == 0 else first_axis
+                self.axes[idx] = axis
 
                 #Keep track of number of visible plots
                 plot_count += 1
 
+        # Limits are only final once all the plots sharing the x axis have been drawn
+        for (idx, axis) in self.axes.items():
+            self.autoscaled_limits[idx] = (axis.get_xlim(), axis.get_ylim())
+
+        for (idx, (xlim, ylim)) in views.items():
+            if idx in self.axes:
+                if xlim is not None:
+                    self.axes[idx].set_xlim(xlim)
+                if ylim is not None:
+                    self.axes[idx].set_ylim(ylim)
+
         fig.autofmt_xdate() # Nice formatting for dates (diagonal, only on bottom axis)
 
     @property
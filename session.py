@@ -0,0 +1,251 @@
+"""
+session.py
+
+@author: James Fowkes
+
+A session of data loaded from one or more folders (sites), for comparing sites in one window
+"""
+
+import os
+import logging
+
+from collections import OrderedDict
+
+import numpy as np
+
+from export import export_groups, DEFAULT_CHUNK_ROWS
+
+# Separates the site name from the dataset name in display names (e.g. "Roof: Wind Speed")
+SITE_SEPARATOR = ": "
+
+# Site name used for datasets that overlay the same channel from every site on one subplot
+OVERLAY_SITE = "All sites"
+
+def get_module_logger():
+
+    """ Returns logger for this module """
+    return logging.getLogger(__name__)
+
+class Session:
+
+    """
+    Holds a DataManager for each site (folder) that has been loaded.
+    Each site is loaded by its own DataManager thread, so several sites can load at once.
+
+    With one site, datasets have the DataManager's display names, as if there were no session.
+    With more than one, each dataset name is prefixed with its site (e.g. "Roof: Wind Speed"),
+    and channels that more than one site has can also be shown together ("All sites: Wind Speed").
+    Unprefixed names always refer to the first site.
+
+    The session only looks up data in the data managers, so no data is copied.
+    """
+
+    def __init__(self, config=None):
+        """
+        Args:
+        config : Optional configparser object
+        """
+        self.config = config
+        self.managers = OrderedDict()
+
+    def unique_site_name(self, folder, reserved=()):
+        """ Returns a name for a site loaded from a folder (the folder name, numbered if already used)
+        Args:
+        folder : The folder the site is loaded from
+        reserved : Names of other sites that will be added (e.g. ones still loading)
+        """
+        name = os.path.basename(os.path.normpath(folder)) or folder
+        (site, number) = (name, 2)
+        while site in self.managers or site in reserved or site == OVERLAY_SITE:
+            (site, number) = ("%s (%d)" % (name, number), number + 1)
+        return site
+
+    def set_site(self, site, data_manager):
+        """ Adds (or replaces) a site
+        Args:
+        site : Name of the site
+        data_manager : DataManager with the data for the site
+        """
+        self.managers[site] = data_manager
+
+    def sites(self):
+        """ Returns the site names, in the order they were added """
+        return list(self.managers.keys())
+
+    def is_loaded(self, data_manager):
+        """ Returns True if a data manager is one of the session's sites """
+        return any(manager is data_manager for manager in self.managers.values())
+
+    def __len__(self):
+        return len(self.managers)
+
+    def _qualified(self, site, display_name):
+        """ Returns the session's display name for a dataset of a site """
+        return display_name if len(self.managers) == 1 else site + SITE_SEPARATOR + display_name
+
+    def _split(self, display_name):
+        """ Returns (site, data manager display name) of a session display name (site is None if there is none) """
+        (site, separator, name) = display_name.partition(SITE_SEPARATOR)
+        if separator and (site in self.managers or site == OVERLAY_SITE):
+            return (site, name)
+        return (None, display_name)
+
+    def _resolve(self, display_name):
+        """ Returns (data manager, display name) of a session display name of a single site's dataset """
+        (site, name) = self._split(display_name)
+        if site == OVERLAY_SITE:
+            raise KeyError("'%s' has data from more than one site" % display_name)
+        if site is None:
+            site = next(iter(self.managers))
+        return (self.managers[site], name)
+
+    def is_overlay(self, display_name):
+        """ Returns True if a display name is of a channel overlaid from all sites """
+        return self._split(display_name)[0] == OVERLAY_SITE
+
+    def channel_name(self, display_name):
+        """ Returns the dataset name without its site (e.g. "Wind Speed" for "Roof: Wind Speed") """
+        return self._split(display_name)[1]
+
+    def qualified_name(self, display_name):
+        """ Returns the current session display name for a display name, which may be from before
+        other sites were added (when it had no site prefix) """
+        if self.is_overlay(display_name):
+            return display_name
+        return self.sibling_name(display_name, self.channel_name(display_name))
+
+    def members(self, display_name):
+        """ Returns [(site, display name)] of the single site datasets shown by a dataset:
+        one for each site that has the channel for an overlay, otherwise just the dataset itself
+        Args:
+        display_name : A session display name (e.g. "Roof: Wind Speed" or "All sites: Wind Speed")
+        """
+        (site, name) = self._split(display_name)
+        if site is None:
+            site = next(iter(self.managers))
+        if site != OVERLAY_SITE:
+            return [(site, self._qualified(site, name))]
+
+        return [
+            (site, self._qualified(site, name)) for (site, manager) in self.managers.items()
+            if name in manager.get_numeric_display_names()]
+
+    def sibling_name(self, display_name, other_display_name):
+        """ Returns the session display name of another dataset from the same site as a dataset
+        (e.g. the wind direction recorded with a wind speed)
+        Args:
+        display_name : A session display name
+        other_display_name : The data manager display name of the other dataset
+        """
+        (site, _) = self._split(display_name)
+        if site is None or site == OVERLAY_SITE:
+            site = next(iter(self.managers))
+        return self._qualified(site, other_display_name)
+
+    def get_numeric_display_names(self):
+        """ Returns display names of the numeric datasets of all sites,
+        followed by overlays of the channels that more than one site has """
+        names = []
+        channel_counts = OrderedDict()
+        for (site, manager) in self.managers.items():
+            for name in manager.get_numeric_display_names():
+                names.append(self._qualified(site, name))
+                channel_counts[name] = channel_counts.get(name, 0) + 1
+
+        names.extend(
+            OVERLAY_SITE + SITE_SEPARATOR + name for (name, count) in channel_counts.items() if count > 1)
+        return names
+
+    def get_numeric_field_names(self):
+        """ Returns the numeric field names of the first site """
+        return next(iter(self.managers.values())).get_numeric_field_names()
+
+    def get_display_name(self, field_name):
+        """ Returns the session display name of a field of the first site """
+        (site, manager) = next(iter(self.managers.items()))
+        return self._qualified(site, manager.get_display_name(field_name))
+
+    def get_special_dataset_options(self, display_name):
+        """ Returns the special capabilities of a dataset (None for overlays) """
+        if self.is_overlay(display_name):
+            return None
+        (manager, name) = self._resolve(display_name)
+        return manager.get_special_dataset_options(name)
+
+    def get_time_span(self):
+        """ Returns (first, last) timestamps over all sites as datetime64 values (None if there is no data) """
+        spans = [manager.get_time_span() for manager in self.managers.values()]
+        firsts = [first for (first, _) in spans if first is not None]
+        lasts = [last for (_, last) in spans if last is not None]
+
+        if len(firsts) == 0:
+            return (None, None)
+
+        return (np.min(firsts), np.max(lasts))
+
+    def get_timestamps(self, display_name, start=None, end=None):
+        """ Returns timestamps of a site's dataset (see DataManager.get_timestamps) """
+        (manager, name) = self._resolve(display_name)
+        return manager.get_timestamps(name, start, end)
+
+    def get_dataset(self, display_name, start=None, end=None):
+        """ Returns data of a site's dataset (see DataManager.get_dataset) """
+        (manager, name) = self._resolve(display_name)
+        return manager.get_dataset(name, start, end)
+
+    def get_gaps(self, display_name, start=None, end=None):
+        """ Returns gap positions of a site's dataset (see DataManager.get_gaps) """
+        (manager, name) = self._resolve(display_name)
+        return manager.get_gaps(name, start, end)
+
+    def get_aligned(self, display_name_a, display_name_b, start=None, end=None):
+        """ Returns two datasets of the same site paired by time (see DataManager.get_aligned) """
+        (manager, name_a) = self._resolve(display_name_a)
+        (manager_b, name_b) = self._resolve(display_name_b)
+        if manager_b is not manager:
+            raise KeyError("'%s' and '%s' are from different sites" % (display_name_a, display_name_b))
+        return manager.get_aligned(name_a, name_b, start, end)
+
+    def get_dataset_statistics(self, display_name, average_time_seconds, start=None, end=None):
+        """ Returns averaged statistics of a site's dataset (see DataManager.get_dataset_statistics) """
+        (manager, name) = self._resolve(display_name)
+        return manager.get_dataset_statistics(name, average_time_seconds, start, end)
+
+    def get_dataset_rolling(self, display_name, window_seconds, start=None, end=None):
+        """ Returns moving average statistics of a site's dataset (see DataManager.get_dataset_rolling) """
+        (manager, name) = self._resolve(display_name)
+        return manager.get_dataset_rolling(name, window_seconds, start, end)
+
+    def read_new_data(self):
+        """ Reads new rows for every site (see DataManager.read_new_data). Returns the total number of new rows. """
+        return sum(manager.read_new_data() for manager in self.managers.values())
+
+    def export(self, path, average_time_seconds=None, start=None, end=None, compression=None):
+        """ Writes the numeric datasets of all sites to a Parquet, Feather, HDF5 or npz file (chosen by the file
+        extension), a chunk of rows at a time (see export.export_groups).
+        Raises ExportError if the format is not supported or needs a package that is not installed.
+        With more than one site, each group of datasets is prefixed with its site
+        (e.g. "Roof/Data" in npz files, or a Roof_Data table in HDF5 files).
+        Args:
+        path : The file to write
+        average_time_seconds : Period to average the data over (None to export the raw data)
+        start : Earliest timestamp to export (None for no limit)
+        end : Latest timestamp to export (None for no limit)
+        compression : Compression codec (None for the format's default, "none" for no compression)
+        """
+        #pylint: disable=too-many-arguments
+        chunk_rows = DEFAULT_CHUNK_ROWS
+        if self.config is not None:
+            chunk_rows = self.config.getint('EXPORT', 'ChunkRows', fallback=DEFAULT_CHUNK_ROWS)
+
+        groups = []
+        for (site, manager) in self.managers.items():
+            for (group_name, timestamps, columns) in manager.get_export_groups(
+                    None, average_time_seconds, 'mean', start, end):
+                if len(self.managers) > 1:
+                    group_name = site + "/" + group_name
+                groups.append((group_name, timestamps, columns))
+
+        export_groups(path, groups, chunk_rows, compression)
+
+        get_module_logger().info("Exported data from %d sites to '%s'", len(self.managers), path)
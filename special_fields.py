@@ -29,10 +29,15 @@ class SpecialField(object):
         self.display_name = display_name
 
     @abc.abstractmethod
-    def convert(self, dataframe):
+    def convert(self, timestamps, values):
         """
         Converts data and timestamps as required
         To be overridden by subclasses
+        Args:
+        timestamps : numpy datetime64 array of timestamps for the data
+        values : numpy array of the data
+        Returns (timestamps, values). If the timestamps are unchanged, the same timestamps object
+        must be returned, so that the data manager can keep the field on its shared time index.
         """
         return
 
@@ -60,16 +65,15 @@ class Humidity(SpecialField):
         """
         SpecialField.__init__(self, field_name, "Humidity")
 
-    def convert(self, dataframe):
+    def convert(self, timestamps, values):
 
         """
         Humidity comes in as decimal from 0 to 1.0. Convert to 0 to 100%
         Args:
-        dataframe : The data to convert
+        timestamps : The timestamps of the data (unchanged)
+        values : The data to convert
         """
-        new_dataframe = dataframe * 100
-
-        return new_dataframe
+        return (timestamps, values * 100)
 
 
     def capabilities(self, _):
@@ -87,16 +91,19 @@ class Windspeed(SpecialField):
     2. Convert pulses-per-second into meters per second by applying a fixed calibration factor
     """
 
-    def __init__(self, field_name, calibration_factor):
+    def __init__(self, field_name, calibration_factor, max_delta_seconds=None):
         """
         Args:
         field_name: The fieldname of the humidity field
         calibration_factor : The number to multiply each data point by to get m/s
+        max_delta_seconds : Longest time between two timestamps that a pulse count can be converted over.
+            Counts following a longer gap (e.g. logger offline) are discarded. None for no limit.
         """
         self.factor = calibration_factor
+        self.max_delta_seconds = max_delta_seconds
         SpecialField.__init__(self, field_name, "Wind Speed")
 
-    def convert(self, dataframe):
+    def convert(self, timestamps, values):
 
         """
         Conversion to m/s speed is a two stage process:
@@ -111,8 +118,12 @@ class Windspeed(SpecialField):
         This is done because there is no way to determine how the time period over which
         the pulse data was gathered
 
+        Datapoints after a gap longer than max_delta_seconds are also discarded, as the pulses
+        were not counted over the whole gap.
+
         Args:
-        dataframe : The dataframe to convert
+        timestamps : The timestamps of the pulse counts
+        values : The pulse counts to convert
         """
 
         # Convert timestamps to time deltas
@@ -121,29 +132,30 @@ class Windspeed(SpecialField):
         # http://stackoverflow.com/questions/20553551/how-do-i-get-pylint-to-recognize-numpy-members
         # This suggests that another astroid version can do this, so check in the future.
         #pylint: disable=no-member
-        diffs = np.diff(dataframe.index)
+        diffs = np.diff(timestamps)
         deltas_seconds = diffs/np.timedelta64(1, 's')
-        #pylint: enable=no-member
-        # Use deltas to calculate windspeed
-        windspeed = list(dataframe[self.field_name].values)
-
-        # Apply the constant calibration factor
-        windspeed = [pulses * self.factor for pulses in windspeed[1:]]
 
-        # Divide by the delta to get m/s
-        speeds = [speed/delta for speed, delta in zip(windspeed, list(deltas_seconds))]
+        # Apply the constant calibration factor and divide by the delta to get m/s
+        speeds = values[1:] * self.factor / deltas_seconds
 
         # Need to re-index these data to time points in middle of timestamps
-        old_timestamps = list(dataframe.index.values)[:-1]
-        new_timestamps = old_timestamps + (diffs / 2)
-        return pd.DataFrame({self.field_name:speeds}, index=new_timestamps)
+        new_timestamps = timestamps[:-1] + (diffs / 2)
+
+        if self.max_delta_seconds is not None:
+            valid = deltas_seconds <= self.max_delta_seconds
+            speeds = speeds[valid]
+            new_timestamps = new_timestamps[valid]
+        #pylint: enable=no-member
+
+        return (new_timestamps, speeds)
 
     def capabilities(self, manager):
         """ Returns a list of the special functions that can be performed with this dataset """
 
         caps = ["Histogram"] # Can always do histogram with this data
 
-        if manager.has_dataset("Direction") and manager.len("Direction") == manager.len("Wind Speed"):
+        # Speed and direction are paired by time (see DataManager.get_aligned), so lengths do not need to match
+        if manager.has_dataset("Direction") and manager.len("Direction") > 0:
             caps.append("Windrose")
 
         return caps
@@ -160,31 +172,34 @@ class WindDirection(SpecialField):
         """
         SpecialField.__init__(self, field_name, "Direction")
 
-    def convert(self, dataframe):
+    def convert(self, timestamps, values):
         """
         Maps cardinal compass directions to degrees
         Args:
-        dataframe : The dataframe to convert
+        timestamps : The timestamps of the direction data
+        values : The directions to convert
         """
 
-        # Map cardinal points to degrees (replaced with "not a number" 'D' entry)
-
         # pylint's underlying astroid library cannot find numpy functions
         # So disable then re-enable warning.
         # http://stackoverflow.com/questions/20553551/how-do-i-get-pylint-to-recognize-numpy-members
         # This suggests that another astroid version can do this, so check in the future.
         #pylint: disable=no-member
-        cardinal_to_deg_map = {'N':0, 'NE':45, 'E':90, 'SE':135, 'S':180, 'SW':225, 'W':270, 'NW':315, 'D':np.nan}
-        #pylint: enable=no-member
-        dataframe = dataframe.replace({'Direction':cardinal_to_deg_map})
+        if values.dtype.kind in 'biufc':
+            # Already in degrees
+            degrees = values.astype(np.float64)
+        else:
+            # Map cardinal points to degrees (unknown entries, including the 'D' entry, become "not a number")
+            cardinal_to_deg_map = {'N':0, 'NE':45, 'E':90, 'SE':135, 'S':180, 'SW':225, 'W':270, 'NW':315}
+            degrees = pd.Series(values).map(cardinal_to_deg_map).values.astype(np.float64)
 
         # Drop first point (since this data will be plotted against windspeed which drops first point also)
-        dataframe = dataframe.ix[1:]
-
-        # Drop any NaNs
-        dataframe = dataframe.dropna()
+        # and any NaNs
+        valid = ~np.isnan(degrees)
+        valid[:1] = False
+        #pylint: enable=no-member
 
-        return dataframe
+        return (timestamps[valid], degrees[valid])
 
     def capabilities(self, _):
         """ Wind direction has no special capabilities
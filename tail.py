@@ -0,0 +1,66 @@
+"""
+tail.py
+
+@author: James Fowkes
+
+Reads the rows appended to CSV files that are still being written by a logger
+"""
+
+import io
+import os
+
+from data_files import read_data_csv
+
+class TailReader:
+
+    """
+    Remembers how far through a CSV file has been read (as a byte offset),
+    so each read only parses the lines appended since the last one.
+
+    Only complete lines are read. A line the logger is part way through writing
+    is left for the next read.
+    """
+
+    def __init__(self, path, offset=None):
+        """
+        Args:
+        path : Full path to the CSV file
+        offset : Byte offset to start reading from (None to read all the data rows)
+        """
+        self.path = path
+
+        with open(path, "rb") as csv_file:
+            self.header = csv_file.readline()
+
+        self.offset = len(self.header) if offset is None else max(offset, len(self.header))
+
+    def read_lines(self):
+        """ Returns the complete lines (as bytes) appended since the last read """
+
+        size = os.stat(self.path).st_size
+        if size < self.offset:
+            # The file has been truncated or replaced, so start again.
+            # Rows that were already loaded are skipped by the data manager (by timestamp).
+            self.offset = len(self.header)
+
+        if size == self.offset:
+            return b""
+
+        with open(self.path, "rb") as csv_file:
+            csv_file.seek(self.offset)
+            data = csv_file.read(size - self.offset)
+
+        # Leave any incomplete final line for next time
+        complete = data.rfind(b"\n") + 1
+        self.offset += complete
+        return data[:complete]
+
+    def read_frame(self):
+        """ Returns a dataframe of the rows appended since the last read (None if there are none).
+        Parsed in the same way as whole files are by the data manager. """
+
+        lines = self.read_lines()
+        if len(lines.strip()) == 0:
+            return None
+
+        return next(read_data_csv(io.BytesIO(self.header + lines)))
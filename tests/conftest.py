@@ -0,0 +1,12 @@
+"""
+conftest.py
+
+@author: James Fowkes
+
+The application modules are in the folder above the tests, so make them importable
+"""
+
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
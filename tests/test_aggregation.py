@@ -0,0 +1,152 @@
+"""
+test_aggregation.py
+
+@author: James Fowkes
+
+Tests of the time bucketed and rolling statistics of aggregation.AggregationIndex,
+of finding gaps and of pairing samples by time
+"""
+
+import numpy as np
+import pandas as pd
+
+from aggregation import AggregationIndex, NS_PER_SECOND, find_gaps, gaps_in_slice, nearest_matches
+
+#pylint: disable=no-member
+
+BUCKET_SECONDS = 600
+WINDOW_SECONDS = 300
+
+def make_series():
+    """ Returns irregular timestamps (with a gap of several empty buckets) and values with an all-NaN bucket """
+    rng = np.random.default_rng(1)
+    seconds = np.concatenate((
+        np.sort(rng.choice(3 * 3600, 400, replace=False)),
+        np.sort(rng.choice(3600, 100, replace=False)) + 5 * 3600))
+    times = np.datetime64("2015-01-01T00:17:00", "ns") + seconds * np.timedelta64(NS_PER_SECOND, "ns")
+    values = 12.0 + rng.normal(size=len(times))
+
+    # Every sample in the first bucket (and some in the second) is NaN
+    values[seconds < BUCKET_SECONDS] = np.nan
+    return (times, values)
+
+def test_buckets_match_pandas_resampling():
+    """ Means and counts agree with pandas, including empty and all-NaN buckets """
+    (times, values) = make_series()
+    result = AggregationIndex(times, values).aggregate(BUCKET_SECONDS)
+    resampled = pd.Series(values, index=pd.DatetimeIndex(times)).resample("%ds" % BUCKET_SECONDS)
+
+    expected_mean = resampled.mean()
+    assert len(result.mean) == len(expected_mean)
+    # There are buckets with no samples, and buckets with only NaN samples
+    assert (resampled.size().values == 0).any()
+    assert ((resampled.size().values > 0) & (resampled.count().values == 0)).any()
+
+    np.testing.assert_allclose(result.mean, expected_mean.values, equal_nan=True)
+    np.testing.assert_array_equal(result.count, resampled.count().values)
+
+    half_bucket = np.timedelta64(BUCKET_SECONDS // 2, "s")
+    np.testing.assert_array_equal(result.timestamps, expected_mean.index.values + half_bucket)
+
+def test_buckets_of_a_time_range():
+    """ Buckets at the ends of a time range only include samples within it """
+    (times, values) = make_series()
+    (start, end) = (times[50], times[300])
+    result = AggregationIndex(times, values).aggregate(BUCKET_SECONDS, start, end)
+
+    selected = (times >= start) & (times <= end)
+    expected = pd.Series(values[selected], index=pd.DatetimeIndex(times[selected])).resample(
+        "%ds" % BUCKET_SECONDS).mean()
+    np.testing.assert_allclose(result.mean, expected.values, equal_nan=True)
+
+def test_buckets_of_no_data():
+    """ No buckets are returned for an empty dataset """
+    result = AggregationIndex(np.zeros(0, dtype="datetime64[ns]"), np.zeros(0)).aggregate(BUCKET_SECONDS)
+    assert len(result.timestamps) == 0
+    assert len(result.mean) == 0
+
+def test_bucket_extremes_and_deviations_match_pandas():
+    """ Minimum, maximum and standard deviation agree with pandas, including empty and all-NaN buckets """
+    (times, values) = make_series()
+    result = AggregationIndex(times, values).aggregate(BUCKET_SECONDS)
+    resampled = pd.Series(values, index=pd.DatetimeIndex(times)).resample("%ds" % BUCKET_SECONDS)
+
+    np.testing.assert_allclose(result.minimum, resampled.min().values, equal_nan=True)
+    np.testing.assert_allclose(result.maximum, resampled.max().values, equal_nan=True)
+    np.testing.assert_allclose(result.std, resampled.std().values, equal_nan=True)
+
+def test_rolling_matches_brute_force_windows():
+    """ Rolling statistics agree with computing each window directly, including windows with no values """
+    (times, values) = make_series()
+    result = AggregationIndex(times, values).rolling(WINDOW_SECONDS)
+
+    nanoseconds = times.view(np.int64)
+    half_width = WINDOW_SECONDS * NS_PER_SECOND // 2
+    for (index, time) in enumerate(nanoseconds):
+        window = values[(nanoseconds >= time - half_width) & (nanoseconds < time + half_width)]
+        window = window[~np.isnan(window)]
+
+        assert result.count[index] == len(window)
+        if len(window) > 0:
+            assert np.isclose(result.mean[index], window.mean())
+        else:
+            assert np.isnan(result.mean[index])
+        if len(window) > 1:
+            assert np.isclose(result.std[index], window.std(ddof=1))
+
+def test_rolling_of_a_time_range():
+    """ Only samples in the range have results, but their windows include samples outside it """
+    (times, values) = make_series()
+    index = AggregationIndex(times, values)
+    result = index.rolling(WINDOW_SECONDS, times[100], times[200])
+
+    np.testing.assert_array_equal(result.timestamps, times[100:201])
+    np.testing.assert_allclose(result.mean, index.rolling(WINDOW_SECONDS).mean[100:201], equal_nan=True)
+
+def test_rolling_of_an_empty_range():
+    """ A range with no samples has no results """
+    (times, values) = make_series()
+    result = AggregationIndex(times, values).rolling(WINDOW_SECONDS, "2016-01-01", "2016-01-02")
+    assert len(result.timestamps) == 0
+    assert len(result.mean) == 0
+
+def test_find_gaps():
+    """ Intervals longer than the threshold are gaps, at the position of the sample before them """
+    times = np.array(["2015-01-01T00:00:00", "2015-01-01T00:00:10", "2015-01-01T00:01:00",
+                      "2015-01-01T00:01:10", "2015-01-01T00:01:20", "2015-01-01T00:05:00"], dtype="datetime64[ns]")
+
+    np.testing.assert_array_equal(find_gaps(times, 10), [1, 4])
+    np.testing.assert_array_equal(find_gaps(times, 50), [4])
+    np.testing.assert_array_equal(find_gaps(times.view(np.int64), 10), [1, 4])
+    assert len(find_gaps(times[:1], 10)) == 0
+
+def test_gaps_in_slice():
+    """ Only gaps with both neighbouring samples in the slice are kept, relative to its start """
+    gaps = np.array([1, 4, 8])
+
+    np.testing.assert_array_equal(gaps_in_slice(gaps, slice(0, 10)), [1, 4, 8])
+    np.testing.assert_array_equal(gaps_in_slice(gaps, slice(2, 9)), [2])
+    np.testing.assert_array_equal(gaps_in_slice(gaps, slice(4, 6)), [0])
+    assert len(gaps_in_slice(gaps, slice(5, 8))) == 0
+
+def test_nearest_matches():
+    """ Each time is paired with the nearest within the tolerance (the earlier of two equally near) """
+    start = np.datetime64("2015-01-01T00:00:00", "ns")
+    times_a = start + np.array([0, 10, 20, 100, 200], dtype="timedelta64[s]")
+    times_b = start + np.array([1, 15, 25, 97], dtype="timedelta64[s]")
+
+    (positions_a, positions_b) = nearest_matches(times_a, times_b, 5)
+
+    # 20 is equally near 15 and 25, so is paired with the earlier. Nothing is within 5 seconds of 200.
+    np.testing.assert_array_equal(positions_a, [0, 1, 2, 3])
+    np.testing.assert_array_equal(positions_b, [0, 1, 1, 3])
+
+def test_nearest_matches_of_no_times():
+    """ Nothing is matched if either series is empty """
+    times = np.array(["2015-01-01T00:00:00"], dtype="datetime64[ns]")
+    empty = np.zeros(0, dtype="datetime64[ns]")
+
+    for (times_a, times_b) in [(times, empty), (empty, times)]:
+        (positions_a, positions_b) = nearest_matches(times_a, times_b, 5)
+        assert len(positions_a) == 0
+        assert len(positions_b) == 0
@@ -0,0 +1,93 @@
+"""
+test_archive.py
+
+@author: James Fowkes
+
+Tests of storing and querying logger data with archive.ArchiveStore
+"""
+
+import sqlite3
+
+import numpy as np
+import pandas as pd
+
+from archive import ArchiveStore
+
+def make_frame(first, count, offset=0.0):
+    """ Returns a dataframe of count rows at 10 second intervals from first, indexed by timestamp """
+    index = pd.DatetimeIndex(pd.Timestamp(first) + pd.to_timedelta(np.arange(count) * 10, unit="s"))
+    return pd.DataFrame(
+        {"Ref": np.arange(count), " Temperature": np.arange(count) + offset, "Humidity": np.full(count, 0.5)},
+        index=index)
+
+def test_query_returns_the_ingested_rows(tmp_path):
+    """ Rows come back sorted by time, with the column names stripped of spaces """
+    archive = ArchiveStore(str(tmp_path / "archive.sqlite"))
+    archive.ingest("/data/Site", "/data/Site", "b.csv", 100, 2.0, make_frame("2015-01-02", 5))
+    archive.ingest("/data/Site", "/data/Site", "a.csv", 100, 1.0, make_frame("2015-01-01", 5))
+
+    frame = archive.query("/data/Site", "/data/Site")
+
+    assert len(frame) == 10
+    assert frame.index.is_monotonic_increasing
+    assert list(frame.columns) == ["Ref", "Temperature", "Humidity"]
+    assert archive.loggers("/data/Site") == ["/data/Site"]
+    archive.close()
+
+def test_query_of_fields_and_time_range(tmp_path):
+    """ Only the requested fields, and rows between start and end (inclusive), are read """
+    archive = ArchiveStore(str(tmp_path / "archive.sqlite"))
+    archive.ingest("/data/Site", "/data/Site", "a.csv", 100, 1.0, make_frame("2015-01-01", 10))
+
+    frame = archive.query("/data/Site", "/data/Site", ["Temperature"], "2015-01-01 00:00:20", "2015-01-01 00:00:50")
+
+    assert list(frame.columns) == ["Temperature"]
+    assert list(frame["Temperature"]) == [2.0, 3.0, 4.0, 5.0]
+    assert archive.query("/data/Site", "/data/Site", start="2016-01-01") is None
+    archive.close()
+
+def test_changed_files_replace_their_rows(tmp_path):
+    """ A file is current until its size or modification time changes, and ingesting it again replaces its rows """
+    archive = ArchiveStore(str(tmp_path / "archive.sqlite"))
+    archive.ingest("/data/Site", "/data/Site", "a.csv", 100, 1.0, make_frame("2015-01-01", 5))
+
+    assert archive.is_current("/data/Site", "a.csv", 100, 1.0)
+    assert not archive.is_current("/data/Site", "a.csv", 120, 1.0)
+    assert not archive.is_current("/data/Site", "a.csv", 100, 2.0)
+    assert not archive.is_current("/data/Site", "b.csv", 100, 1.0)
+
+    archive.ingest("/data/Site", "/data/Site", "a.csv", 120, 2.0, make_frame("2015-01-01", 6, offset=100))
+
+    frame = archive.query("/data/Site", "/data/Site")
+    assert len(frame) == 6
+    assert frame["Temperature"].min() == 100
+    assert archive.is_current("/data/Site", "a.csv", 120, 2.0)
+    archive.close()
+
+def test_folders_with_the_same_names_are_kept_separate(tmp_path):
+    """ Each folder only has its own loggers and rows, even with the same file and logger names as another """
+    archive = ArchiveStore(str(tmp_path / "archive.sqlite"))
+    archive.ingest("/site_a/data", "data", "a.csv", 100, 1.0, make_frame("2015-01-01", 5))
+    archive.ingest("/site_b/data", "data", "a.csv", 200, 1.0, make_frame("2015-01-01", 7, offset=100))
+
+    assert len(archive.query("/site_a/data", "data")) == 5
+    assert len(archive.query("/site_b/data", "data")) == 7
+    assert archive.is_current("/site_a/data", "a.csv", 100, 1.0)
+    assert not archive.is_current("/site_a/data", "a.csv", 200, 1.0)
+    assert archive.loggers("/site_c/data") == []
+    archive.close()
+
+def test_archives_of_earlier_versions_are_rebuilt(tmp_path):
+    """ Tables written by an earlier version are removed """
+    path = str(tmp_path / "archive.sqlite")
+    connection = sqlite3.connect(path)
+    with connection:
+        connection.execute("CREATE TABLE sources (id INTEGER PRIMARY KEY, logger TEXT, filename TEXT)")
+        connection.execute("INSERT INTO sources (logger, filename) VALUES ('data', 'a.csv')")
+    connection.close()
+
+    archive = ArchiveStore(path)
+    assert archive.loggers("/data") == []
+    archive.ingest("/data", "/data", "a.csv", 100, 1.0, make_frame("2015-01-01", 3))
+    assert len(archive.query("/data", "/data")) == 3
+    archive.close()
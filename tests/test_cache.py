@@ -0,0 +1,59 @@
+"""
+test_cache.py
+
+@author: James Fowkes
+
+Tests of the size-limited least-recently-used cache.LRUCache
+"""
+
+from cache import LRUCache
+
+def test_least_recently_used_entries_are_evicted():
+    """ Adding beyond the budget evicts the entries used longest ago """
+    cache = LRUCache(30, len)
+    cache.put("a", "x" * 10)
+    cache.put("b", "x" * 10)
+    cache.put("c", "x" * 10)
+
+    # Using "a" makes "b" the least recently used
+    assert cache.get("a") == "x" * 10
+    cache.put("d", "x" * 10)
+
+    assert "b" not in cache
+    assert ("a" in cache, "c" in cache, "d" in cache) == (True, True, True)
+    assert cache.total_bytes == 30
+    assert cache.get("b") is None
+
+def test_large_values_are_not_cached():
+    """ A value larger than the whole budget is not cached (and does not evict anything) """
+    cache = LRUCache(30, len)
+    cache.put("a", "x" * 10)
+    cache.put("big", "x" * 31)
+
+    assert "big" not in cache
+    assert len(cache) == 1
+
+def test_replacing_a_value():
+    """ Putting a key again replaces its value and size """
+    cache = LRUCache(30, len)
+    cache.put("a", "x" * 10)
+    cache.put("a", "y" * 20)
+
+    assert cache.get("a") == "y" * 20
+    assert cache.total_bytes == 20
+    assert len(cache) == 1
+
+def test_zero_budget_disables_caching():
+    """ Nothing is cached with a budget of 0 (except empty values) """
+    cache = LRUCache(0, len)
+    cache.put("a", "x")
+    assert len(cache) == 0
+
+def test_clear():
+    """ Clearing removes every entry """
+    cache = LRUCache(30, len)
+    cache.put("a", "x" * 10)
+    cache.clear()
+
+    assert len(cache) == 0
+    assert cache.total_bytes == 0
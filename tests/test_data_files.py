@@ -0,0 +1,62 @@
+"""
+test_data_files.py
+
+@author: James Fowkes
+
+Tests of finding data files in folder trees (data_files.find_data_files)
+"""
+
+import configparser
+
+from data_files import find_data_files, has_data_files, scan_options_from_config, DEFAULT_SCAN_OPTIONS
+
+def make_tree(folder):
+    """ Creates a site/year/month tree of data files (and some other files) """
+    for relative_path in ["top.csv", "notes.txt", "2015/01/a.csv", "2015/02/b.csv.gz", "2015/02/c.zip",
+                          "2016/01/d.CSV", "2016/backup/e.csv", "2016/01/readme.md"]:
+        path = folder / relative_path
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_text("")
+
+def scan_options(recursive="1", include="", exclude="", workers="2"):
+    """ Returns ScanOptions from a SCAN section of config.ini """
+    config = configparser.ConfigParser()
+    config.read_dict({"SCAN": {"Recursive": recursive, "Include": include, "Exclude": exclude, "Workers": workers}})
+    return scan_options_from_config(config)
+
+def test_only_the_chosen_folder_is_searched_by_default(tmp_path):
+    """ Subfolders are only searched if the search is recursive """
+    make_tree(tmp_path)
+
+    assert not DEFAULT_SCAN_OPTIONS.recursive
+    assert find_data_files(str(tmp_path)) == ["top.csv"]
+    assert find_data_files(str(tmp_path), scan_options(recursive="0")) == ["top.csv"]
+
+def test_recursive_search(tmp_path):
+    """ Data files in all subfolders are found (with / separators, sorted), and other files are not """
+    make_tree(tmp_path)
+
+    for workers in ["1", "8"]:
+        assert find_data_files(str(tmp_path), scan_options(workers=workers)) == [
+            "2015/01/a.csv", "2015/02/b.csv.gz", "2015/02/c.zip", "2016/01/d.CSV", "2016/backup/e.csv", "top.csv"]
+
+def test_include_and_exclude_patterns(tmp_path):
+    """ Patterns match names or relative paths. Excluded folders are not searched. """
+    make_tree(tmp_path)
+
+    assert find_data_files(str(tmp_path), scan_options(include="2015/*/*")) == [
+        "2015/01/a.csv", "2015/02/b.csv.gz", "2015/02/c.zip"]
+    assert find_data_files(str(tmp_path), scan_options(include="*.csv.gz, *.zip")) == [
+        "2015/02/b.csv.gz", "2015/02/c.zip"]
+    assert find_data_files(str(tmp_path), scan_options(exclude="backup, 2015")) == ["2016/01/d.CSV", "top.csv"]
+    assert find_data_files(str(tmp_path), scan_options(include="*.csv", exclude="top.csv")) == [
+        "2015/01/a.csv", "2016/backup/e.csv"]
+
+def test_has_data_files(tmp_path):
+    """ Subfolders are only checked for data files if the search is recursive """
+    (tmp_path / "2015").mkdir()
+    (tmp_path / "2015" / "a.csv").write_text("")
+
+    assert not has_data_files(str(tmp_path))
+    assert has_data_files(str(tmp_path), scan_options())
+    assert not has_data_files(str(tmp_path), scan_options(exclude="2015"))
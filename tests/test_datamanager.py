@@ -0,0 +1,79 @@
+"""
+test_datamanager.py
+
+@author: James Fowkes
+
+Tests of loading folders of CSV files with datamanager.DataManager
+"""
+
+import configparser
+import gzip
+import queue
+
+import numpy as np
+import pandas as pd
+
+from datamanager import DataManager, get_folder_key
+from messages import CompleteMessage, ErrorMessage
+
+def write_rows(day, count):
+    """ Returns CSV data rows (Ref, Date, Time, Wind Pulses, Temperature) for a day of January 2015 """
+    return "".join("%d,%02d/01/2015,00:00:%02d,%d,%.1f\n" % (row, day, row, row, 20 + row) for row in range(count))
+
+HEADER = "Ref,Date,Time,Wind Pulses,Temperature\n"
+
+def load(folder, fields=None, config=None):
+    """ Loads a folder (on this thread) and returns the data manager, failing if the load failed """
+    msg_queue = queue.Queue()
+    data_manager = DataManager(msg_queue, str(folder), config, (None, None), fields)
+    data_manager.run()
+
+    messages = []
+    while not msg_queue.empty():
+        messages.append(msg_queue.get())
+
+    errors = [msg.exception for msg in messages if isinstance(msg, ErrorMessage)]
+    assert errors == []
+    assert isinstance(messages[-1], CompleteMessage)
+    return data_manager
+
+def test_requested_fields_with_quoted_names_and_byte_order_mark(tmp_path):
+    """ Only the requested fields are loaded, whatever the quoting of the header (or a byte order mark) """
+    (tmp_path / "a.csv").write_bytes(
+        b'\xef\xbb\xbf"Ref","Date","Time","Wind Pulses","Temperature"\n' + write_rows(1, 30).encode())
+    with gzip.open(str(tmp_path / "b.csv.gz"), "wb") as gzip_file:
+        gzip_file.write(b'\xef\xbb\xbfRef,Date,Time,"Wind Pulses",Temperature\n' + write_rows(2, 20).encode())
+
+    data_manager = load(tmp_path, ["Temperature"])
+
+    assert data_manager.get_numeric_display_names() == ["Temperature"]
+    assert data_manager.len("Temperature") == 50
+
+def test_folders_with_the_same_name_share_an_archive(tmp_path):
+    """ Folders with the same name in different places each load only their own data from a shared archive """
+    config = configparser.ConfigParser()
+    config.read_dict({"ARCHIVE": {"Enabled": "1", "Path": str(tmp_path / "archive.sqlite")}})
+
+    (site_a, site_b) = (tmp_path / "a" / "data", tmp_path / "b" / "data")
+    for (folder, rows) in [(site_a, 20), (site_b, 30)]:
+        folder.mkdir(parents=True)
+        (folder / "d01.csv").write_text(HEADER + write_rows(1, rows))
+
+    assert get_folder_key(str(site_a)) != get_folder_key(str(site_b))
+
+    # Twice, so the second loads come from the archive without parsing the files
+    for _ in range(2):
+        assert load(site_a, config=config).len("Temperature") == 20
+        assert load(site_b, config=config).len("Temperature") == 30
+
+def test_averages_not_in_the_index_are_resampled(tmp_path):
+    """ Aggregations other than those of the prefix-sum index (e.g. median) match pandas, for fractional periods """
+    (tmp_path / "d01.csv").write_text(HEADER + write_rows(1, 50))
+    data_manager = load(tmp_path)
+
+    (medians, timestamps) = data_manager.get_dataset_average("Temperature", 2.5, "median")
+
+    expected = pd.Series(data_manager.get_dataset("Temperature"), index=data_manager.get_timestamps("Temperature"))
+    expected = expected.resample(pd.Timedelta(seconds=2.5)).median()
+    np.testing.assert_allclose(medians, expected.values, equal_nan=True)
+    np.testing.assert_array_equal(timestamps, expected.index.values + np.timedelta64(1250, "ms"))
@@ -0,0 +1,75 @@
+"""
+test_export.py
+
+@author: James Fowkes
+
+Tests of writing groups of datasets to files with export.export_groups
+"""
+
+import importlib.util
+import zipfile
+from collections import OrderedDict
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from export import export_groups, ExportError
+
+def make_groups(rows=25):
+    """ Returns two groups of columns (with different time indexes) """
+    times = np.datetime64("2015-01-01T00:00:00", "ns") + np.arange(rows) * np.timedelta64(10, "s")
+    data = OrderedDict([("Temperature", np.arange(rows) * 0.5), ("Humidity", np.full(rows, 0.25))])
+    speed = OrderedDict([("Wind Speed", np.arange(rows // 2, dtype=float))])
+    return [("Data", times, data), ("Wind Speed", times[::2][:rows // 2], speed)]
+
+@pytest.mark.parametrize("compression", [None, "none"])
+def test_npz_holds_every_group(tmp_path, compression):
+    """ Each column is an array named <group>/<column>, written across several chunks """
+    path = str(tmp_path / "export.npz")
+    groups = make_groups()
+    export_groups(path, groups, chunk_rows=7, compression=compression)
+
+    arrays = np.load(path)
+    np.testing.assert_array_equal(arrays["Data/Time"], groups[0][1])
+    np.testing.assert_array_equal(arrays["Data/Temperature"], groups[0][2]["Temperature"])
+    np.testing.assert_array_equal(arrays["Data/Humidity"], groups[0][2]["Humidity"])
+    np.testing.assert_array_equal(arrays["Wind Speed/Wind Speed"], groups[1][2]["Wind Speed"])
+
+    expected_type = zipfile.ZIP_STORED if compression == "none" else zipfile.ZIP_DEFLATED
+    with zipfile.ZipFile(path) as archive:
+        assert all(info.compress_type == expected_type for info in archive.infolist())
+
+def test_empty_groups(tmp_path):
+    """ Groups with no rows are written as empty arrays """
+    path = str(tmp_path / "export.npz")
+    export_groups(path, make_groups(0), chunk_rows=7)
+
+    assert len(np.load(path)["Data/Temperature"]) == 0
+
+def test_unsupported_format(tmp_path):
+    """ Unknown file extensions raise ExportError """
+    with pytest.raises(ExportError):
+        export_groups(str(tmp_path / "export.xlsx"), make_groups())
+
+@pytest.mark.parametrize("extension,package", [(".parquet", "pyarrow"), (".feather", "pyarrow"), (".h5", "tables")])
+def test_formats_needing_packages(tmp_path, extension, package):
+    """ Formats needing an optional package raise ExportError without it. With it, each group is readable. """
+    path = str(tmp_path / ("export" + extension))
+    groups = make_groups()
+
+    if importlib.util.find_spec(package) is None:
+        with pytest.raises(ExportError):
+            export_groups(path, groups, chunk_rows=7)
+        return
+
+    export_groups(path, groups, chunk_rows=7)
+
+    if extension == ".parquet":
+        frame = pd.read_parquet(path)
+    elif extension == ".feather":
+        frame = pd.read_feather(path)
+    else:
+        frame = pd.read_hdf(path, "/Data").reset_index()
+    np.testing.assert_array_equal(frame["Temperature"].values, groups[0][2]["Temperature"])
+    assert len(frame) == len(groups[0][1])
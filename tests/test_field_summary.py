@@ -0,0 +1,50 @@
+"""
+test_field_summary.py
+
+@author: James Fowkes
+
+Tests of the summary statistics of field_summary.summarise_block
+"""
+
+import warnings
+
+import numpy as np
+
+from field_summary import summarise_block, percentile_name, DEFAULT_PERCENTILES
+
+PERCENTILES = DEFAULT_PERCENTILES + (0, 99.9, 100)
+
+def make_block():
+    """ Returns rows of values with different numbers of NaN (including a row of only NaN) """
+    rng = np.random.default_rng(2)
+    values = rng.normal(size=(5, 101)) * 10
+    values[1, ::3] = np.nan
+    values[2, 1:] = np.nan
+    values[3, :] = np.nan
+    values[4, :50] = np.nan
+    return values
+
+def test_statistics_match_numpy():
+    """ Percentiles agree with numpy.nanpercentile, and the other statistics with their numpy equivalents """
+    values = make_block()
+    summary = summarise_block(values, PERCENTILES)
+
+    with warnings.catch_warnings():
+        # numpy warns about the row with no values
+        warnings.simplefilter("ignore", RuntimeWarning)
+        for percentile in PERCENTILES:
+            np.testing.assert_allclose(
+                summary[percentile_name(percentile)], np.nanpercentile(values, percentile, axis=1), equal_nan=True)
+
+        np.testing.assert_array_equal(summary["count"], np.count_nonzero(~np.isnan(values), axis=1))
+        np.testing.assert_allclose(summary["min"], np.nanmin(values, axis=1), equal_nan=True)
+        np.testing.assert_allclose(summary["max"], np.nanmax(values, axis=1), equal_nan=True)
+        np.testing.assert_allclose(summary["mean"], np.nanmean(values, axis=1), equal_nan=True)
+
+def test_no_samples():
+    """ Statistics of rows with no samples are NaN """
+    summary = summarise_block(np.zeros((2, 0)))
+
+    np.testing.assert_array_equal(summary["count"], [0, 0])
+    for statistic in ["min", "max", "mean", percentile_name(50)]:
+        assert np.isnan(summary[statistic]).all()
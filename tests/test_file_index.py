@@ -0,0 +1,86 @@
+"""
+test_file_index.py
+
+@author: James Fowkes
+
+Tests of the folder manifest of the time span of each CSV file (file_index.FolderManifest)
+"""
+
+import gzip
+import json
+import os
+
+import numpy as np
+
+from file_index import FolderManifest, MANIFEST_FILENAME
+
+HEADER = "Ref,Date,Time,Temperature\n"
+
+def write_day(folder, filename, day, rows=10):
+    """ Writes a CSV file with rows at 10 second intervals from midnight on a day of January 2015 """
+    lines = "".join("%d,%02d/01/2015,00:%02d:%02d,1.5\n" % (row, day, row // 6, row % 6 * 10) for row in range(rows))
+    data = (HEADER + lines).encode()
+    if filename.endswith(".gz"):
+        with gzip.open(os.path.join(str(folder), filename), "wb") as gzip_file:
+            gzip_file.write(data)
+    else:
+        with open(os.path.join(str(folder), filename), "wb") as csv_file:
+            csv_file.write(data)
+
+def ns(timestamp):
+    """ Returns a timestamp as int64 nanoseconds """
+    return int(np.datetime64(timestamp, "ns").astype(np.int64))
+
+def test_spans_of_plain_files(tmp_path):
+    """ The first and last timestamps and the row count of each file are read from its head and tail """
+    write_day(tmp_path, "a.csv", 1, rows=12)
+    manifest = FolderManifest(str(tmp_path), ["a.csv"])
+
+    summary = manifest.summaries["a.csv"]
+    assert (summary.first, summary.last, summary.rows) == (ns("2015-01-01T00:00:00"), ns("2015-01-01T00:01:50"), 12)
+    assert manifest.is_known("a.csv")
+    assert manifest.total_rows() == 12
+
+def test_files_in_range_and_newest_first(tmp_path):
+    """ Only files overlapping the range are selected. Compressed files have unknown spans, so always are. """
+    for day in [1, 2, 3]:
+        write_day(tmp_path, "d%d.csv" % day, day)
+    write_day(tmp_path, "old.csv.gz", 5)
+    filenames = ["d1.csv", "d2.csv", "d3.csv", "old.csv.gz"]
+
+    manifest = FolderManifest(str(tmp_path), filenames)
+
+    assert not manifest.is_known("old.csv.gz")
+    assert manifest.filenames_in_range("2015-01-02", "2015-01-02T12:00") == ["d2.csv", "old.csv.gz"]
+    assert manifest.filenames_in_range(start="2015-01-03") == ["d3.csv", "old.csv.gz"]
+    assert manifest.newest_first(filenames) == ["d3.csv", "d2.csv", "d1.csv", "old.csv.gz"]
+    assert manifest.time_span() == (ns("2015-01-01T00:00:00"), ns("2015-01-03T00:01:30"))
+
+def test_recorded_spans_are_saved(tmp_path):
+    """ Spans recorded from parsed files are kept in the manifest file, until the file changes """
+    write_day(tmp_path, "a.csv.gz", 5)
+    manifest = FolderManifest(str(tmp_path), ["a.csv.gz"])
+    manifest.record("a.csv.gz", np.datetime64("2015-01-05T00:00"), np.datetime64("2015-01-05T00:01:30"), 10)
+    manifest.save()
+
+    manifest = FolderManifest(str(tmp_path), ["a.csv.gz"])
+    assert manifest.is_known("a.csv.gz")
+    assert manifest.filenames_in_range(end="2015-01-04") == []
+
+    # A changed file is summarised again
+    write_day(tmp_path, "a.csv.gz", 6, rows=20)
+    manifest = FolderManifest(str(tmp_path), ["a.csv.gz"])
+    assert not manifest.is_known("a.csv.gz")
+
+def test_manifest_is_only_written_when_it_changes(tmp_path):
+    """ Summaries are cached in the folder, and files that have not changed are not summarised again """
+    write_day(tmp_path, "a.csv", 1)
+    FolderManifest(str(tmp_path), ["a.csv"])
+
+    manifest_path = tmp_path / MANIFEST_FILENAME
+    with open(str(manifest_path)) as manifest_file:
+        assert [entry[0] for entry in json.load(manifest_file)] == ["a.csv"]
+
+    os.utime(str(manifest_path), (0, 0))
+    FolderManifest(str(tmp_path), ["a.csv"])
+    assert os.stat(str(manifest_path)).st_mtime == 0
@@ -0,0 +1,91 @@
+"""
+test_jobs.py
+
+@author: James Fowkes
+
+Tests of running computations on worker threads with jobs.JobExecutor
+"""
+
+import threading
+import time
+
+from jobs import JobExecutor
+
+class FakeGUI:
+
+    """ Records busy windows, and runs scheduled callbacks when asked (as the Tk loop would) """
+
+    def __init__(self):
+        self.scheduled = []
+        self.busy = {}
+
+    def schedule(self, _, callback):
+        """ Queues a callback """
+        self.scheduled.append(callback)
+        return callback
+
+    def set_busy(self, window, busy):
+        """ Records whether a window is busy """
+        self.busy[window] = busy
+
+    def run_until_idle(self, timeout=5.0):
+        """ Runs scheduled callbacks until none are left """
+        deadline = time.time() + timeout
+        while len(self.scheduled) > 0:
+            assert time.time() < deadline
+            self.scheduled.pop(0)()
+            time.sleep(0.001)
+
+def test_results_are_handled_on_the_gui_thread():
+    """ on_result is called by the GUI's scheduled polling, and the window is busy until then """
+    gui = FakeGUI()
+    jobs = JobExecutor(gui)
+    results = []
+
+    jobs.submit("plot", "Main", lambda: 6 * 7, lambda result: results.append((result, threading.current_thread())))
+    assert gui.busy == {"Main": True}
+
+    gui.run_until_idle()
+    assert results == [(42, threading.current_thread())]
+    assert gui.busy == {"Main": False}
+    jobs.shutdown()
+
+def test_newer_jobs_supersede_older_ones():
+    """ Only the result of the latest job for a view is handled """
+    gui = FakeGUI()
+    jobs = JobExecutor(gui)
+    (started, release) = (threading.Event(), threading.Event())
+    results = []
+
+    def slow():
+        """ Waits until released """
+        started.set()
+        release.wait(5)
+        return "old"
+
+    jobs.submit("plot", None, slow, results.append)
+    started.wait(5)
+    jobs.submit("plot", None, lambda: "new", results.append)
+    jobs.submit("other", None, lambda: "other", results.append)
+    release.set()
+
+    gui.run_until_idle()
+    assert sorted(results) == ["new", "other"]
+    jobs.shutdown()
+
+def test_errors_and_discarded_jobs():
+    """ Exceptions go to on_error, and results of discarded jobs are dropped """
+    gui = FakeGUI()
+    jobs = JobExecutor(gui)
+    (results, errors) = ([], [])
+
+    jobs.submit("a", None, lambda: 1 / 0, results.append, errors.append)
+    release = threading.Event()
+    jobs.submit("b", None, lambda: release.wait(5), results.append)
+    jobs.discard("b")
+    release.set()
+
+    gui.run_until_idle()
+    assert results == []
+    assert [type(error) for error in errors] == [ZeroDivisionError]
+    jobs.shutdown()
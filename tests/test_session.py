@@ -0,0 +1,92 @@
+"""
+test_session.py
+
+@author: James Fowkes
+
+Tests of comparing sites with session.Session
+"""
+
+import numpy as np
+import pytest
+
+from session import Session
+from test_datamanager import HEADER, load, write_rows
+
+def load_site(folder, header, rows):
+    """ Writes a day of data to a site folder and returns its data manager """
+    folder.mkdir()
+    (folder / "d01.csv").write_text(header + rows)
+    return load(folder)
+
+@pytest.fixture(name="sites")
+def fixture_sites(tmp_path):
+    """ Returns (roof, field) data managers. Only the roof site has wind data. """
+    roof = load_site(tmp_path / "Roof", HEADER, write_rows(1, 20))
+    field = load_site(
+        tmp_path / "Field", "Ref,Date,Time,Temperature\n",
+        "".join("%d,01/01/2015,00:00:%02d,%.1f\n" % (row, row, 5 + row) for row in range(10)))
+    return (roof, field)
+
+def test_unique_site_names():
+    """ Sites are named after their folders, numbered if the name is already used """
+    session = Session()
+    assert session.unique_site_name("/data/Roof/") == "Roof"
+
+    session.set_site("Roof", None)
+    assert session.unique_site_name("/other/Roof") == "Roof (2)"
+    assert session.unique_site_name("/other/Roof", reserved=["Roof (2)"]) == "Roof (3)"
+    assert session.unique_site_name("/data/All sites") == "All sites (2)"
+
+def test_one_site_uses_data_manager_names(sites):
+    """ With one site, datasets have the data manager's display names """
+    (roof, field) = sites
+    session = Session()
+    session.set_site("Roof", roof)
+
+    assert session.sites() == ["Roof"]
+    assert session.is_loaded(roof)
+    assert not session.is_loaded(field)
+    assert session.get_numeric_display_names() == ["Wind Speed", "Temperature"]
+    np.testing.assert_array_equal(session.get_dataset("Temperature"), roof.get_dataset("Temperature"))
+
+def test_sites_are_prefixed_and_shared_channels_overlaid(sites):
+    """ With more than one site, names are prefixed with the site, and channels both sites have are overlaid """
+    (roof, field) = sites
+    session = Session()
+    session.set_site("Roof", roof)
+    session.set_site("Field", field)
+
+    assert session.sites() == ["Roof", "Field"]
+    assert session.get_numeric_display_names() == [
+        "Roof: Wind Speed", "Roof: Temperature", "Field: Temperature", "All sites: Temperature"]
+
+    np.testing.assert_array_equal(session.get_dataset("Field: Temperature"), field.get_dataset("Temperature"))
+    np.testing.assert_array_equal(session.get_dataset("Roof: Temperature"), roof.get_dataset("Temperature"))
+
+    # Names from before the second site was added refer to the first site
+    assert session.qualified_name("Temperature") == "Roof: Temperature"
+    assert session.qualified_name("All sites: Temperature") == "All sites: Temperature"
+
+    assert session.is_overlay("All sites: Temperature")
+    assert session.members("All sites: Temperature") == [
+        ("Roof", "Roof: Temperature"), ("Field", "Field: Temperature")]
+    assert session.members("All sites: Wind Speed") == [("Roof", "Roof: Wind Speed")]
+    with pytest.raises(KeyError):
+        session.get_dataset("All sites: Temperature")
+
+def test_export_groups_are_prefixed_with_sites(sites, tmp_path):
+    """ Each site's groups of datasets are exported under the site's name """
+    (roof, field) = sites
+    session = Session()
+    session.set_site("Roof", roof)
+    session.set_site("Field", field)
+
+    path = str(tmp_path / "sites.npz")
+    session.export(path)
+
+    with np.load(path) as archive:
+        assert sorted(archive.files) == sorted([
+            "Roof/Data/Time", "Roof/Data/Temperature", "Roof/Wind Speed/Time", "Roof/Wind Speed/Wind Speed",
+            "Field/Data/Time", "Field/Data/Temperature"])
+        np.testing.assert_array_equal(archive["Field/Data/Temperature"], field.get_dataset("Temperature"))
+        np.testing.assert_array_equal(archive["Roof/Data/Time"], roof.get_timestamps("Temperature"))
@@ -0,0 +1,79 @@
+"""
+test_tail.py
+
+@author: James Fowkes
+
+Tests of reading the lines appended to a CSV file with tail.TailReader
+"""
+
+import pandas as pd
+
+from tail import TailReader
+
+HEADER = b"Index,Date,Time,Temperature\n"
+
+def test_partial_last_line_is_left_for_the_next_read(tmp_path):
+    """ A line the logger is part way through writing is only read once it is complete """
+    path = tmp_path / "data.csv"
+    path.write_bytes(HEADER + b"1,01/01/2015,00:00:00,1.5\n2,01/01/2015,00:00:10,2")
+
+    reader = TailReader(str(path))
+    assert reader.read_lines() == b"1,01/01/2015,00:00:00,1.5\n"
+
+    # Nothing new is complete yet
+    assert reader.read_lines() == b""
+
+    with open(str(path), "ab") as csv_file:
+        csv_file.write(b".5\n3,01/01/2015,00:00:20,3")
+    assert reader.read_lines() == b"2,01/01/2015,00:00:10,2.5\n"
+
+    with open(str(path), "ab") as csv_file:
+        csv_file.write(b".5\n")
+    assert reader.read_lines() == b"3,01/01/2015,00:00:20,3.5\n"
+    assert reader.read_lines() == b""
+
+def test_only_a_partial_line(tmp_path):
+    """ Nothing is read (and the offset does not move) while the only new line is incomplete """
+    path = tmp_path / "data.csv"
+    path.write_bytes(HEADER + b"1,01/01/2015,00:00")
+
+    reader = TailReader(str(path))
+    assert reader.read_lines() == b""
+    assert reader.offset == len(HEADER)
+    assert reader.read_frame() is None
+
+def test_start_offset(tmp_path):
+    """ Reading starts from a given offset (but never within the header) """
+    first_line = b"1,01/01/2015,00:00:00,1.5\n"
+    path = tmp_path / "data.csv"
+    path.write_bytes(HEADER + first_line + b"2,01/01/2015,00:00:10,2.5\n")
+
+    assert TailReader(str(path), len(HEADER) + len(first_line)).read_lines() == b"2,01/01/2015,00:00:10,2.5\n"
+    assert TailReader(str(path), 0).read_lines() == first_line + b"2,01/01/2015,00:00:10,2.5\n"
+
+def test_truncated_file_is_read_again(tmp_path):
+    """ If the file gets shorter (e.g. it was replaced), reading starts again after the header """
+    path = tmp_path / "data.csv"
+    path.write_bytes(HEADER + b"1,01/01/2015,00:00:00,1.5\n2,01/01/2015,00:00:10,2.5\n")
+
+    reader = TailReader(str(path))
+    reader.read_lines()
+
+    path.write_bytes(HEADER + b"3,02/01/2015,00:00:00,3.5\n")
+    assert reader.read_lines() == b"3,02/01/2015,00:00:00,3.5\n"
+
+def test_frame_of_new_rows(tmp_path):
+    """ New rows are parsed like whole files: indexed by the day first date and time """
+    path = tmp_path / "data.csv"
+    path.write_bytes(HEADER + b"1,02/01/2015,00:00:00,1.5\n")
+
+    reader = TailReader(str(path))
+    reader.read_lines()
+
+    with open(str(path), "ab") as csv_file:
+        csv_file.write(b"2,02/01/2015,00:00:10,2.5\n3,02/01/2015,00:00:20,3.5\n4,02/01")
+
+    frame = reader.read_frame()
+    assert list(frame.index) == [pd.Timestamp("2015-01-02 00:00:10"), pd.Timestamp("2015-01-02 00:00:20")]
+    assert list(frame.columns) == ["Index", "Temperature"]
+    assert list(frame["Temperature"]) == [2.5, 3.5]
@@ -91,6 +91,27 @@ class TkEntryHelper(Tk.Entry):
         self.var = Tk.StringVar(master)
         Tk.Entry.__init__(self, master, textvariable=self.var, **kwargs)
 
+#pylint: disable=too-few-public-methods
+#pylint: disable=too-many-ancestors
+class TkCheckbuttonHelper(Tk.Checkbutton):
+    """
+    A small class to abstract away the attachment of a Tk.IntVar to a checkbutton
+
+    pylint too-many-ancestors check is disabled for this class, since nothing
+    can be done about the Tk inheritance tree.
+
+    pylint too-few-public-methods check is disabled for this class. This is meant to be
+    a small helper class.
+    """
+    def __init__(self, master, **kwargs):
+        """
+        Args:
+        master: The tkinter master that will be the parent container of the control
+        kwargs: Any additional keyword arguments
+        """
+        self.var = Tk.IntVar(master)
+        Tk.Checkbutton.__init__(self, master, variable=self.var, **kwargs)
+
 #pylint: disable=too-few-public-methods
 #pylint: disable=too-many-ancestors
 #pylint: disable=star-args
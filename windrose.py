@@ -32,12 +32,23 @@ import matplotlib.cm as cm
 import numpy as np
 from matplotlib.patches import Rectangle
 from matplotlib.projections.polar import PolarAxes
-from numpy.lib.twodim_base import histogram2d
-from pylab import poly_between
+from numpy import histogram2d
 
 RESOLUTION = 100
 ZBASE = -1000 #The starting zorder for all drawing, negative to have the grid on
 
+def _poly_between(x, ylower, yupper):
+    '''
+    Returns the (x, y) vertices of the polygon between two curves with the same x values.
+    ylower and yupper can be arrays or scalars.
+    (Replaces pylab.poly_between, so that pylab and pyplot do not need to be imported)
+
+    '''
+    x = np.asarray(x)
+    ylower = np.broadcast_to(ylower, x.shape)
+    yupper = np.broadcast_to(yupper, x.shape)
+    return np.concatenate((x, x[::-1])), np.concatenate((yupper, ylower[::-1]))
+
 def _colors(cmap, num):
     '''
     Returns a list of n colors based on the colormap cmap
@@ -222,8 +233,10 @@ class WindroseAxes(PolarAxes):
         normed = kwargs.pop('normed', False)
         blowto = kwargs.pop('blowto', False)
 
-        #Set the global information dictionary
-        information_dict = histogram(direction, var, bins, nsector, normed, blowto)
+        #Set the global information dictionary (unless already computed by calling histogram())
+        information_dict = kwargs.pop('histogram', None)
+        if information_dict is None:
+            information_dict = histogram(direction, var, bins, nsector, normed, blowto)
         self._info['direction'], self._info['bins'], self._info['table'] = information_dict
 
         return bins, nbins, nsector, colors, angles, kwargs
@@ -336,7 +349,7 @@ class WindroseAxes(PolarAxes):
             val = vals[i, :] + offset
             offset += vals[i, :]
             zorder = ZBASE + nbins - i
-            xlocs, ylocs = poly_between(angles, 0, val)
+            xlocs, ylocs = _poly_between(angles, 0, val)
             patch = self.fill(xlocs, ylocs, facecolor=colors[i],
                               edgecolor=colors[i], zorder=zorder, **kwargs)
             self.patches_list.extend(patch)
@@ -370,6 +383,8 @@ class WindroseAxes(PolarAxes):
         Default : no edgecolor
         * opening : float - between 0.0 and 1.0, to control the space between
         each sector (1.0 for no space)
+        * histogram : tuple - the result of histogram() for the same bins and
+        nsector, if it has already been computed (direction and var are then unused)
         """
 
         # This function does have a lot of local variables and is a candidate for refactoring.
@@ -486,7 +501,7 @@ def histogram(direction, var, bins, nsector, normed=False, blowto=False): #pylin
 
     angle = 360./nsector
 
-    dir_bins = np.arange(-angle/2, 360.+angle, angle, dtype=np.float)
+    dir_bins = np.arange(-angle/2, 360.+angle, angle, dtype=float)
     dir_edges = dir_bins.tolist()
     dir_edges.pop(-1)
     dir_edges[0] = dir_edges.pop(-1)
@@ -499,7 +514,7 @@ def histogram(direction, var, bins, nsector, normed=False, blowto=False): #pylin
         direction = direction + 180.
         direction[direction >= 360.] = direction[direction >= 360.] - 360
 
-    table = histogram2d(x=var, y=direction, bins=[var_bins, dir_bins], normed=False)[0]
+    table = histogram2d(x=var, y=direction, bins=[var_bins, dir_bins], density=False)[0]
     # add the last value to the first to have the table of North winds
     table[:, 0] = table[:, 0] + table[:, -1]
     # and remove the last col